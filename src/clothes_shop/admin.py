@@ -1,3 +1,291 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import (
+    ArchivedOrder,
+    ArchivedPayment,
+    Brand,
+    CartItem,
+    ChangeEvent,
+    Clothes,
+    ClothesType,
+    Favorite,
+    IdempotencyKey,
+    Order,
+    OrderItem,
+    Payment,
+    Product,
+    ProductCooccurrence,
+    ProductPrice,
+    Rating,
+    RevokedToken,
+    SalesRollup,
+    SalesRollupOrder,
+    Shipping,
+    Size,
+    StockReservation,
+    Target,
+    Task,
+    User,
+    Watermark,
+    WishList,
+)
+from .pagination import CountedPaginator
+
+
+class EstimatedCountPaginator(CountedPaginator):
+    """
+    Changelist paginator counting with counts.count_rows: the table statistics
+    for an unfiltered changelist of a large table, and at most
+    COUNT_ESTIMATE_THRESHOLD + 1 rows for a filtered or searched one.
+    """
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Defaults for tables that grow to millions of rows: estimated or capped
+    counts, no second COUNT(*) of the whole table for filtered pages, and
+    newest rows first by primary key.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ("-id",)
+    list_per_page = 50
+
+
+# 件数の少ないマスタ (他の管理画面のオートコンプリートから参照される)
+
+
+@admin.register(Clothes)
+class ClothesAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "price")
+    search_fields = ("name",)
+
+
+@admin.register(Size)
+class SizeAdmin(admin.ModelAdmin):
+    list_display = ("id", "size_name")
+    search_fields = ("size_name",)
+
+
+@admin.register(Target)
+class TargetAdmin(admin.ModelAdmin):
+    list_display = ("id", "target_type")
+    search_fields = ("target_type",)
+
+
+@admin.register(ClothesType)
+class ClothesTypeAdmin(admin.ModelAdmin):
+    list_display = ("id", "clothes_type_name")
+    search_fields = ("clothes_type_name",)
+
+
+@admin.register(Brand)
+class BrandAdmin(admin.ModelAdmin):
+    list_display = ("id", "brand_name")
+    search_fields = ("brand_name",)
+
+
+# 大きなテーブル。検索は先頭一致(^)か完全一致(=)にしてインデックスを使わせる
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableAdmin):
+    list_display = (
+        "id",
+        "title",
+        "brand",
+        "clothes_type",
+        "price",
+        "stock_quantity",
+        "reserved_quantity",
+        "is_deleted",
+    )
+    list_select_related = ("brand", "clothes_type")
+    list_filter = ("is_deleted", "brand", "clothes_type")
+    search_fields = ("=id", "^title")
+    autocomplete_fields = ("size", "target", "clothes_type", "brand")
+    readonly_fields = ("reserved_quantity", "created_at", "updated_at")
+
+
+@admin.register(ProductPrice)
+class ProductPriceAdmin(LargeTableAdmin):
+    list_display = ("id", "product", "price", "valid_from")
+    list_select_related = ("product",)
+    search_fields = ("=product__id",)
+    autocomplete_fields = ("product",)
+
+
+@admin.register(User)
+class UserAdmin(LargeTableAdmin):
+    list_display = ("id", "user_name", "email_address", "role", "is_deleted")
+    list_filter = ("role", "is_deleted")
+    search_fields = ("=id", "^user_name", "=email_address")
+    readonly_fields = ("created_at", "updated_at")
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    autocomplete_fields = ("product",)
+
+
+class PaymentInline(admin.TabularInline):
+    model = Payment
+    extra = 0
+
+
+class ShippingInline(admin.TabularInline):
+    model = Shipping
+    extra = 0
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "order_date", "order_status", "total_price")
+    list_select_related = ("user",)
+    list_filter = ("order_status",)
+    search_fields = ("=id", "=user__id")
+    autocomplete_fields = ("user",)
+    inlines = (OrderItemInline, PaymentInline, ShippingInline)
+
+    # 状態の変更は支払い・配送の作成やイベントを伴うので、
+    # 遷移のチェックを通る /api/orders/transition/ (orders.transition_orders) で行う
+    readonly_fields = ("order_status",)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.order_status = Order.STATUS_PENDING
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ("id", "order", "product", "quantity", "unit_price")
+    list_select_related = ("order", "product")
+    search_fields = ("=order__id", "=product__id")
+    autocomplete_fields = ("order", "product")
+
+
+@admin.register(Payment)
+class PaymentAdmin(LargeTableAdmin):
+    list_display = ("id", "order", "payment_date", "payment_option", "payment_status")
+    list_filter = ("payment_status", "payment_option")
+    list_select_related = ("order",)
+    search_fields = ("=order__id", "=stripe_charge_id")
+    autocomplete_fields = ("order",)
+
+
+@admin.register(Shipping)
+class ShippingAdmin(LargeTableAdmin):
+    list_display = ("id", "order", "shipping_tracking_number", "shipping_date")
+    list_select_related = ("order",)
+    search_fields = ("=order__id", "=shipping_tracking_number")
+    autocomplete_fields = ("order",)
+
+
+@admin.register(Rating)
+class RatingAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "product", "rating", "created_at")
+    list_select_related = ("user", "product")
+    list_filter = ("rating",)
+    search_fields = ("=product__id", "=user__id")
+    autocomplete_fields = ("user", "product")
+
+
+@admin.register(Favorite, WishList, CartItem, StockReservation)
+class UserProductAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "product", "created_at")
+    list_select_related = ("user", "product")
+    search_fields = ("=user__id", "=product__id")
+    autocomplete_fields = ("user", "product")
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(LargeTableAdmin):
+    list_display = ("id", "user_id", "order_date", "order_status", "total_price", "archived_at")
+    search_fields = ("=id", "=user_id")
+
+    def has_add_permission(self, request):
+        # アーカイブはarchive_ordersコマンドだけが書き込む
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedPayment)
+class ArchivedPaymentAdmin(LargeTableAdmin):
+    list_display = ("id", "order_id")
+    search_fields = ("=id", "=order_id")
+
+    def has_add_permission(self, request):
+        # archive_ordersコマンドだけが書き込む
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ProductCooccurrence)
+class ProductCooccurrenceAdmin(LargeTableAdmin):
+    list_display = ("id", "product_a", "product_b", "count")
+    list_select_related = ("product_a", "product_b")
+    search_fields = ("=product_a__id",)
+    autocomplete_fields = ("product_a", "product_b")
+
+
+@admin.register(SalesRollup)
+class SalesRollupAdmin(LargeTableAdmin):
+    list_display = ("date", "brand", "clothes_type", "units", "revenue")
+    list_select_related = ("brand", "clothes_type")
+    list_filter = ("brand", "clothes_type")
+    ordering = ("-date", "-id")
+
+
+@admin.register(SalesRollupOrder)
+class SalesRollupOrderAdmin(LargeTableAdmin):
+    list_display = ("order",)
+    search_fields = ("=order__id",)
+    ordering = ("-order",)
+
+    def has_add_permission(self, request):
+        # refresh_sales_rollupsだけが書き込む
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Task)
+class TaskAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "status", "run_at", "attempts", "locked_by")
+    list_filter = ("status",)
+    search_fields = ("=id",)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(LargeTableAdmin):
+    list_display = ("id", "scope", "key", "status", "response_status", "expires_at")
+    list_filter = ("status",)
+    search_fields = ("=key", "^scope")
+
+
+@admin.register(ChangeEvent)
+class ChangeEventAdmin(LargeTableAdmin):
+    list_display = ("id", "event", "topics", "created_at")
+    list_filter = ("event",)
+    search_fields = ("=id",)
+
+
+@admin.register(Watermark)
+class WatermarkAdmin(admin.ModelAdmin):
+    list_display = ("name", "last_id", "last_timestamp", "updated_at")
+
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    # 署名の期限までしか残らない小さなテーブル
+    list_display = ("id", "token_id", "user_id", "revoked_at", "expires_at")
+    search_fields = ("=token_id", "=user_id")
+    ordering = ("-id",)
@@ -0,0 +1,156 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderItem, SalesRollup, SalesRollupOrder, Watermark
+
+WATERMARK_NAME = "sales_rollups"
+# 直近の注文は明細の登録が終わっていない可能性があるため少し遅らせて取り込む
+ORDER_LAG = timedelta(minutes=5)
+UPSERT_BATCH_SIZE = 2000
+
+DIMENSIONS = {
+    "date": "date",
+    "brand": "brand_id",
+    "clothes_type": "clothes_type_id",
+}
+
+
+def _rollup_rows(order_ids):
+    revenue = ExpressionWrapper(
+        F("quantity") * F("unit_price"), output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+    return (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .annotate(date=TruncDate("order__created_at"))
+        .values("date", "product__brand_id", "product__clothes_type_id")
+        .annotate(units=Sum("quantity"), revenue=Sum(revenue))
+        .order_by()
+    )
+
+
+def _add_to_rollups(rows, sign=1):
+    keys = {
+        (row["date"], row["product__brand_id"], row["product__clothes_type_id"]): row
+        for row in rows
+    }
+    if not keys:
+        return
+    existing = {}
+    dates = {date for date, _, _ in keys}
+    for rollup in SalesRollup.objects.filter(date__in=dates):
+        existing[(rollup.date, rollup.brand_id, rollup.clothes_type_id)] = rollup
+
+    objs = []
+    for key, row in keys.items():
+        current = existing.get(key)
+        objs.append(
+            SalesRollup(
+                date=key[0],
+                brand_id=key[1],
+                clothes_type_id=key[2],
+                units=(current.units if current else 0) + sign * row["units"],
+                revenue=(current.revenue if current else 0) + sign * row["revenue"],
+            )
+        )
+    unique_fields = None
+    if connection.features.supports_update_conflicts_with_target:
+        unique_fields = ["date", "brand", "clothes_type"]
+    SalesRollup.objects.bulk_create(
+        objs,
+        batch_size=UPSERT_BATCH_SIZE,
+        update_conflicts=True,
+        update_fields=["units", "revenue"],
+        unique_fields=unique_fields,
+    )
+
+
+def refresh_sales_rollups(batch_size=5000):
+    """
+    Bring SalesRollup up to date with the orders changed since the last run,
+    walking Order by (updated_at, id). Returns the number of orders read.
+
+    Only orders in Order.REVENUE_STATUSES count as sales: an order is added
+    when it reaches one of them and subtracted again when it leaves (e.g. a
+    paid order being cancelled). SalesRollupOrder records which orders are
+    currently added. Edits to the items of an order already added are
+    only picked up by a rebuild.
+    """
+    read = 0
+    cutoff = timezone.now() - ORDER_LAG
+    while True:
+        with transaction.atomic():
+            watermark, _ = Watermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+            orders = Order.objects.filter(updated_at__lt=cutoff)
+            if watermark.last_timestamp is not None:
+                orders = orders.filter(
+                    Q(updated_at__gt=watermark.last_timestamp)
+                    | Q(updated_at=watermark.last_timestamp, id__gt=watermark.last_id)
+                )
+            batch = list(
+                orders.order_by("updated_at", "id").values_list("id", "updated_at", "order_status")[
+                    :batch_size
+                ]
+            )
+            if not batch:
+                return read
+            counted = set(
+                SalesRollupOrder.objects.filter(
+                    order_id__in=[order_id for order_id, _, _ in batch]
+                ).values_list("order_id", flat=True)
+            )
+            added, removed = [], []
+            for order_id, _, order_status in batch:
+                revenue = order_status in Order.REVENUE_STATUSES
+                if revenue and order_id not in counted:
+                    added.append(order_id)
+                elif not revenue and order_id in counted:
+                    removed.append(order_id)
+            if added:
+                _add_to_rollups(_rollup_rows(added))
+                SalesRollupOrder.objects.bulk_create(
+                    [SalesRollupOrder(order_id=order_id) for order_id in added],
+                    batch_size=UPSERT_BATCH_SIZE,
+                )
+            if removed:
+                _add_to_rollups(_rollup_rows(removed), sign=-1)
+                SalesRollupOrder.objects.filter(order_id__in=removed).delete()
+            watermark.last_id, watermark.last_timestamp = batch[-1][:2]
+            watermark.save(update_fields=["last_id", "last_timestamp", "updated_at"])
+            read += len(batch)
+
+
+def reset_sales_rollups():
+    with transaction.atomic():
+        SalesRollup.objects.all().delete()
+        SalesRollupOrder.objects.all().delete()
+        Watermark.objects.filter(name=WATERMARK_NAME).delete()
+
+
+def sales_summary(group_by, start=None, end=None, brand=None, clothes_type=None):
+    """
+    Sum units and revenue from SalesRollup by one of DIMENSIONS, optionally
+    limited to a date range (inclusive) and a brand or clothes type.
+    """
+    column = DIMENSIONS[group_by]
+    rollups = SalesRollup.objects.all()
+    if start is not None:
+        rollups = rollups.filter(date__gte=start)
+    if end is not None:
+        rollups = rollups.filter(date__lte=end)
+    if brand is not None:
+        rollups = rollups.filter(brand_id=brand)
+    if clothes_type is not None:
+        rollups = rollups.filter(clothes_type_id=clothes_type)
+    rows = (
+        rollups.values(column)
+        .annotate(total_units=Sum("units"), total_revenue=Sum("revenue"))
+        .order_by(column)
+    )
+    return [
+        {group_by: row[column], "units": row["total_units"], "revenue": row["total_revenue"]}
+        for row in rows
+    ]
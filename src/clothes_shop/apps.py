@@ -2,5 +2,8 @@ from django.apps import AppConfig
 
 
 class ClothesShopConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'clothes_shop'
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "clothes_shop"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,242 @@
+import gzip
+import json
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedPayment, Order, OrderItem, Payment, Shipping
+
+DESTINATION_TABLE = "table"
+DESTINATION_FILE = "file"
+DESTINATIONS = (DESTINATION_TABLE, DESTINATION_FILE)
+
+ORDER_FIELDS = (
+    "id",
+    "user_id",
+    "order_date",
+    "order_status",
+    "total_price",
+    "created_at",
+    "updated_at",
+)
+ORDER_ITEM_FIELDS = ("id", "order_id", "product_id", "quantity", "unit_price", "created_at")
+PAYMENT_FIELDS = (
+    "id",
+    "order_id",
+    "payment_date",
+    "payment_option",
+    "payment_status",
+    "stripe_charge_id",
+    "created_at",
+)
+SHIPPING_FIELDS = (
+    "id",
+    "order_id",
+    "shipping_tracking_number",
+    "shipping_date",
+    "shipping_address",
+    "address_code",
+    "created_at",
+)
+
+# orders-<最小ID>-<最大ID>-<作成時刻>.jsonl.gz
+ARCHIVE_FILE_PATTERN = re.compile(r"^orders-(\d+)-(\d+)-\d+\.jsonl\.gz$")
+
+
+def archivable_orders(cutoff, statuses):
+    return Order.objects.filter(created_at__lt=cutoff, order_status__in=statuses)
+
+
+def archive_orders(
+    cutoff,
+    statuses=(Order.STATUS_COMPLETED,),
+    chunk_size=500,
+    destination=DESTINATION_TABLE,
+    archive_dir=None,
+):
+    """
+    Move orders created before cutoff, together with their items, payments and
+    shippings, out of the hot tables. Each chunk is copied and deleted in its own
+    transaction. Returns the number of archived orders.
+    """
+    if destination not in DESTINATIONS:
+        raise ValueError(f"Unknown archive destination: {destination}")
+    archive_dir = Path(archive_dir or settings.ORDER_ARCHIVE_DIR)
+
+    archived = 0
+    last_id = 0
+    while True:
+        ids = list(
+            archivable_orders(cutoff, statuses)
+            .filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return archived
+        last_id = ids[-1]
+
+        with transaction.atomic():
+            # ロック取得後に条件を再確認し、並行して更新された注文は対象外にする
+            records = _collect_records(
+                archivable_orders(cutoff, statuses).select_for_update().filter(id__in=ids)
+            )
+            if not records:
+                continue
+            # 決済の突き合わせでアーカイブ済みの支払いを見分けるために残す
+            ArchivedPayment.objects.bulk_create(
+                [
+                    ArchivedPayment(id=payment["id"], order_id=record["id"])
+                    for record in records
+                    for payment in record["payments"]
+                ]
+            )
+            if destination == DESTINATION_TABLE:
+                ArchivedOrder.objects.bulk_create([_to_archived_order(r) for r in records])
+                _delete_orders(records)
+            else:
+                _write_archive_file(archive_dir, records)
+        archived += len(records)
+
+
+def _collect_records(orders):
+    records = [dict(order) for order in orders.values(*ORDER_FIELDS)]
+    ids = [record["id"] for record in records]
+    children = {
+        "order_items": (OrderItem, ORDER_ITEM_FIELDS),
+        "payments": (Payment, PAYMENT_FIELDS),
+        "shippings": (Shipping, SHIPPING_FIELDS),
+    }
+    for key, (model, fields) in children.items():
+        grouped = defaultdict(list)
+        for row in model.objects.filter(order_id__in=ids).order_by("id").values(*fields):
+            grouped[row["order_id"]].append(row)
+        for record in records:
+            record[key] = grouped[record["id"]]
+    # JSONと同じ表現(Decimal・日時は文字列)に揃える
+    return json.loads(json.dumps(records, cls=DjangoJSONEncoder))
+
+
+def _to_archived_order(record):
+    return ArchivedOrder(
+        id=record["id"],
+        user_id=record["user_id"],
+        order_date=record["order_date"],
+        order_status=record["order_status"],
+        total_price=record["total_price"],
+        created_at=record["created_at"],
+        updated_at=record["updated_at"],
+        payload={
+            "order_items": record["order_items"],
+            "payments": record["payments"],
+            "shippings": record["shippings"],
+        },
+    )
+
+
+def _delete_orders(records):
+    # 明細・支払い・配送はCASCADEで同じトランザクション内に削除される
+    Order.objects.filter(id__in=[record["id"] for record in records]).delete()
+
+
+def _write_archive_file(archive_dir, records):
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    _remove_orphaned_files(archive_dir, records)
+    name = "orders-{}-{}-{}.jsonl.gz".format(
+        records[0]["id"], records[-1]["id"], timezone.now().strftime("%Y%m%d%H%M%S%f")
+    )
+    path = archive_dir / name
+    tmp_path = archive_dir / f".{name}.tmp"
+    with open(tmp_path, "wb") as raw:
+        with gzip.open(raw, "wt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    try:
+        _delete_orders(records)
+        # 削除をコミットする前にファイルを確定する (コミット後に落ちても注文が失われない)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    _fsync_dir(archive_dir)
+
+
+def _fsync_dir(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _remove_orphaned_files(archive_dir, records):
+    """
+    Delete files left behind by a chunk whose transaction rolled back after the
+    file was written. The chunk's orders are locked, so any file that still
+    holds one of them can only come from a rolled back attempt.
+    """
+    ids = {record["id"] for record in records}
+    for name in os.listdir(archive_dir):
+        match = ARCHIVE_FILE_PATTERN.match(name.removeprefix(".").removesuffix(".tmp"))
+        if not match or int(match.group(2)) < records[0]["id"]:
+            continue
+        if int(match.group(1)) > records[-1]["id"]:
+            continue
+        if ids & _read_ids(archive_dir / name):
+            os.unlink(archive_dir / name)
+
+
+def _read_ids(path):
+    ids = set()
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                ids.add(json.loads(line)["id"])
+    except (EOFError, OSError, ValueError):
+        # 書き込み途中で止まった一時ファイルは読めた分だけで判断する
+        pass
+    return ids
+
+
+def get_archived_order(pk, archive_dir=None):
+    """
+    Return the archived record of an order as a dict, or None if it was never archived.
+    """
+    archived = ArchivedOrder.objects.filter(pk=pk).first()
+    if archived is not None:
+        return {
+            "id": archived.id,
+            "user_id": archived.user_id,
+            "order_date": archived.order_date,
+            "order_status": archived.order_status,
+            "total_price": archived.total_price,
+            "created_at": archived.created_at,
+            "updated_at": archived.updated_at,
+            **archived.payload,
+        }
+
+    archive_dir = Path(archive_dir or settings.ORDER_ARCHIVE_DIR)
+    if not archive_dir.is_dir():
+        return None
+    for name in sorted(os.listdir(archive_dir)):
+        match = ARCHIVE_FILE_PATTERN.match(name)
+        if not match or not int(match.group(1)) <= pk <= int(match.group(2)):
+            continue
+        with gzip.open(archive_dir / name, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["id"] == pk:
+                    # ロールバックされたチャンクのファイルなら注文はまだホットテーブルにある
+                    if Order.objects.filter(pk=pk).exists():
+                        return None
+                    return record
+    return None
@@ -0,0 +1,154 @@
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from rest_framework import authentication, exceptions
+
+from .models import RevokedToken
+
+API_TOKEN_SALT = "clothes_shop.api_token"
+
+
+class TokenUser:
+    """
+    The user of a token-authenticated request, built from the token alone
+    (no database read). id and role are the User's at the time of issue.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, role):
+        self.id = self.pk = id
+        self.role = role
+
+    def __str__(self):
+        return f"{self.id} ({self.role})"
+
+
+def issue_token(user, max_age=None):
+    """
+    Return a signed token for user, valid for max_age seconds (at most
+    API_TOKEN_MAX_AGE).
+    """
+    max_age = min(max_age or settings.API_TOKEN_MAX_AGE, settings.API_TOKEN_MAX_AGE)
+    now = time.time()
+    payload = {
+        "uid": user.pk,
+        "role": user.role,
+        "jti": secrets.token_urlsafe(12),
+        "iat": now,
+        "exp": int(now + max_age),
+    }
+    return signing.dumps(payload, salt=API_TOKEN_SALT)
+
+
+def load_token(token):
+    """
+    Return the payload of a token from issue_token. Raises signing.BadSignature
+    (or SignatureExpired) for invalid tokens; revocation is not checked.
+    """
+    payload = signing.loads(token, salt=API_TOKEN_SALT)
+    if payload["exp"] <= time.time():
+        raise signing.SignatureExpired("Token expired")
+    return payload
+
+
+class RevocationList:
+    """
+    In-memory copy of the unexpired RevokedToken rows, reloaded at most every
+    API_TOKEN_REVOCATION_REFRESH seconds. A revocation made in another process
+    therefore takes up to that long to apply here.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._token_ids = frozenset()
+        self._revoked_before = {}  # user_id -> これ以前に発行されたトークンは無効
+
+    def refresh(self):
+        token_ids, revoked_before = set(), {}
+        rows = RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list(
+            "token_id", "user_id", "revoked_at"
+        )
+        for token_id, user_id, revoked_at in rows:
+            if token_id:
+                token_ids.add(token_id)
+            else:
+                cutoff = revoked_at.timestamp()
+                revoked_before[user_id] = max(revoked_before.get(user_id, cutoff), cutoff)
+        with self._lock:
+            self._token_ids = frozenset(token_ids)
+            self._revoked_before = revoked_before
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def is_revoked(self, payload):
+        loaded_at = self._loaded_at
+        refresh = settings.API_TOKEN_REVOCATION_REFRESH
+        if loaded_at is None or time.monotonic() - loaded_at > refresh:
+            self.refresh()
+        if payload["jti"] in self._token_ids:
+            return True
+        revoked_before = self._revoked_before.get(payload["uid"])
+        return revoked_before is not None and payload["iat"] <= revoked_before
+
+
+revocations = RevocationList()
+
+
+def revoke_token(token):
+    payload = signing.loads(token, salt=API_TOKEN_SALT)
+    RevokedToken.objects.create(
+        token_id=payload["jti"],
+        user_id=payload["uid"],
+        expires_at=datetime.fromtimestamp(payload["exp"], tz=dt_timezone.utc),
+    )
+    revocations.invalidate()
+
+
+def revoke_user_tokens(user_id):
+    """
+    Revoke every token issued to the user so far.
+    """
+    RevokedToken.objects.create(
+        user_id=user_id,
+        expires_at=timezone.now() + timedelta(seconds=settings.API_TOKEN_MAX_AGE),
+    )
+    revocations.invalidate()
+
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """
+    Authorization: Bearer <token from issue_token>. The token is checked by its
+    signature, expiry and the in-memory revocation list, so authenticating
+    reads neither the session nor the User table.
+    """
+
+    keyword = "Bearer"
+
+    def authenticate(self, request):
+        auth = authentication.get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+        try:
+            payload = load_token(auth[1].decode())
+        except (signing.BadSignature, UnicodeError):
+            raise exceptions.AuthenticationFailed("Invalid or expired token.")
+        if revocations.is_revoked(payload):
+            raise exceptions.AuthenticationFailed("Token has been revoked.")
+        return TokenUser(payload["uid"], payload["role"]), payload
+
+    def authenticate_header(self, request):
+        return self.keyword
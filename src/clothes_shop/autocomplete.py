@@ -0,0 +1,267 @@
+import os
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Brand, OrderItem, Product, Watermark
+
+WATERMARK_NAME = "autocomplete"
+KIND_PRODUCT = 0
+KIND_BRAND = 1
+KIND_NAMES = {KIND_PRODUCT: "product", KIND_BRAND: "brand"}
+
+KEY_BYTES = 48
+# 前方一致の範囲がこれより広い接頭辞は上位候補を事前計算しておく
+SCAN_LIMIT = 1024
+TOP_K = 20
+
+ENTRY_DTYPE = np.dtype([("key", f"S{KEY_BYTES}"), ("ref", np.int32), ("weight", np.int64)])
+PREFIX_DTYPE = np.dtype([("prefix", f"S{KEY_BYTES}"), ("entries", np.int32, (TOP_K,))])
+
+
+def ref_dtype(label_bytes):
+    # ラベルの列幅はスナップショットごとに最長のラベル(UTF-8)に合わせ、切り詰めない
+    return np.dtype(
+        [
+            ("kind", np.int8),
+            ("id", np.int64),
+            ("brand_id", np.int64),
+            ("weight", np.int64),
+            ("label", f"S{max(label_bytes, 1)}"),
+        ]
+    )
+
+
+def make_refs(rows):
+    """
+    Build a refs array from (kind, id, brand_id, weight, label bytes) rows,
+    with the label field as wide as the longest label.
+    """
+    width = max((len(row[4]) for row in rows), default=1)
+    return np.array(rows, dtype=ref_dtype(width))
+
+
+def concatenate_refs(arrays):
+    width = max(array.dtype["label"].itemsize for array in arrays)
+    return np.concatenate([array.astype(ref_dtype(width)) for array in arrays])
+
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", text or "").lower().strip()
+
+
+def _keys(label):
+    # 先頭からの一致に加え、単語の途中からの入力にも対応する
+    words = normalize(label).split()
+    for i in range(len(words)):
+        key = " ".join(words[i:]).encode()[:KEY_BYTES]
+        if key:
+            yield key
+
+
+def build_snapshot(refs):
+    """
+    Build (entries, refs, prefix_top) arrays from a refs array (see make_refs).
+    entries are sorted by key so a prefix maps to one contiguous range.
+    """
+    keys, ref_indexes = [], []
+    for index, label in enumerate(refs["label"].tolist()):
+        for key in _keys(label.decode(errors="ignore")):
+            keys.append(key)
+            ref_indexes.append(index)
+    entries = np.zeros(len(keys), dtype=ENTRY_DTYPE)
+    entries["key"] = keys
+    entries["ref"] = ref_indexes
+    entries["weight"] = refs["weight"][entries["ref"]] if len(keys) else []
+    entries.sort(order=["key", "ref"])
+
+    prefixes = []
+    for length in range(1, KEY_BYTES):
+        truncated = entries["key"].astype(f"S{length}")
+        values, starts, counts = np.unique(truncated, return_index=True, return_counts=True)
+        wide = counts > SCAN_LIMIT
+        if not wide.any():
+            break
+        for value, start, count in zip(values[wide], starts[wide], counts[wide]):
+            prefixes.append((value, _top_in_range(entries, start, start + count, TOP_K)))
+    prefix_top = np.zeros(len(prefixes), dtype=PREFIX_DTYPE)
+    prefix_top["entries"] = -1
+    for i, (prefix, top) in enumerate(sorted(prefixes, key=lambda p: p[0])):
+        prefix_top["prefix"][i] = prefix
+        prefix_top["entries"][i, : len(top)] = top
+    return entries, refs, prefix_top
+
+
+def _top_in_range(entries, lo, hi, k):
+    weights = entries["weight"][lo:hi]
+    if len(weights) > k:
+        candidates = np.argpartition(-weights, k)[:k]
+    else:
+        candidates = np.arange(len(weights))
+    order = candidates[np.argsort(-weights[candidates], kind="stable")]
+    return (order + lo).astype(np.int32)
+
+
+def write_snapshot(path, entries, refs, prefix_top):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        for array in (entries, refs, prefix_top):
+            np.save(f, array)
+    # 読み込み中のワーカーは古いファイルのマップを使い続けられる
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    arrays = []
+    with open(path, "rb") as f:
+        for _ in range(3):
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+            if shape[0]:
+                arrays.append(np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape))
+            else:
+                arrays.append(np.zeros(shape, dtype=dtype))
+            f.seek(offset + int(np.prod(shape)) * dtype.itemsize)
+    return arrays
+
+
+def _product_refs(products, weights):
+    return make_refs(
+        [
+            (KIND_PRODUCT, product_id, brand_id, weights.get(product_id, 0), title.encode())
+            for product_id, brand_id, title in products
+        ]
+    )
+
+
+def _with_brand_refs(product_refs, brands):
+    brand_weights = {}
+    for brand_id, weight in zip(product_refs["brand_id"].tolist(), product_refs["weight"].tolist()):
+        brand_weights[brand_id] = brand_weights.get(brand_id, 0) + weight
+    rows = [
+        (KIND_BRAND, brand_id, brand_id, brand_weights.get(brand_id, 0), name.encode())
+        for brand_id, name in brands
+    ]
+    return concatenate_refs([product_refs, make_refs(rows)])
+
+
+def rebuild_index(path=None, full=False):
+    """
+    Refresh the snapshot from products, brands and order items changed since the
+    last run (or from scratch with full=True) and atomically replace the file.
+    Returns the number of indexed products and brands.
+    """
+    path = Path(path or settings.AUTOCOMPLETE_PATH)
+    now = timezone.now()
+    with transaction.atomic():
+        watermark, _ = Watermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        if full or not path.exists():
+            watermark.last_id = 0
+            watermark.last_timestamp = None
+        last_item_id = OrderItem.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+        sold = (
+            OrderItem.objects.filter(id__gt=watermark.last_id, id__lte=last_item_id)
+            .values("product_id")
+            .annotate(quantity=Sum("quantity"))
+        )
+        sold = {row["product_id"]: row["quantity"] for row in sold}
+        products = Product.objects.filter(is_deleted=False)
+        if watermark.last_timestamp is None:
+            refs = _product_refs(products.values_list("id", "brand_id", "title"), sold)
+        else:
+            _, current, _ = read_snapshot(path)
+            current = np.array(current[current["kind"] == KIND_PRODUCT])
+            # 既存の重みに新しい注文数を加算する
+            weights = dict(zip(current["id"].tolist(), current["weight"].tolist()))
+            for product_id, quantity in sold.items():
+                weights[product_id] = weights.get(product_id, 0) + quantity
+            changed = products.filter(updated_at__gte=watermark.last_timestamp)
+            changed_refs = _product_refs(changed.values_list("id", "brand_id", "title"), weights)
+            alive = np.fromiter(products.values_list("id", flat=True), dtype=np.int64)
+            current = current[
+                np.isin(current["id"], alive) & ~np.isin(current["id"], changed_refs["id"])
+            ]
+            current["weight"] = [weights.get(i, 0) for i in current["id"].tolist()]
+            refs = concatenate_refs([current, changed_refs])
+        refs = _with_brand_refs(refs, Brand.objects.values_list("id", "brand_name"))
+
+        write_snapshot(path, *build_snapshot(refs))
+        watermark.last_id = last_item_id
+        watermark.last_timestamp = now
+        watermark.save(update_fields=["last_id", "last_timestamp", "updated_at"])
+    return len(refs)
+
+
+class AutocompleteIndex:
+    """
+    Prefix lookups over the memory-mapped snapshot. Each worker maps the same
+    file, so the pages are shared, and re-maps it when build_autocomplete
+    replaces it.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._arrays = None
+        self._mtime = None
+
+    def _load(self):
+        path = Path(self.path or settings.AUTOCOMPLETE_PATH)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            self._arrays = read_snapshot(path)
+            self._mtime = mtime
+        return self._arrays
+
+    def suggest(self, query, limit=10):
+        arrays = self._load()
+        prefix = normalize(query).encode()[: KEY_BYTES - 1]
+        if arrays is None or not prefix:
+            return []
+        entries, refs, prefix_top = arrays
+        keys = entries["key"]
+        lo = int(np.searchsorted(keys, prefix, side="left"))
+        hi = int(np.searchsorted(keys, prefix + b"\xff", side="left"))
+        if hi - lo <= SCAN_LIMIT:
+            candidates = _top_in_range(entries, lo, hi, limit * 3)
+        else:
+            position = int(np.searchsorted(prefix_top["prefix"], prefix))
+            if position < len(prefix_top) and prefix_top["prefix"][position] == prefix:
+                candidates = prefix_top["entries"][position]
+                candidates = candidates[candidates >= 0]
+            else:
+                candidates = _top_in_range(entries, lo, hi, limit * 3)
+
+        suggestions, seen = [], set()
+        for ref_index in entries["ref"][candidates].tolist():
+            if ref_index in seen:
+                continue
+            seen.add(ref_index)
+            ref = refs[ref_index]
+            suggestions.append(
+                {
+                    "type": KIND_NAMES[int(ref["kind"])],
+                    "id": int(ref["id"]),
+                    "label": bytes(ref["label"]).decode(errors="ignore"),
+                    "weight": int(ref["weight"]),
+                }
+            )
+            if len(suggestions) == limit:
+                break
+        return suggestions
+
+
+autocomplete_index = AutocompleteIndex()
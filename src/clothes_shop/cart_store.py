@@ -0,0 +1,251 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CartItem
+from .reservations import InsufficientStock, check_stock, hold_stock
+
+CART_KEY = "cart:{user_id}"
+DIRTY_KEY = "cart:dirty:{shard}"
+LOCK_KEY = "cart:lock:{name}"
+DIRTY_SHARDS = 16
+# 書き戻し前のカートを預けられる、全プロセスで共有され再起動しても消えないキャッシュ
+# (Redisは永続化を有効にし、maxmemory-policyをnoevictionにしておく)。
+# DatabaseCacheは操作のたびにテーブルへ書き込み、書き込みを減らす意味がないので含めない
+DURABLE_CACHE_BACKENDS = {
+    "django.core.cache.backends.redis.RedisCache",
+}
+
+
+class CartLocked(Exception):
+    pass
+
+
+def _cart_backend_error():
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend in DURABLE_CACHE_BACKENDS:
+        return None
+    return (
+        f"CART_BACKEND = 'cache' requires a shared, persistent cache, not {backend}. "
+        "Set CACHE_URL to redis://, or use CART_BACKEND = 'db'."
+    )
+
+
+def is_cache_backend():
+    if settings.CART_BACKEND != "cache":
+        return False
+    # 書き込みを受け付けてから消えるキャッシュには預けない
+    error = _cart_backend_error()
+    if error:
+        raise ImproperlyConfigured(error)
+    return True
+
+
+@checks.register(checks.Tags.caches)
+def check_cart_backend(app_configs, **kwargs):
+    error = settings.CART_BACKEND == "cache" and _cart_backend_error()
+    return [checks.Error(error, id="clothes_shop.E001")] if error else []
+
+
+@contextmanager
+def _cache_lock(name, timeout=5, wait=2.0):
+    key = LOCK_KEY.format(name=name)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while not cache.add(key, token, timeout):
+        if time.monotonic() > deadline:
+            raise CartLocked(f"Could not lock {key}")
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+class CacheCartStore:
+    """
+    Keeps each user's cart as a single cache entry and writes it back to the
+    CartItem table in batches. The first change after a write-back records the
+    user in a sharded dirty set kept in the cache, and neither the entry nor the
+    set expires until the cart has been written back, so a change acknowledged
+    to the client survives restarts and a crashed flush is simply retried by the
+    next one. Adding to a cart only checks that the stock is available; the
+    write-back holds it (see reservations.hold_stock), so a cart change costs no
+    database write. Requires a cache in DURABLE_CACHE_BACKENDS.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout if timeout is not None else settings.CART_CACHE_TIMEOUT
+
+    def _shard(self, user_id):
+        return user_id % DIRTY_SHARDS
+
+    def _load(self, user_id):
+        cart = cache.get(CART_KEY.format(user_id=user_id))
+        if cart is None:
+            # キャッシュにない場合はテーブルから読み込む
+            items = {}
+            for product_id, quantity in CartItem.objects.filter(user_id=user_id).values_list(
+                "product_id", "quantity"
+            ):
+                items[product_id] = items.get(product_id, 0) + quantity
+            cart = {"version": None, "items": items, "dirty": False}
+        return cart
+
+    def items(self, user_id):
+        cart = self._load(user_id)
+        return [
+            {"user": user_id, "product": product_id, "quantity": quantity}
+            for product_id, quantity in sorted(cart["items"].items())
+        ]
+
+    def _update(self, user_id, product_id, compute):
+        with _cache_lock(f"user:{user_id}"):
+            cart = self._load(user_id)
+            current = cart["items"].get(product_id, 0)
+            quantity = max(compute(current), 0)
+            if quantity > current:
+                # 確保は書き戻し時に行うので、ここでは在庫があるかを読むだけ (不足なら例外)
+                check_stock(user_id, product_id, quantity)
+            if not cart["dirty"]:
+                # 書き戻し後の最初の変更だけ、カートを保存する前に未反映の印を付ける
+                self._set_dirty(user_id, True)
+                cart["dirty"] = True
+            if quantity:
+                cart["items"][product_id] = quantity
+            else:
+                cart["items"].pop(product_id, None)
+            # 破棄と読み直しを挟んでも重ならないよう、版は連番ではなく一意な値にする
+            cart["version"] = uuid.uuid4().hex
+            # 書き戻すまでは期限切れで消えないようにする
+            cache.set(CART_KEY.format(user_id=user_id), cart, None)
+        return quantity
+
+    def set_quantity(self, user_id, product_id, quantity):
+        return self._update(user_id, product_id, lambda current: quantity)
+
+    def add(self, user_id, product_id, quantity):
+        return self._update(user_id, product_id, lambda current: current + quantity)
+
+    def remove(self, user_id, product_id):
+        self.set_quantity(user_id, product_id, 0)
+
+    def invalidate(self, user_id):
+        cache.delete(CART_KEY.format(user_id=user_id))
+
+    def _set_dirty(self, user_id, dirty):
+        # 呼び出し側がユーザーのロックを持っている (ロックはユーザー、シャードの順に取る)
+        shard = self._shard(user_id)
+        with _cache_lock(f"dirty:{shard}"):
+            users = cache.get(DIRTY_KEY.format(shard=shard)) or set()
+            if dirty:
+                users.add(user_id)
+            else:
+                users.discard(user_id)
+            cache.set(DIRTY_KEY.format(shard=shard), users, None)
+
+    def dirty_users(self):
+        keys = [DIRTY_KEY.format(shard=shard) for shard in range(DIRTY_SHARDS)]
+        return sorted(set().union(*cache.get_many(keys).values()))
+
+    def flush(self, user_ids=None, batch_size=500):
+        """
+        Write dirty carts (or only user_ids) to the CartItem table, batch_size carts
+        per transaction. Returns the number of carts written.
+        """
+        dirty = self.dirty_users()
+        if user_ids is not None:
+            dirty = sorted(set(dirty) & set(user_ids))
+        flushed = 0
+        for start in range(0, len(dirty), batch_size):
+            flushed += self._flush_batch(dirty[start : start + batch_size])
+        return flushed
+
+    def _flush_batch(self, user_ids):
+        keys = {user_id: CART_KEY.format(user_id=user_id) for user_id in user_ids}
+        cached = cache.get_many(list(keys.values()))
+        # キャッシュにないカートは書き戻し後に破棄されたもの (未反映のカートは期限切れにならない)
+        carts = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+        with transaction.atomic():
+            changed = self._write(carts)
+            self._hold(changed)
+        # コミット後に印を消す。途中で失敗した場合は印が残り、次回に書き直す
+        # (書き戻しも確保も差分で行うので、同じ版を二度書いても結果は変わらない)
+        for user_id in user_ids:
+            with _cache_lock(f"user:{user_id}"):
+                current = cache.get(keys[user_id])
+                if current is not None:
+                    if user_id not in carts or current["version"] != carts[user_id]["version"]:
+                        # 書き出し中に変更されたカートは次回に持ち越す
+                        continue
+                    current["dirty"] = False
+                    cache.set(keys[user_id], current, self.timeout)
+                self._set_dirty(user_id, False)
+        return len(carts)
+
+    def flush_user(self, user_id):
+        return self.flush(user_ids=[user_id])
+
+    def _hold(self, changed):
+        # 商品行のロックの順序をそろえるため商品順に確保する。カートへの追加時に在庫を
+        # 確かめてから書き戻すまでに売り切れた分は確保せず、注文時の引き当て
+        # (reservations.consume_stock) で在庫不足として扱う
+        for (user_id, product_id), quantity in sorted(
+            changed.items(), key=lambda item: (item[0][1], item[0][0])
+        ):
+            try:
+                hold_stock(user_id, product_id, quantity)
+            except InsufficientStock:
+                continue
+
+    def _write(self, carts):
+        """
+        Write carts to the CartItem table and return the (user_id, product_id)
+        lines whose quantity changed, mapped to their new quantity (0 if removed).
+        """
+        existing = {}
+        duplicates = []
+        for row in CartItem.objects.filter(user_id__in=carts).order_by("id"):
+            key = (row.user_id, row.product_id)
+            if key in existing:
+                duplicates.append(row.pk)
+            else:
+                existing[key] = row
+
+        creates, updates = [], []
+        changed = {}
+        now = timezone.now()
+        for user_id, cart in carts.items():
+            for product_id, quantity in cart["items"].items():
+                row = existing.pop((user_id, product_id), None)
+                if row is None:
+                    creates.append(
+                        CartItem(user_id=user_id, product_id=product_id, quantity=quantity)
+                    )
+                    changed[user_id, product_id] = quantity
+                elif row.quantity != quantity:
+                    row.quantity = quantity
+                    row.updated_at = now
+                    updates.append(row)
+                    changed[user_id, product_id] = quantity
+        changed.update({key: 0 for key in existing})
+        deletes = duplicates + [row.pk for row in existing.values()]
+
+        if deletes:
+            CartItem.objects.filter(pk__in=deletes).delete()
+        if updates:
+            CartItem.objects.bulk_update(updates, ["quantity", "updated_at"])
+        if creates:
+            CartItem.objects.bulk_create(creates)
+        return changed
+
+
+cart_store = CacheCartStore()
@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+
+COUNT_KEY = "count:{table}:{signature}"
+REFRESH_LOCK_KEY = "{key}:refreshing"
+
+logger = logging.getLogger(__name__)
+
+ESTIMATE_SQL = {
+    # InnoDBの統計情報による概算 (ANALYZE TABLEで更新される)
+    "mysql": (
+        "SELECT table_rows FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name = %s"
+    ),
+    # 一度もANALYZEされていないテーブルは-1になる
+    "postgresql": "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+}
+
+
+def estimated_row_count(model, using="default"):
+    """
+    Row count of model's table from the database's statistics, without
+    scanning it. Returns None when the backend keeps no such statistics.
+    """
+    connection = connections[using]
+    sql = ESTIMATE_SQL.get(connection.vendor)
+    if sql is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def is_unfiltered(queryset):
+    query = queryset.query
+    return not query.where and not query.distinct and not query.is_sliced
+
+
+def _cache_key(queryset):
+    sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+    signature = hashlib.sha256(f"{queryset.db}\n{sql}\n{params!r}".encode()).hexdigest()
+    return COUNT_KEY.format(table=queryset.model._meta.db_table, signature=signature)
+
+
+def count_rows(queryset):
+    """
+    Count queryset's rows without a full COUNT(*) inside the request.
+    Returns (count, exact):
+
+    - an unfiltered queryset over a table estimated at COUNT_ESTIMATE_THRESHOLD
+      rows or more gets the estimate from the table statistics;
+    - a count cached for the same query within COUNT_CACHE_TTL seconds is
+      reused (not exact: rows may have changed since);
+    - otherwise rows are counted up to COUNT_ESTIMATE_THRESHOLD + 1. A larger
+      result returns that capped count (not exact: the real count is higher)
+      and starts one background full count per query to fill the cache.
+    """
+    queryset = queryset.order_by()
+    limit = settings.COUNT_ESTIMATE_THRESHOLD
+    if is_unfiltered(queryset):
+        estimate = estimated_row_count(queryset.model, queryset.db)
+        if estimate is not None and estimate >= limit:
+            return estimate, False
+    try:
+        key = _cache_key(queryset)
+    except EmptyResultSet:
+        return 0, True
+    count = cache.get(key)
+    if count is not None:
+        return count, False
+    count = queryset[: limit + 1].count()
+    if count <= limit:
+        return count, True
+    # 同じ条件の全件COUNTは全プロセスで同時に1つだけ走らせる
+    if cache.add(REFRESH_LOCK_KEY.format(key=key), 1, settings.COUNT_CACHE_TTL):
+        _refresh_in_background(queryset, key)
+    return count, False
+
+
+def refresh_count(queryset, key):
+    """
+    Count queryset in full and cache the result under key.
+    """
+    try:
+        cache.set(key, queryset.count(), settings.COUNT_CACHE_TTL)
+    finally:
+        cache.delete(REFRESH_LOCK_KEY.format(key=key))
+
+
+def _refresh_in_background(queryset, key):
+    def run():
+        try:
+            refresh_count(queryset, key)
+        except Exception:
+            logger.exception("Counting %s failed", queryset.model._meta.db_table)
+        finally:
+            # このスレッドで開いた接続だけを閉じる
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def fast_count(queryset):
+    return count_rows(queryset)[0]
@@ -0,0 +1,356 @@
+import asyncio
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import ChangeEvent, Product
+
+logger = logging.getLogger(__name__)
+
+# products / products.<id> / orders / orders.<id> / users.<id>.orders
+TOPIC_PATTERN = re.compile(r"^(products|orders)(\.\d+)?$|^users\.\d+\.orders$")
+# 一括更新された在庫の記録。商品は配信時に読み直す
+STOCK_EVENT = "stock"
+# これより大きく飛んだidは欠番として待たない
+MAX_GAP = 1000
+# 購読者のいるプロセスが定期的に立てる印と、記録の削除を1プロセスだけが行うためのロック
+LISTENING_KEY = "events:listening"
+SWEEP_LOCK_KEY = "events:sweep"
+# プロセスごとに別のキャッシュ。他のプロセスの印が見えないので、常に記録する
+PROCESS_LOCAL_CACHE_BACKENDS = {
+    "django.core.cache.backends.dummy.DummyCache",
+    "django.core.cache.backends.locmem.LocMemCache",
+}
+
+
+class Subscription:
+    """
+    One client's queue of events for a set of topics. When the client falls
+    more than EVENTS_QUEUE_SIZE events behind, the queue is dropped and the
+    subscription is marked overflowed instead of buffering without bound.
+    """
+
+    def __init__(self, topics, loop, maxsize):
+        self.topics = frozenset(topics)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def push(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # 待機中のget()を起こすため、古いイベントを捨てて終了の合図だけ入れる
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout):
+        """
+        Return the next event, or None on overflow. Raises TimeoutError after
+        timeout seconds without events.
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Broadcaster:
+    """
+    Fans events out to the subscriptions of this process (EventFeed feeds it
+    the changes saved by every process). publish() may be
+    called from any thread; it schedules a single callback per event loop,
+    which then pushes the event to that loop's subscribers of the topic.
+    Idle subscriptions cost one suspended coroutine and an empty queue.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # loop -> {topic: set of Subscription}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, topics, maxsize=None):
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(topics, loop, maxsize or settings.EVENTS_QUEUE_SIZE)
+        with self._lock:
+            by_topic = self._subscriptions.setdefault(loop, defaultdict(set))
+            for topic in subscription.topics:
+                by_topic[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            by_topic = self._subscriptions.get(subscription.loop, {})
+            for topic in subscription.topics:
+                subscribers = by_topic.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del by_topic[topic]
+            if not by_topic:
+                self._subscriptions.pop(subscription.loop, None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(
+                {
+                    subscription
+                    for by_topic in self._subscriptions.values()
+                    for subscribers in by_topic.values()
+                    for subscription in subscribers
+                }
+            )
+
+    def is_idle(self):
+        with self._lock:
+            return not self._subscriptions
+
+    def has_subscribers(self, topics):
+        with self._lock:
+            return any(
+                topic in by_topic for by_topic in self._subscriptions.values() for topic in topics
+            )
+
+    def publish(self, topics, event_type, data, event_id=None):
+        """
+        Send an event to every subscriber of any of topics (each subscriber
+        receives it once).
+        """
+        event = {"id": event_id or next(self._ids), "event": event_type, "data": data}
+        with self._lock:
+            targets = [
+                (loop, [by_topic[topic] for topic in topics if topic in by_topic])
+                for loop, by_topic in self._subscriptions.items()
+            ]
+        for loop, subscriber_sets in targets:
+            if subscriber_sets and not loop.is_closed():
+                loop.call_soon_threadsafe(self._fan_out, subscriber_sets, event)
+        return event
+
+    def _fan_out(self, subscriber_sets, event):
+        with self._lock:
+            subscriptions = set().union(*subscriber_sets)
+        for subscription in subscriptions:
+            subscription.push(event)
+
+
+def format_event(event):
+    return (
+        f"id: {event['id']}\nevent: {event['event']}\n"
+        f"data: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+    ).encode()
+
+
+def product_event(product):
+    return (
+        ["products", f"products.{product.pk}"],
+        "product",
+        {
+            "id": product.pk,
+            "stock_quantity": product.stock_quantity,
+            "available_quantity": product.available_quantity,
+            "price": str(product.price),
+            "is_deleted": product.is_deleted,
+        },
+    )
+
+
+def order_event(order):
+    return (
+        ["orders", f"orders.{order.pk}", f"users.{order.user_id}.orders"],
+        "order",
+        {"id": order.pk, "user": order.user_id, "order_status": order.order_status},
+    )
+
+
+def orders_event(orders, order_status):
+    """
+    One event for many orders moved to order_status at once; orders maps
+    order id to user id.
+    """
+    topics = {"orders"}
+    for order_id, user_id in orders.items():
+        topics.update((f"orders.{order_id}", f"users.{user_id}.orders"))
+    return (
+        sorted(topics),
+        "orders",
+        {
+            "order_status": order_status,
+            "orders": [{"id": order_id, "user": user_id} for order_id, user_id in orders.items()],
+        },
+    )
+
+
+def is_listening():
+    """
+    Whether any process has subscribers (see EventFeed.listen). Always true
+    when the cache is not shared between processes.
+    """
+    if settings.CACHES["default"]["BACKEND"] in PROCESS_LOCAL_CACHE_BACKENDS:
+        return True
+    return bool(cache.get(LISTENING_KEY))
+
+
+def log_event(topics, event_type, data):
+    """
+    Record an event for the subscribers of every process, unless no process
+    has any. Called in the transaction that made the change, so only committed
+    changes are delivered.
+    """
+    if is_listening():
+        ChangeEvent.objects.create(topics=list(topics), event=event_type, data=data)
+
+
+def publish_stock_changes(product_ids):
+    """
+    Record stock changed by queryset updates (which send no post_save), unless
+    no process has subscribers. The products are read when the events are
+    delivered, and only by processes with subscribers to them.
+    """
+    if not is_listening():
+        return
+    ChangeEvent.objects.bulk_create(
+        [
+            ChangeEvent(topics=["products", f"products.{pk}"], event=STOCK_EVENT, data={"id": pk})
+            for pk in sorted(set(product_ids))
+        ]
+    )
+
+
+def sweep_events(batch_size=1000, now=None):
+    """
+    Delete events older than EVENTS_LOG_RETENTION seconds, batch_size rows per
+    statement. Returns the number deleted.
+    """
+    now = now or timezone.now()
+    expired = ChangeEvent.objects.filter(
+        created_at__lt=now - timedelta(seconds=settings.EVENTS_LOG_RETENTION)
+    )
+    deleted = 0
+    while True:
+        ids = list(expired.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ChangeEvent.objects.filter(id__in=ids).delete()[0]
+
+
+class EventFeed:
+    """
+    Re-publishes the ChangeEvent log to this process's broadcaster, so
+    subscribers here see changes saved by any process: other web workers, task
+    workers and management commands. One daemon thread per process polls the
+    log every EVENTS_POLL_INTERVAL seconds while anyone here subscribes.
+
+    Ids are assigned at insert but become visible at commit, so a smaller id
+    can show up after a larger one was read. Missing ids below the last one
+    read are asked for again until EVENTS_GAP_TIMEOUT seconds have passed
+    (by then the id was rolled back).
+
+    While polling, the feed also keeps the shared listening mark set, without
+    which no process logs events, and deletes events past their retention
+    (sweep_events) at most once per EVENTS_SWEEP_INTERVAL across processes.
+    """
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_id = None
+        self.gaps = {}  # まだ見えていないid -> 気づいた時刻
+        self._listening_until = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="event-feed", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            if self.broadcaster.is_idle():
+                # 購読者がいない間は読まず、次に購読されたら最新の位置から読み始める
+                self.last_id = None
+            else:
+                try:
+                    self.listen()
+                    self.poll()
+                    self.sweep()
+                except Exception:
+                    logger.exception("Polling the event log failed")
+                    connection.close()
+            time.sleep(settings.EVENTS_POLL_INTERVAL)
+
+    def listen(self):
+        """
+        Keep the listening mark set for the next EVENTS_LISTENING_TTL seconds.
+        It is set before the first poll records the position, so only changes
+        already being saved when the first subscriber arrived can be missed.
+        """
+        now = time.monotonic()
+        # 毎回は書き込まず、残り時間が半分を切ったら延ばす
+        if now >= self._listening_until:
+            cache.set(LISTENING_KEY, True, settings.EVENTS_LISTENING_TTL)
+            self._listening_until = now + settings.EVENTS_LISTENING_TTL / 2
+
+    def sweep(self):
+        if cache.add(SWEEP_LOCK_KEY, True, settings.EVENTS_SWEEP_INTERVAL):
+            sweep_events()
+
+    def poll(self):
+        """
+        Publish the events committed since the last poll. The first poll only
+        records the current position. Returns the number of events published.
+        """
+        if self.last_id is None:
+            self.last_id = ChangeEvent.objects.aggregate(last=Max("pk"))["last"] or 0
+            self.gaps = {}
+            return 0
+        now = time.monotonic()
+        self.gaps = {
+            pk: noticed
+            for pk, noticed in self.gaps.items()
+            if now - noticed < settings.EVENTS_GAP_TIMEOUT
+        }
+        rows = list(
+            ChangeEvent.objects.filter(Q(pk__gt=self.last_id) | Q(pk__in=list(self.gaps)))
+            .order_by("pk")
+            .values_list("pk", "topics", "event", "data")
+        )
+        for pk, *_ in rows:
+            if pk in self.gaps:
+                del self.gaps[pk]
+                continue
+            if pk - self.last_id <= MAX_GAP:
+                self.gaps.update(dict.fromkeys(range(self.last_id + 1, pk), now))
+            self.last_id = pk
+
+        rows = [row for row in rows if self.broadcaster.has_subscribers(row[1])]
+        stock_ids = {data["id"] for _, _, event, data in rows if event == STOCK_EVENT}
+        products = Product.objects.in_bulk(stock_ids) if stock_ids else {}
+        published = 0
+        for pk, topics, event, data in rows:
+            if event == STOCK_EVENT:
+                # 同じ商品の在庫変更が続いていても、読み直した最新の状態を1回だけ送る
+                product = products.pop(data["id"], None)
+                if product is None:
+                    continue
+                topics, event, data = product_event(product)
+            self.broadcaster.publish(topics, event, data, event_id=pk)
+            published += 1
+        return published
+
+
+broadcaster = Broadcaster()
+feed = EventFeed(broadcaster)
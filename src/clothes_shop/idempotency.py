@@ -0,0 +1,157 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .throttling import WriteRateThrottle
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def request_fingerprint(request):
+    # 本文はパース後のデータで比較する (キーの順序や空白の違いは同じリクエストとみなす)
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def key_scope(request):
+    # キーはクライアントが自由に選ぶので、呼び出し元ごとに別の名前空間にする
+    route = request.resolver_match.url_name
+    scope = f"{route}:{WriteRateThrottle().get_ident(request)}"
+    if len(scope) > IdempotencyKey._meta.get_field("scope").max_length:
+        # X-Forwarded-Forの連なりなど長い識別子はハッシュにして収める
+        scope = f"{route}:{hashlib.sha256(scope.encode()).hexdigest()}"
+    return scope
+
+
+def claim_key(scope, key, fingerprint):
+    """
+    Insert an in-progress row for (scope, key), or take over an expired or
+    abandoned one. Returns (record, claimed); when claimed is False, record is
+    the existing row (or None if it disappeared meanwhile).
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    # 再送の大半は既存の行を読むだけで済むので、INSERTより先にSELECTする
+    record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    scope=scope, key=key, fingerprint=fingerprint, expires_at=expires_at
+                )
+            return record, True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+            if record is None:
+                return None, False
+    abandoned = record.status == IdempotencyKey.STATUS_IN_PROGRESS and record.updated_at < (
+        now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    )
+    if record.expires_at <= now or abandoned:
+        # 同時に引き継ごうとした他のリクエストとはupdated_atの比較で競合を判定する
+        taken = IdempotencyKey.objects.filter(pk=record.pk, updated_at=record.updated_at).update(
+            fingerprint=fingerprint,
+            status=IdempotencyKey.STATUS_IN_PROGRESS,
+            response_status=None,
+            response_body=None,
+            expires_at=expires_at,
+            updated_at=now,
+        )
+        if taken:
+            record.refresh_from_db()
+            return record, True
+    return record, False
+
+
+def sweep_expired_keys(batch_size=1000, now=None):
+    """
+    Delete expired keys, batch_size rows per statement. Returns the number deleted.
+    """
+    now = now or timezone.now()
+    expired = IdempotencyKey.objects.filter(expires_at__lt=now)
+    deleted = 0
+    while True:
+        ids = list(expired.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+
+def _replay(record):
+    return Response(
+        record.response_body, status=record.response_status, headers={REPLAYED_HEADER: "true"}
+    )
+
+
+class IdempotentCreateMixin:
+    """
+    Make POST safe to retry with an Idempotency-Key header. The first request
+    with a key runs normally and its successful response is stored; a retry
+    with the same key and body gets that response back without running the
+    view again. Keys are scoped to the caller (the user, else the client
+    address) and the route. A retry that arrives while the first request is still running
+    waits up to IDEMPOTENCY_WAIT seconds for its result.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > 255:
+            raise serializers.ValidationError({HEADER: ["Must be at most 255 characters."]})
+        scope = key_scope(request)
+        fingerprint = request_fingerprint(request)
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+        delay = 0.01
+        record = None
+        while True:
+            if record is None:
+                record, claimed = claim_key(scope, key, fingerprint)
+                if claimed:
+                    return self._create_once(record, request, *args, **kwargs)
+            if record is not None:
+                if record.fingerprint != fingerprint:
+                    return Response(
+                        {"detail": f"{HEADER} was already used for a different request."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                if record.status == IdempotencyKey.STATUS_COMPLETED:
+                    return _replay(record)
+            if time.monotonic() >= deadline:
+                return Response(
+                    {"detail": f"A request with this {HEADER} is still in progress."},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={"Retry-After": "1"},
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            # 元のリクエストが失敗して行が消えていれば、次の周回でこちらが処理を引き受ける
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+
+    def _create_once(self, record, request, *args, **kwargs):
+        try:
+            response = super().create(request, *args, **kwargs)
+        except Exception:
+            # 失敗した処理は記録せず、同じキーでの再試行で改めて実行させる
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+        if status.is_success(response.status_code):
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status=IdempotencyKey.STATUS_COMPLETED,
+                response_status=response.status_code,
+                response_body=response.data,
+                updated_at=timezone.now(),
+            )
+        else:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return response
@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Product
+
+# 変種名 -> 収める最大の幅・高さ(px)
+VARIANTS = {
+    "thumbnail": (160, 160),
+    "grid": (480, 480),
+    "detail": (1200, 1200),
+}
+VARIANT_FORMAT = "WEBP"
+VARIANT_QUALITY = 85
+ORIGINAL_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+NAME_PATTERN = re.compile(r"^([0-9a-f]{64})\.(jpg|png|webp|gif)$")
+CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "gif": "image/gif",
+}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def blob_path(name):
+    """
+    Path of a stored file by its name (<sha256>.<ext>), fanned out over two
+    directory levels so no directory grows too large.
+    """
+    if not NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid image name: {name}")
+    return Path(settings.PRODUCT_IMAGE_DIR) / name[:2] / name[2:4] / name
+
+
+def store_blob(data, ext):
+    """
+    Store data under its content hash and return the name. Storing the same
+    bytes again (the same image uploaded twice) writes nothing.
+    """
+    name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+    path = blob_path(name)
+    if path.exists():
+        # 使われなくなっていたファイルを再び使うので、sweep_unused_imagesに消されないよう更新時刻を進める
+        try:
+            os.utime(path)
+            return name
+        except FileNotFoundError:
+            pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # 一時ファイルに書いてから置き換え、読み手に書きかけのファイルを見せない
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return name
+
+
+def store_original(upload):
+    """
+    Check that upload (a file object) is an image within the size and pixel
+    limits and store it unchanged. Returns its name. Raises InvalidImage.
+    """
+    data = upload.read(settings.PRODUCT_IMAGE_MAX_UPLOAD_SIZE + 1)
+    if len(data) > settings.PRODUCT_IMAGE_MAX_UPLOAD_SIZE:
+        raise InvalidImage(
+            f"Ensure the image is at most {settings.PRODUCT_IMAGE_MAX_UPLOAD_SIZE} bytes."
+        )
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+            if image.width * image.height > Image.MAX_IMAGE_PIXELS:
+                raise InvalidImage("The image has too many pixels.")
+            image.verify()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise InvalidImage("Upload a valid image.")
+    if image_format not in ORIGINAL_FORMATS:
+        raise InvalidImage(f"Unsupported image format: {image_format}.")
+    return store_blob(data, ORIGINAL_FORMATS[image_format])
+
+
+def render_variants(original):
+    """
+    Resize the stored original into every variant and store each one.
+    Returns {variant: name}.
+    """
+    with Image.open(blob_path(original)) as image:
+        # 撮影時の向きを反映し、透過はそのままWebPに持ち越す
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        variants = {}
+        for variant, size in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            resized.save(out, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+            variants[variant] = store_blob(out.getvalue(), VARIANT_FORMAT.lower())
+    return variants
+
+
+def image_url(name):
+    return f"{settings.PRODUCT_IMAGE_URL}{name}"
+
+
+def sweep_unused_images(min_age, now=None):
+    """
+    Delete stored files that no product references (originals and variants
+    left behind by replaced or removed images), skipping files modified in
+    the last min_age seconds so uploads and variant generation still in
+    progress keep theirs. Returns the number deleted.
+    """
+    # 参照中のファイル名は全て読み込む (画像1枚につき元画像と変種で4つ)
+    used = set()
+    rows = Product.objects.exclude(image="").values_list("image", "image_variants")
+    for image, variants in rows.iterator(chunk_size=2000):
+        used.add(image)
+        used.update(variants.values())
+    cutoff = (now or time.time()) - min_age
+    deleted = 0
+    for path in Path(settings.PRODUCT_IMAGE_DIR).glob("*/*/*"):
+        if path.name in used or not path.is_file():
+            continue
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            deleted += 1
+    return deleted
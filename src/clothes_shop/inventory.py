@@ -0,0 +1,84 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .events import publish_stock_changes
+from .models import Product
+
+CHUNK_SIZE = 1000
+
+STATUS_OK = "ok"
+STATUS_NOT_FOUND = "not_found"
+STATUS_INSUFFICIENT = "insufficient"
+
+
+def adjust_inventory(entries, chunk_size=CHUNK_SIZE):
+    """
+    Apply stock adjustments in one transaction. Each entry is
+    {"product": id, "delta": n} or {"product": id, "quantity": n} (absolute),
+    with each product at most once.
+    Per chunk of products, the rows are locked and read with one SELECT and
+    updated with one UPDATE ... CASE. An entry that would leave less stock
+    than is reserved for carts (or below zero) is skipped.
+
+    Returns one result per entry, in order:
+    {"product", "status", "stock_quantity", "available_quantity"}.
+    """
+    results = []
+    changed = []
+    now = timezone.now()
+    with transaction.atomic():
+        for start in range(0, len(entries), chunk_size):
+            chunk = entries[start : start + chunk_size]
+            # 主キー順にロックして、同時に走る調整とのデッドロックを避ける
+            current = {
+                pk: (stock, reserved)
+                for pk, stock, reserved in Product.objects.select_for_update()
+                .filter(pk__in=[entry["product"] for entry in chunk])
+                .order_by("pk")
+                .values_list("pk", "stock_quantity", "reserved_quantity")
+            }
+            # 同じ値への変更をまとめ、CASEの分岐を商品数ではなく値の種類の数にする
+            groups = defaultdict(list)
+            for entry in chunk:
+                product_id = entry["product"]
+                if product_id not in current:
+                    results.append({"product": product_id, "status": STATUS_NOT_FOUND})
+                    continue
+                stock, reserved = current[product_id]
+                if "quantity" in entry:
+                    new_stock, change = entry["quantity"], ("quantity", entry["quantity"])
+                else:
+                    new_stock, change = stock + entry["delta"], ("delta", entry["delta"])
+                status = STATUS_OK
+                if new_stock < max(reserved, 0):
+                    status, new_stock = STATUS_INSUFFICIENT, stock
+                elif new_stock != stock:
+                    groups[change].append(product_id)
+                results.append(
+                    {
+                        "product": product_id,
+                        "status": status,
+                        "stock_quantity": new_stock,
+                        "available_quantity": new_stock - reserved,
+                    }
+                )
+            if groups:
+                whens = [
+                    When(
+                        pk__in=product_ids,
+                        then=Value(value) if kind == "quantity" else F("stock_quantity") + value,
+                    )
+                    for (kind, value), product_ids in groups.items()
+                ]
+                updated = [
+                    product_id for product_ids in groups.values() for product_id in product_ids
+                ]
+                Product.objects.filter(pk__in=updated).update(
+                    stock_quantity=Case(*whens, output_field=IntegerField()), updated_at=now
+                )
+                changed.extend(updated)
+        publish_stock_changes(changed)
+    return results
@@ -0,0 +1,382 @@
+import asyncio
+import json
+import random
+import ssl
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from django.urls import reverse
+from django.utils import timezone
+
+
+class HttpClient:
+    """
+    Minimal HTTP/1.1 client on asyncio streams, keeping one connection alive
+    between requests like a browser session would.
+    """
+
+    def __init__(self, base_url, headers=None, timeout=30):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if url.scheme == "https" else None
+        self.prefix = url.path.rstrip("/")
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def request(self, method, path, data=None, params=None, headers=None):
+        """
+        Send a request and return (status, decoded JSON body or None).
+        """
+        target = self.prefix + path + (f"?{urlencode(params)}" if params else "")
+        body = json.dumps(data).encode() if data is not None else b""
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Accept: application/json",
+            f"Content-Length: {len(body)}",
+        ]
+        if data is not None:
+            lines.append("Content-Type: application/json")
+        headers = {**self.headers, **(headers or {})}
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        message = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+        reused = self.writer is not None
+        try:
+            return await asyncio.wait_for(self._send(message), self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            if not reused:
+                raise
+            # サーバーが閉じたkeep-alive接続だったので、新しい接続で1回だけ送り直す
+            return await asyncio.wait_for(self._send(message), self.timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _send(self, message):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port, ssl=self.ssl
+            )
+        self.writer.write(message)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed before the response")
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "content-length" in headers:
+            content = await self.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            content = await self._read_chunked()
+        else:
+            content = await self.reader.read()
+            headers["connection"] = "close"
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+
+        if content and headers.get("content-type", "").startswith("application/json"):
+            return status, json.loads(content)
+        return status, None
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # トレーラーを読み飛ばす
+                while await self.reader.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append((await self.reader.readexactly(size + 2))[:-2])
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+        self.reader = self.writer = None
+
+
+THROTTLED = 429
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class StepFailed(Exception):
+    pass
+
+
+class StepThrottled(StepFailed):
+    pass
+
+
+class Stats:
+    """
+    Latencies and statuses per journey step, plus journey outcomes and the
+    unexpected exceptions that failed journeys. Responses rejected by the
+    write throttle (429) are counted apart from errors.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.journeys = Counter()
+        self.exceptions = Counter()  # (journey, exception type name) -> count
+
+    def record(self, step, latency, status):
+        self.latencies[step].append(latency)
+        self.statuses[step][status] += 1
+
+    @property
+    def requests(self):
+        return sum(len(samples) for samples in self.latencies.values())
+
+    def errors(self, step=None):
+        steps = [step] if step else self.statuses
+        return sum(
+            n
+            for name in steps
+            for status, n in self.statuses[name].items()
+            if not isinstance(status, int) or (status >= 400 and status != THROTTLED)
+        )
+
+    def throttled(self, step=None):
+        steps = [step] if step else self.statuses
+        return sum(self.statuses[name][THROTTLED] for name in steps)
+
+
+class Session:
+    """
+    One shopper: a connection, a user picked from the catalog, and the steps
+    taken so far recorded in stats.
+    """
+
+    def __init__(self, client, catalog, stats, rng):
+        self.client = client
+        self.catalog = catalog
+        self.stats = stats
+        self.rng = rng
+        self.user = rng.choice(catalog["users"])
+
+    def product(self):
+        return self.rng.choice(self.catalog["products"])
+
+    async def step(self, name, method, path, data=None, params=None, headers=None):
+        """
+        Run one request, recording its latency under name. Raises StepFailed on
+        an error response so the rest of the journey is skipped.
+        """
+        start = time.perf_counter()
+        try:
+            status, body = await self.client.request(method, path, data, params, headers)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            self.stats.record(name, time.perf_counter() - start, type(e).__name__)
+            raise StepFailed(name)
+        self.stats.record(name, time.perf_counter() - start, status)
+        if status == THROTTLED:
+            raise StepThrottled(name)
+        if status >= 400:
+            raise StepFailed(name)
+        return body
+
+    async def browse(self):
+        # 製品一覧 (検索・フィルタリング) から製品ビューへ
+        products = self.catalog["products"]
+        choice = self.rng.random()
+        if choice < 0.4:
+            word = self.rng.choice(self.catalog["words"])
+            await self.step("search", "GET", reverse("product-search"), params={"q": word})
+        elif choice < 0.7:
+            ids = self.rng.sample(products, min(len(products), 10))
+            await self.step(
+                "filter",
+                "GET",
+                reverse("product-list-create"),
+                params={"ids": ",".join(map(str, ids))},
+            )
+        else:
+            await self.step(
+                "list products",
+                "GET",
+                reverse("product-list-create"),
+                params={
+                    "page": self.rng.randint(1, self.catalog["pages"]),
+                    "page_size": LIST_PAGE_SIZE,
+                    "user": self.user,
+                },
+            )
+        product = self.product()
+        body = await self.step("view product", "GET", reverse("product-detail", args=[product]))
+        await self.step(
+            "recommendations", "GET", reverse("product-recommendations", args=[product])
+        )
+        return body
+
+    async def engage(self):
+        # 製品ビューからお気に入り・ウィッシュリスト・星評価
+        product = (await self.browse())["id"]
+        await self.step(
+            "favorite",
+            "POST",
+            reverse("favorite-list-create"),
+            {"user": self.user, "product": product},
+        )
+        if self.rng.random() < 0.5:
+            await self.step(
+                "add to wishlist",
+                "POST",
+                reverse("wishlist-list-create"),
+                {"user": self.user, "product": product},
+            )
+        await self.step(
+            "rate",
+            "POST",
+            reverse("rating-list-create"),
+            {"user": self.user, "product": product, "rating": self.rng.randint(1, 5)},
+        )
+
+    async def purchase(self):
+        # カートに追加してからチェックアウト (注文・明細・支払い)
+        product = await self.browse()
+        quantity = self.rng.randint(1, 2)
+        await self.step(
+            "add to cart",
+            "POST",
+            reverse("cartitem-list-create"),
+            {"user": self.user, "product": product["id"], "quantity": quantity},
+        )
+        await self.step(
+            "view cart", "GET", reverse("cartitem-list-create"), params={"user": self.user}
+        )
+        total = f"{float(product['price']) * quantity:.2f}"
+        order = await self.step(
+            "place order",
+            "POST",
+            reverse("order-list-create"),
+            {"user": self.user, "order_status": "pending", "total_price": total},
+            headers={"Idempotency-Key": str(uuid.uuid4())},
+        )
+        await self.step(
+            "add order item",
+            "POST",
+            reverse("orderitem-list-create"),
+            {
+                "order": order["id"],
+                "product": product["id"],
+                "quantity": quantity,
+                "unit_price": product["price"],
+            },
+        )
+        await self.step(
+            "pay",
+            "POST",
+            reverse("payment-list-create"),
+            {
+                "order": order["id"],
+                "payment_date": timezone.now().isoformat(),
+                "payment_option": "card",
+                "payment_status": "succeeded",
+            },
+            headers={"Idempotency-Key": str(uuid.uuid4())},
+        )
+
+
+JOURNEYS = ("browse", "engage", "purchase")
+CATALOG_PAGE_SIZE = 200
+LIST_PAGE_SIZE = 20
+
+
+async def load_catalog(client):
+    """
+    Product and user ids (the first page of each) the journeys pick from.
+    """
+    status, products = await client.request(
+        "GET", reverse("product-list-create"), params={"page": 1, "page_size": CATALOG_PAGE_SIZE}
+    )
+    if status != 200:
+        raise ValueError(f"Listing products returned {status}")
+    status, users = await client.request(
+        "GET", reverse("user-list-create"), params={"page": 1, "page_size": CATALOG_PAGE_SIZE}
+    )
+    if status != 200:
+        raise ValueError(f"Listing users returned {status}")
+    if not products["results"] or not users["results"]:
+        raise ValueError("The server needs at least one product and one user.")
+    words = sorted({word for item in products["results"] for word in item["title"].split()})
+    return {
+        "products": [item["id"] for item in products["results"]],
+        "users": [item["id"] for item in users["results"]],
+        "words": words,
+        "pages": max(1, len(products["results"]) // LIST_PAGE_SIZE),
+    }
+
+
+async def run_load(base_url, mix, rate, duration, max_in_flight=1000, seed=None, headers=None):
+    """
+    Start journeys at random (Poisson) arrival times averaging rate per second
+    for duration seconds, whether or not earlier ones have finished, and return
+    (stats, elapsed seconds). mix maps journey names to weights. An arrival
+    with max_in_flight journeys already running is counted as dropped, and a
+    journey stopped by a 429 as throttled rather than failed.
+    """
+    rng = random.Random(seed)
+    client = HttpClient(base_url, headers)
+    try:
+        catalog = await load_catalog(client)
+    finally:
+        await client.close()
+
+    stats = Stats()
+    names, weights = list(mix), list(mix.values())
+    in_flight = set()
+
+    async def run_journey(name):
+        client = HttpClient(base_url, headers)
+        session = Session(client, catalog, stats, random.Random(rng.random()))
+        try:
+            await getattr(session, name)()
+            stats.journeys[name, "completed"] += 1
+        except StepThrottled:
+            stats.journeys[name, "throttled"] += 1
+        except StepFailed:
+            stats.journeys[name, "failed"] += 1
+        except Exception as e:
+            # 想定外の応答で落ちた流れも失敗として数え、残りの負荷は止めない
+            stats.journeys[name, "failed"] += 1
+            stats.exceptions[name, type(e).__name__] += 1
+        finally:
+            await client.close()
+
+    loop = asyncio.get_running_loop()
+    start = next_arrival = loop.time()
+    while True:
+        next_arrival += rng.expovariate(rate)
+        if next_arrival - start > duration:
+            break
+        await asyncio.sleep(next_arrival - loop.time())
+        name = rng.choices(names, weights)[0]
+        if len(in_flight) >= max_in_flight:
+            stats.journeys[name, "dropped"] += 1
+            continue
+        task = asyncio.create_task(run_journey(name))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return stats, loop.time() - start
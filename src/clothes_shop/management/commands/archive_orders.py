@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from clothes_shop.archive import DESTINATION_TABLE, DESTINATIONS, archive_orders
+from clothes_shop.models import Order
+
+
+class Command(BaseCommand):
+    help = "Move completed orders older than a cutoff into archive tables or compressed files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=365, help="Archive orders older than this many days"
+        )
+        parser.add_argument("--before", help="Archive orders created before this ISO datetime")
+        parser.add_argument(
+            "--status",
+            action="append",
+            dest="statuses",
+            help=f"Order status to archive (repeatable, default: {Order.STATUS_COMPLETED})",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--to", choices=DESTINATIONS, default=DESTINATION_TABLE)
+        parser.add_argument("--archive-dir", help="Output directory for --to file")
+
+    def handle(self, *args, **options):
+        if options["before"]:
+            cutoff = parse_datetime(options["before"])
+            if cutoff is None:
+                raise CommandError(f"Invalid datetime: {options['before']}")
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff)
+        else:
+            cutoff = timezone.now() - timedelta(days=options["days"])
+
+        archived = archive_orders(
+            cutoff,
+            statuses=options["statuses"] or [Order.STATUS_COMPLETED],
+            chunk_size=options["chunk_size"],
+            destination=options["to"],
+            archive_dir=options["archive_dir"],
+        )
+        self.stdout.write(f"Archived {archived} orders created before {cutoff.isoformat()}.")
@@ -0,0 +1,210 @@
+import gzip
+import itertools
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import brotli
+import msgpack
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from clothes_shop.autocomplete import (
+    KIND_PRODUCT,
+    AutocompleteIndex,
+    build_snapshot,
+    make_refs,
+    write_snapshot,
+)
+from clothes_shop.middleware import compress
+from clothes_shop.models import Product
+from clothes_shop.renderers import ColumnarJSONRenderer, MessagePackRenderer
+from clothes_shop.search import InvertedIndexBackend
+from clothes_shop.serializers import ProductSerializer
+from clothes_shop.throttling import WriteRateThrottle
+
+WORDS = [
+    "cotton",
+    "denim",
+    "linen",
+    "wool",
+    "silk",
+    "shirt",
+    "jacket",
+    "pants",
+    "skirt",
+    "coat",
+    "black",
+    "white",
+    "navy",
+    "slim",
+    "relaxed",
+    "vintage",
+    "casual",
+    "formal",
+    "summer",
+    "winter",
+    "コットン",
+    "デニム",
+    "シャツ",
+    "ジャケット",
+    "ワンピース",
+    "パーカー",
+    "スカート",
+] + [f"item{i}" for i in range(20000)]
+# 実データに近づけるため語の出現頻度をZipf分布にする
+WORD_CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class Command(BaseCommand):
+    help = "Measure the latency of performance-sensitive code paths with synthetic data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", choices=["search", "autocomplete", "throttle", "payload"])
+        parser.add_argument("--size", type=int, default=100_000, help="Number of synthetic rows")
+        parser.add_argument("--queries", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        handler = getattr(self, f"bench_{options['target']}", None)
+        if handler is None:
+            raise CommandError(f"Unknown target: {options['target']}")
+        handler(options)
+
+    def report(self, label, samples):
+        self.stdout.write(
+            f"{label}: n={len(samples)} mean={statistics.mean(samples) * 1000:.3f}ms "
+            f"p50={percentile(samples, 0.5) * 1000:.3f}ms "
+            f"p99={percentile(samples, 0.99) * 1000:.3f}ms"
+        )
+
+    def words(self, k):
+        return self.random.choices(WORDS, cum_weights=WORD_CUM_WEIGHTS, k=k)
+
+    def timed(self, func, args_list):
+        samples = []
+        for args in args_list:
+            start = time.perf_counter()
+            func(*args)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    def bench_search(self, options):
+        # DBを使わずに合成データで転置インデックスを構築する
+        backend = InvertedIndexBackend()
+        start = time.perf_counter()
+        backend.load(
+            (product_id, " ".join(self.words(self.random.randint(8, 30))))
+            for product_id in range(1, options["size"] + 1)
+        )
+        self.stdout.write(
+            f"Indexed {options['size']} products in {time.perf_counter() - start:.1f}s"
+        )
+        queries = [
+            (" ".join(self.words(self.random.randint(1, 3))),) for _ in range(options["queries"])
+        ]
+        self.report("search page 1", self.timed(backend.search, queries))
+
+    def bench_autocomplete(self, options):
+        refs = make_refs(
+            [
+                (
+                    KIND_PRODUCT,
+                    product_id,
+                    0,
+                    int(self.random.paretovariate(1.2) * 10),
+                    " ".join(self.words(self.random.randint(2, 5))).encode(),
+                )
+                for product_id in range(1, options["size"] + 1)
+            ]
+        )
+        start = time.perf_counter()
+        snapshot = build_snapshot(refs)
+        self.stdout.write(
+            f"Built {len(snapshot[0])} keys for {options['size']} products "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "index.bin"
+            write_snapshot(path, *snapshot)
+            index = AutocompleteIndex(path)
+            index.suggest("a")
+            # 入力途中の文字列を想定して単語の先頭1〜6文字で引く
+            queries = [
+                (word[: self.random.randint(1, min(6, len(word)))],)
+                for word in self.words(options["queries"])
+            ]
+            self.report("autocomplete", self.timed(index.suggest, queries))
+
+    def bench_throttle(self, options):
+        # --sizeをクライアント数として、POST 1件あたりの流量制限の判定時間を測る
+        self.stdout.write(f"Cache backend: {settings.CACHES['default']['BACKEND']}")
+        factory = RequestFactory()
+        requests = []
+        for _ in range(options["queries"]):
+            request = factory.post(
+                "/api/orders/", REMOTE_ADDR=f"client-{self.random.randrange(options['size'])}"
+            )
+            request.resolver_match = resolve("/api/orders/")
+            requests.append((Request(request), None))
+
+        def check(request, view):
+            # DRFと同じくリクエストごとにスロットルを生成する
+            WriteRateThrottle().allow_request(request, view)
+
+        self.report("throttle check", self.timed(check, requests))
+
+    def bench_payload(self, options):
+        # --size件の商品一覧(保存しない合成データ)を各形式・圧縮で送受信した場合を測る
+        now = timezone.now()
+        products = [
+            Product(
+                id=product_id,
+                size_id=self.random.randint(1, 5),
+                target_id=self.random.randint(1, 3),
+                clothes_type_id=self.random.randint(1, 20),
+                brand_id=self.random.randint(1, 200),
+                title=" ".join(self.words(self.random.randint(2, 5))),
+                description=" ".join(self.words(self.random.randint(10, 40))),
+                price=self.random.randint(500, 30000),
+                stock_quantity=self.random.randint(0, 100),
+                release_date=now,
+            )
+            for product_id in range(1, options["size"] + 1)
+        ]
+        data = ProductSerializer(products, many=True).data
+        formats = {
+            "json": (JSONRenderer(), json.loads),
+            "columnar": (ColumnarJSONRenderer(), json.loads),
+            "msgpack": (MessagePackRenderer(), msgpack.unpackb),
+        }
+        decompressors = {None: lambda body: body, "gzip": gzip.decompress, "br": brotli.decompress}
+        rounds = max(1, min(options["queries"], 20))
+        for name, (renderer, parse) in formats.items():
+            for encoding, decompress in decompressors.items():
+
+                def round_trip():
+                    # サーバー側の描画・圧縮からクライアント側の展開・パースまで
+                    body = renderer.render(data)
+                    if encoding:
+                        body = compress(body, encoding)
+                    parse(decompress(body))
+                    return body
+
+                size = len(round_trip())
+                samples = self.timed(round_trip, [()] * rounds)
+                self.report(f"{name:8} {encoding or 'identity':8} {size:>10} bytes", samples)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from clothes_shop.autocomplete import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Refresh the autocomplete prefix snapshot from changed products, brands and orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rebuild from all rows")
+
+    def handle(self, *args, **options):
+        count = rebuild_index(full=options["full"])
+        self.stdout.write(f"Indexed {count} products and brands.")
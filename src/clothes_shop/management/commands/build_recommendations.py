@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from clothes_shop.recommendations import reset_cooccurrence, update_cooccurrence, write_top_k
+
+
+class Command(BaseCommand):
+    help = "Update product co-occurrence counts from new orders and rewrite the top-k table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true", help="Recount from all orders in the hot tables"
+        )
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument("--top-k", type=int)
+
+    def handle(self, *args, **options):
+        if options["full"]:
+            reset_cooccurrence()
+        changed = update_cooccurrence(batch_size=options["batch_size"])
+        if changed or options["full"]:
+            rows = write_top_k(changed, k=options["top_k"], full=options["full"])
+            self.stdout.write(f"Updated {len(changed)} products; top-k table has {rows} rows.")
+        else:
+            self.stdout.write("No new orders.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from clothes_shop.cart_store import cart_store
+
+
+class Command(BaseCommand):
+    help = "Write carts changed in the cache store back to the CartItem table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        flushed = cart_store.flush(batch_size=options["batch_size"])
+        self.stdout.write(f"Flushed {flushed} carts.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clothes_shop.authentication import issue_token
+from clothes_shop.models import User
+
+
+class Command(BaseCommand):
+    help = "Print a signed API token for a user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_id", type=int)
+        parser.add_argument("--max-age", type=int, help="Seconds (default API_TOKEN_MAX_AGE)")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(pk=options["user_id"], is_deleted=False).first()
+        if user is None:
+            raise CommandError(f"User {options['user_id']} does not exist.")
+        self.stdout.write(issue_token(user, max_age=options["max_age"]))
@@ -0,0 +1,106 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clothes_shop.loadtest import JOURNEYS, percentile, run_load
+
+
+def parse_mix(value):
+    """
+    Parse "browse=6,engage=2,purchase=1" into {"browse": 6.0, ...}.
+    """
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in JOURNEYS:
+            raise CommandError(f"Unknown journey: {name} (choose from {', '.join(JOURNEYS)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight for {name}: {weight}")
+    if not any(mix.values()):
+        raise CommandError("At least one journey needs a positive weight.")
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive shopper journeys against a running server and report latency per step. "
+        "Every journey comes from this one client, so the server's write throttle answers "
+        "much of the default mix with 429s (reported apart from errors); run the server "
+        "with RATE_LIMIT_ENABLED=false to measure without it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Base URL of the server, e.g. http://localhost:8000")
+        parser.add_argument(
+            "--mix",
+            default="browse=6,engage=2,purchase=1",
+            help="Journey weights (browse, engage, purchase)",
+        )
+        parser.add_argument("--rate", type=float, default=10, help="Journeys started per second")
+        parser.add_argument("--duration", type=float, default=60, help="Seconds to start journeys")
+        parser.add_argument("--max-in-flight", type=int, default=1000)
+        parser.add_argument("--token", help="Signed API token sent as a Bearer token")
+        parser.add_argument("--seed", type=int)
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options["mix"])
+        if options["rate"] <= 0 or options["duration"] <= 0:
+            raise CommandError("--rate and --duration must be positive.")
+        headers = {"Authorization": f"Bearer {options['token']}"} if options["token"] else {}
+        try:
+            stats, elapsed = asyncio.run(
+                run_load(
+                    options["url"],
+                    mix,
+                    options["rate"],
+                    options["duration"],
+                    max_in_flight=options["max_in_flight"],
+                    seed=options["seed"],
+                    headers=headers,
+                )
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not load the catalog from {options['url']}: {e}")
+
+        for name in mix:
+            outcomes = {
+                outcome: stats.journeys[name, outcome]
+                for outcome in ("completed", "failed", "dropped", "throttled")
+            }
+            exceptions = " ".join(
+                f"{error}={n}"
+                for (journey, error), n in sorted(stats.exceptions.items())
+                if journey == name
+            )
+            self.stdout.write(
+                f"journey {name}: "
+                + " ".join(f"{k}={v}" for k, v in outcomes.items())
+                + (f" exceptions: {exceptions}" if exceptions else "")
+            )
+        requests, errors, throttled = stats.requests, stats.errors(), stats.throttled()
+        self.stdout.write(
+            f"requests: n={requests} throughput={requests / elapsed:.1f}/s "
+            f"errors={errors} ({errors / max(requests, 1):.1%}) "
+            f"throttled={throttled} ({throttled / max(requests, 1):.1%}) in {elapsed:.1f}s"
+        )
+        self.stdout.write(
+            f"{'step':<16} {'n':>6} {'errors':>7} {'429':>7} {'p50':>9} {'p95':>9} {'p99':>9}"
+            "  statuses"
+        )
+        for step, samples in stats.latencies.items():
+            statuses = " ".join(
+                f"{status}={n}" for status, n in sorted(stats.statuses[step].items(), key=str)
+            )
+            self.stdout.write(
+                f"{step:<16} {len(samples):>6} {stats.errors(step) / len(samples):>7.1%} "
+                f"{stats.throttled(step) / len(samples):>7.1%} "
+                + " ".join(f"{percentile(samples, q) * 1000:>7.1f}ms" for q in (0.5, 0.95, 0.99))
+                + f"  {statuses}"
+            )
+        if throttled:
+            self.stderr.write(
+                f"{throttled} requests were throttled (429). Run the server with "
+                "RATE_LIMIT_ENABLED=false to measure without the write throttle."
+            )
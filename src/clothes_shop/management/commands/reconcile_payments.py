@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clothes_shop.reconciliation import (
+    BATCH_SIZE,
+    FIXABLE,
+    JsonlChargeSource,
+    reconcile_payments,
+    reset_reconciliation,
+)
+
+
+class Command(BaseCommand):
+    help = "Compare Payment statuses with the Stripe charge list and optionally fix them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source", help="Charge list as JSON Lines (default STRIPE_CHARGES_PATH)"
+        )
+        parser.add_argument(
+            "--fix", action="store_true", help="Overwrite fixable mismatches from Stripe"
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint of an interrupted run and start from the first payment",
+        )
+
+    def handle(self, *args, **options):
+        if options["restart"]:
+            reset_reconciliation()
+
+        def on_mismatch(kind, payment_id, charge):
+            if options["verbosity"] >= 2:
+                charge_id = charge["id"] if charge else "-"
+                self.stdout.write(f"{kind} payment={payment_id or '-'} charge={charge_id}")
+
+        source = JsonlChargeSource(options["source"])
+        try:
+            counts = reconcile_payments(
+                source,
+                fix=options["fix"],
+                batch_size=options["batch_size"],
+                on_mismatch=on_mismatch,
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {source.path}: {e}")
+        checked = counts.pop("checked", 0)
+        fixed = sum(counts[kind] for kind in FIXABLE) if options["fix"] else 0
+        self.stdout.write(
+            f"Checked {checked} payments: {sum(counts.values())} mismatches, {fixed} fixed."
+        )
+        for kind, n in sorted(counts.items()):
+            self.stdout.write(f"  {kind}: {n}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from clothes_shop.analytics import refresh_sales_rollups, reset_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Fold changed orders into the sales rollup tables used by the analytics API"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute from all orders in the hot tables (archived orders are dropped)",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            reset_sales_rollups()
+        folded = refresh_sales_rollups(batch_size=options["batch_size"])
+        self.stdout.write(f"Folded {folded} changed orders into sales rollups.")
@@ -0,0 +1,25 @@
+from django.core import signing
+from django.core.management.base import BaseCommand, CommandError
+
+from clothes_shop.authentication import revoke_token, revoke_user_tokens
+
+
+class Command(BaseCommand):
+    help = "Revoke an API token, or every token issued to a user so far (--user)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("token", nargs="?")
+        parser.add_argument("--user", type=int)
+
+    def handle(self, *args, **options):
+        if options["user"] is not None:
+            revoke_user_tokens(options["user"])
+            self.stdout.write(f"Revoked all tokens of user {options['user']}.")
+        elif options["token"]:
+            try:
+                revoke_token(options["token"])
+            except signing.BadSignature:
+                raise CommandError("Invalid token.")
+            self.stdout.write("Revoked token.")
+        else:
+            raise CommandError("Give a token or --user.")
@@ -0,0 +1,74 @@
+import multiprocessing
+import signal
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _work(batch_size, poll_interval, once):
+    # spawnで起動した子プロセスはDjangoの初期化からやり直す (モデルの読み込みはその後)
+    django.setup()
+    from clothes_shop.task_queue import Worker
+
+    # Ctrl-Cは親プロセスが受けてSIGTERMで各ワーカーを止める
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = Worker(batch_size=batch_size, poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, worker.stop)
+    worker.run(once=once)
+
+
+class Command(BaseCommand):
+    help = "Run a pool of worker processes that execute queued background tasks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, help="Defaults to TASK_WORKERS")
+        parser.add_argument("--batch-size", type=int, default=1)
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once no task is due instead of polling"
+        )
+
+    def handle(self, *args, **options):
+        from clothes_shop.task_queue import Worker
+
+        processes = options["processes"] or settings.TASK_WORKERS
+        worker_args = (options["batch_size"], options["poll_interval"], options["once"])
+        if processes == 1:
+            worker = Worker(
+                batch_size=options["batch_size"], poll_interval=options["poll_interval"]
+            )
+            signal.signal(signal.SIGTERM, worker.stop)
+            signal.signal(signal.SIGINT, worker.stop)
+            processed = worker.run(once=options["once"])
+            self.stdout.write(f"Processed {processed} tasks.")
+            return
+
+        self.stopping = False
+
+        def stop(*args):
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        connections.close_all()
+        context = multiprocessing.get_context("spawn")
+        pool = [None] * processes
+        while not self.stopping:
+            for number, process in enumerate(pool):
+                # 未起動または異常終了したワーカーを起動する
+                if process is None or process.exitcode not in (None, 0):
+                    pool[number] = context.Process(target=_work, args=worker_args)
+                    pool[number].start()
+            if all(process.exitcode == 0 for process in pool):
+                break
+            time.sleep(1)
+        for process in pool:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in pool:
+            if process is not None:
+                process.join()
+        self.stdout.write(f"Stopped {processes} workers.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from clothes_shop.events import sweep_events
+
+
+class Command(BaseCommand):
+    help = "Delete delivered change events older than EVENTS_LOG_RETENTION in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = sweep_events(batch_size=options["batch_size"])
+        self.stdout.write(f"Deleted {deleted} change events.")
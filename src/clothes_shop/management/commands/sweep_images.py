@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from clothes_shop.images import sweep_unused_images
+
+
+class Command(BaseCommand):
+    help = "Delete stored product image files that no product references"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=24 * 60 * 60,
+            help="Keep files modified within this many seconds (default: one day)",
+        )
+
+    def handle(self, *args, **options):
+        deleted = sweep_unused_images(min_age=options["min_age"])
+        self.stdout.write(f"Deleted {deleted} unused image files.")
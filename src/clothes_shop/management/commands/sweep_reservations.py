@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from clothes_shop.reservations import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Release expired cart stock reservations in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = release_expired_holds(batch_size=options["batch_size"])
+        self.stdout.write(f"Released {released} expired reservations.")
@@ -0,0 +1,45 @@
+from array import array
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorite, WishList
+
+MEMBERSHIP_KEY = "memberships:{kind}:{user_id}"
+MEMBERSHIP_TIMEOUT = 60 * 60
+
+MEMBERSHIP_MODELS = {
+    "favorite": Favorite,
+    "wishlist": WishList,
+}
+
+
+def _product_ids(kind, user_id):
+    key = MEMBERSHIP_KEY.format(kind=kind, user_id=user_id)
+    packed = cache.get(key)
+    if packed is None:
+        ids = (
+            MEMBERSHIP_MODELS[kind]
+            .objects.filter(user_id=user_id)
+            .values_list("product_id", flat=True)
+        )
+        # 8バイト整数の配列として保持する
+        packed = array("q", sorted(set(ids))).tobytes()
+        cache.set(key, packed, MEMBERSHIP_TIMEOUT)
+    ids = array("q")
+    ids.frombytes(packed)
+    return frozenset(ids)
+
+
+def favorite_product_ids(user_id):
+    return _product_ids("favorite", user_id)
+
+
+def wishlist_product_ids(user_id):
+    return _product_ids("wishlist", user_id)
+
+
+def invalidate_memberships(kind, user_id):
+    key = MEMBERSHIP_KEY.format(kind=kind, user_id=user_id)
+    # サマリーと同じく、コミット前に読まれた古い集合が残らないようコミット後に破棄する
+    transaction.on_commit(lambda: cache.delete(key))
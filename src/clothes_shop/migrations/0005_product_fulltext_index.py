@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    # MySQL以外(SQLiteなど)はアプリ内の転置インデックスで検索する
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute(
+        "CREATE FULLTEXT INDEX clothes_shop_product_fulltext "
+        "ON clothes_shop_product (title, description) WITH PARSER ngram"
+    )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute("DROP INDEX clothes_shop_product_fulltext ON clothes_shop_product")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clothes_shop', '0004_productcooccurrence_watermark'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
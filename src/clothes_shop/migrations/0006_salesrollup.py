@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-19 14:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clothes_shop', '0005_product_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clothes_shop.brand')),
+                ('clothes_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clothes_shop.clothestype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'brand', 'clothes_type'), name='unique_sales_rollup')],
+            },
+        ),
+    ]
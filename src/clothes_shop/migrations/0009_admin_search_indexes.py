@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-19 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clothes_shop', '0008_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shipping',
+            name='shipping_tracking_number',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['title'], name='clothes_sho_title_2686aa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_name'], name='clothes_sho_user_na_0daf73_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['email_address'], name='clothes_sho_email_a_01a4f8_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-19 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clothes_shop', '0011_order_status_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='stripe_charge_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1 on 2026-10-19 14:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_current_prices(apps, schema_editor):
+    # 既存の商品は現在の価格を作成時点からの価格として記録する
+    Product = apps.get_model('clothes_shop', 'Product')
+    ProductPrice = apps.get_model('clothes_shop', 'ProductPrice')
+    rows = Product.objects.order_by('pk').values_list('pk', 'price', 'created_at')
+    batch = []
+    for product_id, price, created_at in rows.iterator(chunk_size=2000):
+        batch.append(ProductPrice(product_id=product_id, price=price, valid_from=created_at))
+        if len(batch) == 2000:
+            ProductPrice.objects.bulk_create(batch)
+            batch = []
+    ProductPrice.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clothes_shop', '0013_product_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('valid_from', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='clothes_shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'valid_from'], name='clothes_sho_product_b9d977_idx')],
+            },
+        ),
+        migrations.RunPython(record_current_prices, migrations.RunPython.noop),
+    ]
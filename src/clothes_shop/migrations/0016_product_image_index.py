@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-19 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clothes_shop', '0015_changeevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.CharField(blank=True, db_index=True, max_length=80),
+        ),
+    ]
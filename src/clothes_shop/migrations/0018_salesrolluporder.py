@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-19 15:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def reset_sales_rollups(apps, schema_editor):
+    # これまでの集計は注文の状態を見ずに加算していたので、次のrefresh_sales_rollupsで作り直す
+    apps.get_model('clothes_shop', 'SalesRollup').objects.all().delete()
+    apps.get_model('clothes_shop', 'Watermark').objects.filter(name='sales_rollups').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clothes_shop', '0017_dirtycart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupOrder',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='clothes_shop.order')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at', 'id'], name='clothes_sho_updated_cb2ddd_idx'),
+        ),
+        migrations.RunPython(reset_sales_rollups, migrations.RunPython.noop),
+    ]
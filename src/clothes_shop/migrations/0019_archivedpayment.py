@@ -0,0 +1,52 @@
+# Generated by Django 5.1 on 2026-10-19 15:15
+
+import gzip
+import json
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_archived_payments(apps, schema_editor):
+    ArchivedOrder = apps.get_model('clothes_shop', 'ArchivedOrder')
+    ArchivedPayment = apps.get_model('clothes_shop', 'ArchivedPayment')
+    pairs = {}
+    for order_id, payload in ArchivedOrder.objects.values_list('id', 'payload').iterator():
+        for payment in payload.get('payments', []):
+            pairs[payment['id']] = order_id
+    # --to fileで書き出した注文
+    archive_dir = settings.ORDER_ARCHIVE_DIR
+    if os.path.isdir(archive_dir):
+        for name in os.listdir(archive_dir):
+            if name.startswith('.') or not name.endswith('.jsonl.gz'):
+                continue
+            with gzip.open(os.path.join(archive_dir, name), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    for payment in record['payments']:
+                        pairs[payment['id']] = record['id']
+    ArchivedPayment.objects.bulk_create(
+        [ArchivedPayment(id=pk, order_id=order_id) for pk, order_id in pairs.items()],
+        batch_size=1000,
+    )
+    # 報告のみと--fixで共有していたチェックポイントは破棄して最初からやり直す
+    apps.get_model('clothes_shop', 'Watermark').objects.filter(name='reconcile_payments').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clothes_shop', '0018_salesrolluporder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('order_id', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(record_archived_payments, migrations.RunPython.noop),
+    ]
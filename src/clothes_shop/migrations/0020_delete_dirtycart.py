@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-19 17:40
+
+from django.core.cache import cache
+from django.db import migrations
+
+
+def move_dirty_carts_to_cache(apps, schema_editor):
+    # 書き戻し前のカートの印をキャッシュの未反映集合 (cart_store.DIRTY_KEY) へ移す
+    DirtyCart = apps.get_model('clothes_shop', 'DirtyCart')
+    shards = {}
+    for user_id in DirtyCart.objects.values_list('user_id', flat=True).iterator():
+        shards.setdefault(user_id % 16, set()).add(user_id)
+    for shard, user_ids in shards.items():
+        key = f'cart:dirty:{shard}'
+        cache.set(key, (cache.get(key) or set()) | user_ids, None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clothes_shop', '0019_archivedpayment'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_dirty_carts_to_cache, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='DirtyCart',
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 # Create your models here.
@@ -59,13 +60,52 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     release_date = models.DateTimeField()
     stock_quantity = models.IntegerField()
+    reserved_quantity = models.IntegerField(default=0)  # カート投入で確保中の在庫数
+    # 元画像のファイル名 (内容のSHA-256) と、ワーカーが生成した変種名 -> ファイル名
+    image = models.CharField(max_length=80, blank=True, db_index=True)
+    image_variants = models.JSONField(default=dict, blank=True)
     is_deleted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # 管理画面の先頭一致検索用
+            models.Index(fields=["title"]),
+        ]
+
     def __str__(self):
         return self.title
 
+    @property
+    def available_quantity(self):
+        return self.stock_quantity - self.reserved_quantity
+
+    def price_at(self, ts):
+        """
+        The price in effect at ts, or None before the first recorded price.
+        See prices.prices_at for many products at once.
+        """
+        return (
+            self.prices.filter(valid_from__lte=ts)
+            .order_by("-valid_from", "-id")
+            .values_list("price", flat=True)
+            .first()
+        )
+
+
+class ProductPrice(models.Model):
+    # 価格の履歴 (追記のみ)。valid_fromから次の行のvalid_fromまでこの価格だった
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="prices")
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    valid_from = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # 時点を指定した価格の検索用
+            models.Index(fields=["product", "valid_from"]),
+        ]
+
 
 class User(models.Model):
     user_name = models.CharField(max_length=255)
@@ -77,6 +117,13 @@ class User(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # 管理画面の検索用
+            models.Index(fields=["user_name"]),
+            models.Index(fields=["email_address"]),
+        ]
+
     def __str__(self):
         return self.user_name
 
@@ -104,17 +151,62 @@ class CartItem(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
 
+class StockReservation(models.Model):
+    # ユーザーごと・商品ごとのカート在庫確保 (期限切れはsweep_reservationsで解放)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="unique_stock_reservation"),
+        ]
+
+
 class Order(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_PAID = "paid"
+    STATUS_SHIPPED = "shipped"
+    STATUS_COMPLETED = "completed"
+    STATUS_CANCELLED = "cancelled"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "pending"),
+        (STATUS_PAID, "paid"),
+        (STATUS_SHIPPED, "shipped"),
+        (STATUS_COMPLETED, "completed"),
+        (STATUS_CANCELLED, "cancelled"),
+    ]
+    # 遷移先 -> 遷移できる元の状態
+    ALLOWED_FROM = {
+        STATUS_PAID: {STATUS_PENDING},
+        STATUS_SHIPPED: {STATUS_PAID},
+        STATUS_COMPLETED: {STATUS_SHIPPED},
+        STATUS_CANCELLED: {STATUS_PENDING, STATUS_PAID},
+    }
+    # 売上として集計する状態
+    REVENUE_STATUSES = {STATUS_PAID, STATUS_SHIPPED, STATUS_COMPLETED}
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     order_date = models.DateTimeField(auto_now_add=True)
-    order_status = models.CharField(max_length=50)
+    order_status = models.CharField(max_length=50, choices=STATUS_CHOICES)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # archive_ordersの対象抽出用
+            models.Index(fields=["order_status", "created_at"]),
+            # refresh_sales_rollupsが更新順に読み進める
+            models.Index(fields=["updated_at", "id"]),
+        ]
+
 
 class OrderItem(models.Model):
-    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="order_items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -123,17 +215,22 @@ class OrderItem(models.Model):
 
 
 class Payment(models.Model):
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_REFUNDED = "refunded"
+
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     payment_date = models.DateTimeField()
     payment_option = models.CharField(max_length=50)
     payment_status = models.CharField(max_length=50)
+    # Stripeの課金ID (ch_...)。課金時にmetadata.payment_idへこの支払いのIDを渡す
+    stripe_charge_id = models.CharField(max_length=255, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
 
 class Shipping(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
-    shipping_tracking_number = models.CharField(max_length=100)
+    shipping_tracking_number = models.CharField(max_length=100, db_index=True)
     shipping_date = models.DateTimeField()
     shipping_address = models.CharField(max_length=255)
     address_code = models.CharField(max_length=50)
@@ -148,3 +245,132 @@ class Rating(models.Model):
     comment = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+
+class ArchivedOrder(models.Model):
+    # archive_ordersコマンドでホットテーブルから移動した注文 (明細・支払い・配送はpayloadに格納)
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField(db_index=True)
+    order_date = models.DateTimeField()
+    order_status = models.CharField(max_length=50)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+
+class ArchivedPayment(models.Model):
+    # アーカイブ済み注文の支払いID (テーブル・ファイルのどちらに移した場合も記録する)
+    id = models.BigIntegerField(primary_key=True)
+    order_id = models.BigIntegerField()
+
+
+class Watermark(models.Model):
+    # 増分処理(レコメンド・集計など)の処理済み位置
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ProductCooccurrence(models.Model):
+    # 同じ注文に含まれた回数 (product_a == product_bの行はその商品を含む注文数)
+    product_a = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    product_b = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product_a", "product_b"], name="unique_product_cooccurrence"
+            ),
+        ]
+
+
+class SalesRollup(models.Model):
+    # 日別・ブランド別・種類別の販売数と売上 (refresh_sales_rollupsで注文から増分集計)
+    date = models.DateField()
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name="+")
+    clothes_type = models.ForeignKey(ClothesType, on_delete=models.CASCADE, related_name="+")
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "brand", "clothes_type"], name="unique_sales_rollup"
+            ),
+        ]
+
+
+class SalesRollupOrder(models.Model):
+    # SalesRollupに売上として加算済みの注文 (refresh_sales_rollupsが状態の変化に合わせて加減する)。
+    # 注文の行とは別に持ち、注文の保存で上書きされないようにする
+    order = models.OneToOneField(
+        Order, on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+
+
+class Task(models.Model):
+    # run_workersが処理するバックグラウンドタスク (完了したタスクは削除する)
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_FAILED = "failed"
+
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, default=STATUS_QUEUED)
+    run_at = models.DateTimeField()
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_at"])]
+
+    def __str__(self):
+        return f"{self.name}#{self.pk}"
+
+
+class IdempotencyKey(models.Model):
+    # Idempotency-Key付きPOSTの処理状態と応答 (期限切れはsweep_idempotency_keysで削除)
+    STATUS_IN_PROGRESS = "in_progress"
+    STATUS_COMPLETED = "completed"
+
+    scope = models.CharField(max_length=100)  # ルート名と呼び出し元
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # メソッド・パス・本文のSHA-256
+    status = models.CharField(max_length=20, default=STATUS_IN_PROGRESS)
+    response_status = models.IntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="unique_idempotency_key"),
+        ]
+
+
+class ChangeEvent(models.Model):
+    # /api/events/で配信する変更の記録。各プロセスがポーリングして自分の購読者へ配信する
+    # (古い行はsweep_eventsで削除)
+    topics = models.JSONField()
+    event = models.CharField(max_length=20)  # product / order / orders / stock
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class RevokedToken(models.Model):
+    # 失効させたAPIトークン。token_idが空の行はユーザーのrevoked_at以前のトークンを全て失効させる
+    token_id = models.CharField(max_length=64, blank=True)
+    user_id = models.BigIntegerField(null=True, blank=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)  # これ以降は署名の期限切れで弾かれる
@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .events import log_event, orders_event
+from .models import Order, Payment, Shipping, User
+from .summaries import invalidate_user_summaries
+
+CHUNK_SIZE = 1000
+
+RESULT_OK = "ok"
+RESULT_NOT_FOUND = "not_found"
+RESULT_INVALID = "invalid_transition"
+
+
+def transition_orders(entries, status, payment_option="", chunk_size=CHUNK_SIZE):
+    """
+    Move orders to status in one transaction. entries are {"id": order_id}
+    dicts (with "shipping_tracking_number" and optionally "address_code" when
+    status is shipped), each order at most once.
+
+    Per chunk, the orders are locked and read with one SELECT and moved with
+    one UPDATE guarded by WHERE order_status IN Order.ALLOWED_FROM[status].
+    Moving to paid creates a Payment and moving to shipped a Shipping per
+    order, with one bulk INSERT each. After commit a single "orders" event
+    lists every moved order.
+
+    Returns one {"id", "result", "order_status"} per entry, in order.
+    """
+    allowed_from = Order.ALLOWED_FROM[status]
+    now = timezone.now()
+    results = []
+    moved = {}  # order_id -> user_id
+    with transaction.atomic():
+        for start in range(0, len(entries), chunk_size):
+            chunk = entries[start : start + chunk_size]
+            current = {
+                pk: (user_id, order_status)
+                for pk, user_id, order_status in Order.objects.select_for_update()
+                .filter(pk__in=[entry["id"] for entry in chunk])
+                .order_by("pk")
+                .values_list("pk", "user_id", "order_status")
+            }
+            chunk_moved = []
+            for entry in chunk:
+                if entry["id"] not in current:
+                    results.append({"id": entry["id"], "result": RESULT_NOT_FOUND})
+                    continue
+                user_id, order_status = current[entry["id"]]
+                if order_status in allowed_from:
+                    chunk_moved.append(entry["id"])
+                    moved[entry["id"]] = user_id
+                    result, order_status = RESULT_OK, status
+                else:
+                    result = RESULT_INVALID
+                results.append({"id": entry["id"], "result": result, "order_status": order_status})
+            if chunk_moved:
+                Order.objects.filter(pk__in=chunk_moved, order_status__in=allowed_from).update(
+                    order_status=status, updated_at=now
+                )
+
+        if moved and status == Order.STATUS_PAID:
+            Payment.objects.bulk_create(
+                [
+                    Payment(
+                        order_id=order_id,
+                        payment_date=now,
+                        payment_option=payment_option,
+                        payment_status=Payment.STATUS_SUCCEEDED,
+                    )
+                    for order_id in moved
+                ],
+                batch_size=chunk_size,
+            )
+        if moved and status == Order.STATUS_SHIPPED:
+            addresses = dict(
+                User.objects.filter(pk__in=set(moved.values())).values_list("pk", "address")
+            )
+            Shipping.objects.bulk_create(
+                [
+                    Shipping(
+                        order_id=entry["id"],
+                        shipping_tracking_number=entry["shipping_tracking_number"],
+                        shipping_date=now,
+                        shipping_address=addresses[moved[entry["id"]]],
+                        address_code=entry.get("address_code", ""),
+                    )
+                    for entry in entries
+                    if entry["id"] in moved
+                ],
+                batch_size=chunk_size,
+            )
+
+        if moved:
+            # 一括UPDATEではpost_saveが送られないので、配信の記録とサマリーの破棄をここで行う
+            log_event(*orders_event(moved, status))
+            invalidate_user_summaries(set(moved.values()))
+    return results
@@ -0,0 +1,101 @@
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .counts import count_rows
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator counting with counts.count_rows; count_is_exact tells whether
+    count is exact or an estimate.
+    """
+
+    @cached_property
+    def _counted(self):
+        return count_rows(self.object_list)
+
+    @cached_property
+    def count(self):
+        return self._counted[0]
+
+    @property
+    def count_is_exact(self):
+        return self._counted[1]
+
+    def validate_number(self, number):
+        if self.count_is_exact:
+            return super().validate_number(number)
+        # 件数が概算なら、それを超えるページも実際の行で返す (行がなければ空のページ)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number):
+        if self.count_is_exact:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom : bottom + self.per_page], number, self)
+
+
+class CountedPageNumberPagination(PageNumberPagination):
+    """
+    Page number pagination for list views, applied only when ?page= is given
+    so unpaginated clients keep receiving a plain list. The response carries
+    count_is_exact alongside count. With an estimated count the last pages
+    may be shorter than the count suggests, or continue past it when the
+    count was capped; next is omitted once a page comes back short.
+    """
+
+    django_paginator_class = CountedPaginator
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param not in request.query_params:
+            return None
+        if not queryset.ordered:
+            # 並びが決まっていないとページ間で行が重複・欠落しうる
+            queryset = queryset.order_by("pk")
+        results = super().paginate_queryset(queryset, request, view)
+        self.page_is_short = len(results) < self.page.paginator.per_page
+        return results
+
+    def get_next_link(self):
+        if self.page_is_short:
+            return None
+        if not self.page.has_next() and not self.page.paginator.count_is_exact:
+            # 上限で打ち切った件数より先にも行がありうる
+            url = self.request.build_absolute_uri()
+            return replace_query_param(url, self.page_query_param, self.page.number + 1)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        # ?page= を外すとページ分割されなくなるので、1ページ目も番号付きで返す
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page.previous_page_number())
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "count": self.page.paginator.count,
+                "count_is_exact": self.page.paginator.count_is_exact,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count_is_exact"] = {"type": "boolean"}
+        return response_schema
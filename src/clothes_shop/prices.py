@@ -0,0 +1,68 @@
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.db.models import OuterRef, Subquery
+
+from .models import Product, ProductPrice
+
+
+def record_price(product, valid_from):
+    ProductPrice.objects.create(product=product, price=product.price, valid_from=valid_from)
+
+
+def prices_at(lookups):
+    """
+    Prices for many (product_id, ts) pairs with one query, as a list in the
+    order of lookups (None where no price was recorded yet at ts).
+
+    The query is a UNION of each product's price row at the earliest ts
+    (picked by id with one index seek per product, then read by primary key)
+    and the changes between the earliest and the latest ts, so it reads no
+    history outside the requested window. Looking up a whole catalog at one
+    time reads one row per product.
+    """
+    lookups = list(lookups)
+    if not lookups:
+        return []
+    product_ids = {product_id for product_id, _ in lookups}
+    start = min(ts for _, ts in lookups)
+    end = max(ts for _, ts in lookups)
+
+    # 各商品のstart時点の行はIDだけを相関サブクエリで選び、行そのものはIN (主キー) で読む
+    opening_ids = (
+        Product.objects.filter(pk__in=product_ids)
+        .annotate(
+            opening_id=Subquery(
+                ProductPrice.objects.filter(product=OuterRef("pk"), valid_from__lte=start)
+                .order_by("-valid_from", "-id")
+                .values("pk")[:1]
+            )
+        )
+        .values("opening_id")
+    )
+    columns = ("product_id", "pk", "valid_from", "price")
+    rows = (
+        ProductPrice.objects.filter(pk__in=opening_ids)
+        .values_list(*columns)
+        .union(
+            ProductPrice.objects.filter(
+                product__in=product_ids, valid_from__gt=start, valid_from__lte=end
+            ).values_list(*columns),
+            all=True,
+        )
+    )
+
+    history = defaultdict(list)
+    for product_id, price_id, valid_from, price in rows:
+        history[product_id].append((valid_from, price_id, price))
+    starts = {}
+    for product_id, changes in history.items():
+        changes.sort(key=lambda change: change[:2])
+        starts[product_id] = [valid_from for valid_from, _, _ in changes]
+
+    prices = []
+    for product_id, ts in lookups:
+        # 同時刻の変更は後から記録したもの (idの大きい方) が有効
+        index = bisect_right(starts.get(product_id, []), ts)
+        prices.append(history[product_id][index - 1][2] if index else None)
+    return prices
@@ -0,0 +1,267 @@
+import os
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, OrderItem, ProductCooccurrence, Watermark
+
+WATERMARK_NAME = "recommendations"
+# 明細数がこれを超える注文は組み合わせ数が膨らむため集計対象外にする
+MAX_ITEMS_PER_ORDER = 100
+# 直近の注文は明細の登録が終わっていない可能性があるため少し遅らせて取り込む
+ORDER_LAG = timedelta(minutes=5)
+UPSERT_BATCH_SIZE = 2000
+TOP_K_CHUNK_SIZE = 1000
+
+
+def cooccurrence_pairs(order_ids, product_ids):
+    """
+    Count (product_a, product_b) pairs, including a == b, across orders.
+
+    order_ids and product_ids are parallel arrays of order items. Returns
+    (pairs, counts) where pairs is an (n, 2) int64 array of unique pairs.
+    """
+    items = np.unique(
+        np.stack([np.asarray(order_ids, np.int64), np.asarray(product_ids, np.int64)], axis=1),
+        axis=0,
+    )
+    if not len(items):
+        return np.empty((0, 2), np.int64), np.empty(0, np.int64)
+    _, sizes = np.unique(items[:, 0], return_counts=True)
+    small = sizes <= MAX_ITEMS_PER_ORDER
+    items = items[np.repeat(small, sizes)]
+    sizes = sizes[small]
+    starts = np.cumsum(sizes) - sizes
+
+    # 各明細を同じ注文内の全明細(自分自身を含む)と組み合わせる
+    group_sizes = np.repeat(sizes, sizes)
+    group_starts = np.repeat(starts, sizes)
+    left = np.repeat(np.arange(len(items)), group_sizes)
+    block_starts = np.repeat(np.cumsum(group_sizes) - group_sizes, group_sizes)
+    right = np.repeat(group_starts, group_sizes) + (np.arange(len(left)) - block_starts)
+    products = items[:, 1]
+    return np.unique(
+        np.stack([products[left], products[right]], axis=1), axis=0, return_counts=True
+    )
+
+
+def _upsert_counts(pairs, counts):
+    existing = {}
+    for start in range(0, len(pairs), UPSERT_BATCH_SIZE):
+        batch = pairs[start : start + UPSERT_BATCH_SIZE]
+        rows = ProductCooccurrence.objects.filter(
+            product_a_id__in=set(batch[:, 0].tolist()),
+            product_b_id__in=set(batch[:, 1].tolist()),
+        ).values_list("product_a_id", "product_b_id", "count")
+        existing.update({(a, b): count for a, b, count in rows})
+
+    objs = [
+        ProductCooccurrence(product_a_id=a, product_b_id=b, count=existing.get((a, b), 0) + count)
+        for (a, b), count in zip(pairs.tolist(), counts.tolist())
+    ]
+    unique_fields = None
+    if connection.features.supports_update_conflicts_with_target:
+        unique_fields = ["product_a", "product_b"]
+    ProductCooccurrence.objects.bulk_create(
+        objs,
+        batch_size=UPSERT_BATCH_SIZE,
+        update_conflicts=True,
+        update_fields=["count"],
+        unique_fields=unique_fields,
+    )
+
+
+def _neighbor_ids(product_ids):
+    neighbors = set()
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), UPSERT_BATCH_SIZE):
+        neighbors.update(
+            ProductCooccurrence.objects.filter(
+                product_a_id__in=product_ids[start : start + UPSERT_BATCH_SIZE]
+            ).values_list("product_b_id", flat=True)
+        )
+    return neighbors
+
+
+def update_cooccurrence(batch_size=10000):
+    """
+    Fold orders placed since the last run into the co-occurrence counts.
+    Returns the set of product IDs whose top-k rows may have changed: the
+    products in the new orders, and every product bought with one of them
+    before (their scores are divided by the ordered products' counts).
+    """
+    changed = set()
+    scanned = set()
+    cutoff = timezone.now() - ORDER_LAG
+    while True:
+        with transaction.atomic():
+            watermark, _ = Watermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+            order_ids = list(
+                Order.objects.filter(id__gt=watermark.last_id, created_at__lt=cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not order_ids:
+                return changed
+            rows = np.array(
+                list(
+                    OrderItem.objects.filter(order_id__in=order_ids).values_list(
+                        "order_id", "product_id"
+                    )
+                ),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            pairs, counts = cooccurrence_pairs(rows[:, 0], rows[:, 1])
+            if len(pairs):
+                _upsert_counts(pairs, counts)
+                # count(a, a)が変わった商品と組になる全商品の類似度も変わる。
+                # 新しい組は両方の商品が注文に含まれるので、読み済みの商品は読み直さない
+                ordered = set(pairs[pairs[:, 0] == pairs[:, 1], 0].tolist())
+                changed.update(_neighbor_ids(ordered - scanned))
+                changed.update(ordered)
+                scanned.update(ordered)
+            watermark.last_id = order_ids[-1]
+            watermark.save(update_fields=["last_id", "updated_at"])
+
+
+def reset_cooccurrence():
+    with transaction.atomic():
+        ProductCooccurrence.objects.all().delete()
+        Watermark.objects.filter(name=WATERMARK_NAME).delete()
+
+
+def top_k_dtype(k):
+    return np.dtype(
+        [
+            ("product_id", np.int64),
+            ("neighbors", np.int64, (k,)),
+            ("scores", np.float32, (k,)),
+        ]
+    )
+
+
+def compute_top_k(product_ids, k):
+    """
+    Rank each product's co-purchased products by cosine similarity
+    count(a, b) / sqrt(count(a, a) * count(b, b)).
+    """
+    product_ids = sorted(set(product_ids))
+    table = np.zeros(len(product_ids), dtype=top_k_dtype(k))
+    table["product_id"] = product_ids
+    table["neighbors"] = -1
+    if not product_ids:
+        return table
+
+    rows = np.array(
+        list(
+            ProductCooccurrence.objects.filter(product_a_id__in=product_ids).values_list(
+                "product_a_id", "product_b_id", "count"
+            )
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    diagonal_ids = np.unique(rows[:, 1])
+    diagonal = dict(
+        ProductCooccurrence.objects.filter(
+            product_a_id__in=diagonal_ids.tolist(), product_b_id=F("product_a_id")
+        ).values_list("product_a_id", "count")
+    )
+    rows = rows[rows[:, 0] != rows[:, 1]]
+    if not len(rows):
+        return table
+    norms = np.sqrt(
+        np.array([diagonal.get(a, 1) for a in rows[:, 0].tolist()], np.float64)
+        * np.array([diagonal.get(b, 1) for b in rows[:, 1].tolist()], np.float64)
+    )
+    scores = rows[:, 2] / norms
+
+    # 商品ごと・スコアの降順に並べ、先頭k件を取り出す
+    order = np.lexsort((rows[:, 1], -scores, rows[:, 0]))
+    rows, scores = rows[order], scores[order]
+    products, starts, sizes = np.unique(rows[:, 0], return_index=True, return_counts=True)
+    positions = np.searchsorted(table["product_id"], products)
+    for position, start, size in zip(positions, starts, np.minimum(sizes, k)):
+        table["neighbors"][position, :size] = rows[start : start + size, 1]
+        table["scores"][position, :size] = scores[start : start + size]
+    return table
+
+
+def write_top_k(changed, path=None, k=None, full=False):
+    """
+    Recompute the rows of changed products and merge them into the top-k file,
+    which is replaced atomically so readers never see a partial table.
+    """
+    path = Path(path or settings.RECOMMENDATIONS_PATH)
+    k = k or settings.RECOMMENDATIONS_TOP_K
+    if full:
+        changed = ProductCooccurrence.objects.values_list("product_a_id", flat=True).distinct()
+    changed = sorted(set(changed))
+    chunks = [
+        compute_top_k(changed[start : start + TOP_K_CHUNK_SIZE], k)
+        for start in range(0, len(changed), TOP_K_CHUNK_SIZE)
+    ]
+    updated = np.concatenate(chunks) if chunks else compute_top_k([], k)
+
+    if not full and path.exists():
+        current = np.load(path)
+        if current.dtype == updated.dtype:
+            current = current[~np.isin(current["product_id"], updated["product_id"])]
+            updated = np.concatenate([current, updated])
+            updated.sort(order="product_id")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, updated)
+    os.replace(tmp_path, path)
+    return len(updated)
+
+
+class TopKTable:
+    """
+    Read-only view of the top-k file, memory-mapped so all worker processes
+    share the same pages. The file is re-opened when it has been replaced.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._table = None
+        self._mtime = None
+
+    def _load(self):
+        path = Path(self.path or settings.RECOMMENDATIONS_PATH)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._table, self._mtime = None, None
+            return None
+        if mtime != self._mtime:
+            self._table = np.load(path, mmap_mode="r")
+            self._mtime = mtime
+        return self._table
+
+    def similar(self, product_id, limit=None):
+        """
+        Return [(product_id, score), ...] for the products most often bought together.
+        """
+        table = self._load()
+        if table is None or not len(table):
+            return []
+        ids = table["product_id"]
+        position = int(np.searchsorted(ids, product_id))
+        if position >= len(ids) or ids[position] != product_id:
+            return []
+        neighbors = table["neighbors"][position]
+        scores = table["scores"][position]
+        size = int(np.count_nonzero(neighbors >= 0))
+        if limit is not None:
+            size = min(size, limit)
+        return list(zip(neighbors[:size].tolist(), scores[:size].tolist()))
+
+
+top_k_table = TopKTable()
@@ -0,0 +1,227 @@
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedPayment, Payment, Watermark
+
+WATERMARK_NAME = "reconcile_payments"
+BATCH_SIZE = 1000
+
+# 不一致の種類
+STATUS_MISMATCH = "status_mismatch"  # 状態が違う (修正対象)
+CHARGE_ID_MISSING = "charge_id_missing"  # 課金IDが未記録 (修正対象)
+CHARGE_ID_MISMATCH = "charge_id_mismatch"  # 別の課金IDが記録されている
+MISSING_CHARGE = "missing_charge"  # Stripeに課金がない
+UNKNOWN_CHARGE = "unknown_charge"  # 課金に対応する支払いがない
+UNLINKED_CHARGE = "unlinked_charge"  # metadata.payment_idのない課金
+FIXABLE = {STATUS_MISMATCH, CHARGE_ID_MISSING}
+
+
+def charge_status(charge):
+    """
+    The Payment.payment_status a Stripe charge corresponds to.
+    """
+    if charge.get("refunded"):
+        return Payment.STATUS_REFUNDED
+    return charge["status"]
+
+
+class JsonlChargeSource:
+    """
+    Local stand-in for the Stripe charge list: one charge object per line
+    ({"id", "status", "refunded", "metadata": {"payment_id"}}), sorted by
+    metadata.payment_id, as exported from Stripe.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.STRIPE_CHARGES_PATH
+
+    def charges(self, after=0):
+        """
+        Yield (payment_id, charge) with payment_id > after in ascending order,
+        and (None, charge) for charges not linked to a payment.
+        """
+        previous = after
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                charge = json.loads(line)
+                payment_id = (charge.get("metadata") or {}).get("payment_id")
+                if payment_id is None:
+                    yield None, charge
+                    continue
+                payment_id = int(payment_id)
+                if payment_id <= after:
+                    continue
+                if payment_id <= previous:
+                    raise ValueError(f"{self.path} is not sorted by payment_id at {payment_id}")
+                previous = payment_id
+                yield payment_id, charge
+
+
+def _payments(after, batch_size):
+    # 主キー順のキーセットページングで、件数によらず一定のメモリで読む
+    while True:
+        batch = list(
+            Payment.objects.filter(pk__gt=after)
+            .order_by("pk")
+            .values_list("pk", "payment_status", "stripe_charge_id")[:batch_size]
+        )
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        after = batch[-1][0]
+
+
+def _merge(payments, charges, unlinked):
+    """
+    Merge-join two streams sorted by payment id into (payment, charge) pairs,
+    either side None when the other has no match.
+    """
+    payment = next(payments, None)
+    charge = next(charges, None)
+    while payment is not None or charge is not None:
+        if charge is not None and charge[0] is None:
+            unlinked(charge[1])
+            charge = next(charges, None)
+        elif charge is None or (payment is not None and payment[0] < charge[0]):
+            yield payment, None
+            payment = next(payments, None)
+        elif payment is None or charge[0] < payment[0]:
+            yield None, charge
+            charge = next(charges, None)
+        else:
+            yield payment, charge
+            payment, charge = next(payments, None), next(charges, None)
+
+
+def _compare(payment, charge):
+    if charge is None:
+        return MISSING_CHARGE
+    if payment is None:
+        return UNKNOWN_CHARGE
+    _, status, charge_id = payment
+    if not charge_id:
+        return CHARGE_ID_MISSING
+    if charge_id != charge[1]["id"]:
+        return CHARGE_ID_MISMATCH
+    if status != charge_status(charge[1]):
+        return STATUS_MISMATCH
+    return None
+
+
+def _apply_fixes(fixes):
+    if not fixes:
+        return
+    now = timezone.now()
+    Payment.objects.bulk_update(
+        [
+            Payment(
+                pk=payment_id,
+                payment_status=charge_status(charge),
+                stripe_charge_id=charge["id"],
+                updated_at=now,
+            )
+            for payment_id, charge in fixes
+        ],
+        ["payment_status", "stripe_charge_id", "updated_at"],
+    )
+
+
+def watermark_name(fix):
+    # 報告のみの実行と--fixの実行は別々の位置から再開する
+    return f"{WATERMARK_NAME}:{'fix' if fix else 'report'}"
+
+
+def reconcile_payments(source, fix=False, batch_size=BATCH_SIZE, on_mismatch=None):
+    """
+    Compare every Payment with the charge whose metadata.payment_id is its id,
+    walking both in payment id order with constant memory. Returns a Counter
+    of mismatch kinds (and "checked"); on_mismatch(kind, payment_id, charge)
+    is called for each mismatch. Charges of payments moved out by
+    archive_orders are not reported as unknown.
+
+    With fix, status mismatches and unrecorded charge ids are overwritten from
+    Stripe, one bulk UPDATE per batch_size payments. The position is saved in
+    a Watermark per mode after every batch, so an interrupted run resumes
+    where it stopped; a run that reaches the end removes it so the next starts
+    over. The number of unlinked charges already reported is saved with it, so
+    a resumed run does not report them again.
+    """
+    name = watermark_name(fix)
+    unlinked_name = f"{name}:unlinked"
+    saved = dict(
+        Watermark.objects.filter(name__in=[name, unlinked_name]).values_list("name", "last_id")
+    )
+    start = saved.get(name, 0)
+    # 前回までに報告した課金IDのない課金の数 (ファイル順で先頭からその数だけ読み飛ばす)
+    reported_unlinked = saved.get(unlinked_name, 0)
+    unlinked_seen = 0
+    counts = Counter()
+    unknown = []  # (payment_id, charge) 未確定のunknown_charge
+
+    def report(kind, payment_id, charge):
+        counts[kind] += 1
+        if on_mismatch is not None:
+            on_mismatch(kind, payment_id, charge)
+
+    def report_unlinked(charge):
+        nonlocal unlinked_seen
+        unlinked_seen += 1
+        if unlinked_seen > reported_unlinked:
+            report(UNLINKED_CHARGE, None, charge)
+
+    def report_unknown():
+        # アーカイブ済みの支払いをバッチごとに1クエリで除く
+        archived = set(
+            ArchivedPayment.objects.filter(
+                pk__in=[payment_id for payment_id, _ in unknown]
+            ).values_list("pk", flat=True)
+        )
+        for payment_id, charge in unknown:
+            if payment_id not in archived:
+                report(UNKNOWN_CHARGE, payment_id, charge)
+        unknown.clear()
+
+    def checkpoint(position, fixes):
+        report_unknown()
+        with transaction.atomic():
+            if fix:
+                _apply_fixes(fixes)
+            Watermark.objects.update_or_create(name=name, defaults={"last_id": position})
+            Watermark.objects.update_or_create(
+                name=unlinked_name, defaults={"last_id": max(unlinked_seen, reported_unlinked)}
+            )
+
+    pairs = _merge(_payments(start, batch_size), source.charges(after=start), report_unlinked)
+    fixes = []
+    position = start
+    for seen, (payment, charge) in enumerate(pairs, 1):
+        payment_id = payment[0] if payment is not None else charge[0]
+        kind = _compare(payment, charge)
+        if payment is not None:
+            counts["checked"] += 1
+        if kind == UNKNOWN_CHARGE:
+            unknown.append((payment_id, charge[1]))
+        elif kind is not None:
+            report(kind, payment_id, charge[1] if charge else None)
+            if kind in FIXABLE:
+                fixes.append((payment_id, charge[1]))
+        position = payment_id
+        if seen % batch_size == 0:
+            checkpoint(position, fixes)
+            fixes = []
+    report_unknown()
+    with transaction.atomic():
+        if fix:
+            _apply_fixes(fixes)
+        Watermark.objects.filter(name__in=[name, unlinked_name]).delete()
+    return counts
+
+
+def reset_reconciliation():
+    Watermark.objects.filter(name__startswith=f"{WATERMARK_NAME}:").delete()
@@ -0,0 +1,53 @@
+import msgpack
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    Render responses as MessagePack (Accept: application/msgpack or ?format=msgpack).
+    Values msgpack has no type for are converted as in JSON responses.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_encoder.default)
+
+
+def to_columns(rows):
+    """
+    Turn a list of dicts sharing the same keys into {"columns": [...], "rows": [[...], ...]}.
+    Anything else is returned unchanged.
+    """
+    if not rows or not isinstance(rows, list) or not isinstance(rows[0], dict):
+        return rows
+    columns = list(rows[0])
+    if any(not isinstance(row, dict) or list(row) != columns for row in rows):
+        return rows
+    return {"columns": columns, "rows": [list(row.values()) for row in rows]}
+
+
+class ColumnarJSONRenderer(renderers.JSONRenderer):
+    """
+    JSON in which a list of objects is sent as field names once plus one array
+    per row (Accept: application/vnd.columnar+json or ?format=columnar). A
+    paginated {"results": [...]} body has its results converted.
+    """
+
+    media_type = "application/vnd.columnar+json"
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and isinstance(data.get("results"), list):
+            data = {**data, "results": to_columns(data["results"])}
+        else:
+            data = to_columns(data)
+        return super().render(data, accepted_media_type, renderer_context)
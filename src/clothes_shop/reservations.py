@@ -0,0 +1,159 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .events import publish_stock_changes
+from .models import CartItem, Product, StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        super().__init__(f"Insufficient stock for product {product_id} (requested {requested}).")
+        self.product_id = product_id
+        self.requested = requested
+
+
+def _locked_reservation(user_id, product_id):
+    # 同一ユーザー・商品の並行リクエストはこの行ロックで直列化される。読み取りとロックを
+    # 1文で行うので、期限切れの確保を解放処理が削除した場合も作り直すだけで済む
+    reservation, _ = StockReservation.objects.select_for_update().get_or_create(
+        user_id=user_id,
+        product_id=product_id,
+        defaults={"quantity": 0, "expires_at": timezone.now()},
+    )
+    return reservation
+
+
+def _adjust_reserved(product_id, delta):
+    """
+    Move delta units between available and reserved stock with a single conditional
+    UPDATE, raising InsufficientStock when they are not available. The UPDATE locks
+    the product row until the surrounding transaction commits, so every other hold
+    on the product waits until then: make it the transaction's last statement.
+    """
+    if not delta:
+        return
+    publish_stock_changes([product_id])
+    products = Product.objects.filter(pk=product_id)
+    if delta > 0:
+        products = products.filter(stock_quantity__gte=F("reserved_quantity") + delta)
+    if not products.update(reserved_quantity=F("reserved_quantity") + delta):
+        raise InsufficientStock(product_id, delta)
+
+
+def hold_stock(user_id, product_id, quantity, ttl=None):
+    """
+    Set the stock held for user on product to quantity and extend its expiry.
+    Raises InsufficientStock when the additional units are not available.
+    """
+    ttl = ttl if ttl is not None else settings.STOCK_RESERVATION_TTL
+    with transaction.atomic():
+        reservation = _locked_reservation(user_id, product_id)
+        # 期限切れでも未回収の確保分はreserved_quantityに残っているので差分だけ調整する
+        delta = quantity - reservation.quantity
+        if quantity > 0:
+            reservation.quantity = quantity
+            reservation.expires_at = timezone.now() + timedelta(seconds=ttl)
+            reservation.save(update_fields=["quantity", "expires_at", "updated_at"])
+        else:
+            reservation.delete()
+        # 商品行はコミットまでロックされるので、在庫の更新は最後に行う (在庫不足なら全て戻る)
+        _adjust_reserved(product_id, delta)
+
+
+def check_stock(user_id, product_id, quantity):
+    """
+    Raise InsufficientStock unless quantity units could be held for user on
+    product, counting the units already held for them. Holds nothing.
+    """
+    held = StockReservation.objects.filter(user_id=user_id, product_id=OuterRef("pk")).values(
+        "quantity"
+    )
+    available = Product.objects.filter(pk=product_id).filter(
+        stock_quantity__gte=F("reserved_quantity")
+        - Coalesce(Subquery(held[:1]), Value(0))
+        + quantity
+    )
+    if not available.exists():
+        raise InsufficientStock(product_id, quantity)
+
+
+def release_stock(user_id, product_id):
+    hold_stock(user_id, product_id, 0)
+
+
+def sync_cart_hold(user_id, product_id):
+    """
+    Hold exactly the quantity the user has in their cart for the product.
+    """
+    quantity = (
+        CartItem.objects.filter(user_id=user_id, product_id=product_id).aggregate(
+            total=Sum("quantity")
+        )["total"]
+        or 0
+    )
+    hold_stock(user_id, product_id, quantity)
+
+
+def consume_stock(user_id, product_id, quantity):
+    """
+    Take quantity units out of stock at checkout, using the user's hold first and
+    unreserved stock for the rest. Raises InsufficientStock if neither covers it.
+    """
+    with transaction.atomic():
+        reservation = _locked_reservation(user_id, product_id)
+        held = min(reservation.quantity, quantity)
+        if reservation.quantity > held:
+            reservation.quantity -= held
+            reservation.save(update_fields=["quantity", "updated_at"])
+        else:
+            reservation.delete()
+        publish_stock_changes([product_id])
+        # 商品行のロックを短くするため、在庫のUPDATEを最後に行う
+        updated = Product.objects.filter(
+            pk=product_id, stock_quantity__gte=F("reserved_quantity") + (quantity - held)
+        ).update(
+            stock_quantity=F("stock_quantity") - quantity,
+            reserved_quantity=F("reserved_quantity") - held,
+        )
+        if not updated:
+            raise InsufficientStock(product_id, quantity)
+
+
+def release_expired_holds(batch_size=1000, now=None):
+    """
+    Return expired holds to available stock, batch_size holds per transaction.
+    Holds locked by an in-flight add-to-cart are skipped and picked up next run.
+    Returns the number of released holds.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lt=now)
+                .order_by("expires_at")
+                .values_list("id", "product_id", "quantity")[:batch_size]
+            )
+            if not expired:
+                return released
+            per_product = defaultdict(int)
+            for _, product_id, quantity in expired:
+                per_product[product_id] += quantity
+            StockReservation.objects.filter(id__in=[row[0] for row in expired]).delete()
+            # 商品ごとの解放数をCASE式1本のUPDATEでまとめて戻す
+            Product.objects.filter(id__in=per_product).update(
+                reserved_quantity=F("reserved_quantity")
+                - Case(
+                    *[When(id=pid, then=Value(qty)) for pid, qty in sorted(per_product.items())],
+                    default=Value(0),
+                )
+            )
+            publish_stock_changes(list(per_product))
+        released += len(expired)
@@ -0,0 +1,194 @@
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+# 英数字の単語、またはかな・漢字などの連続
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+|[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text):
+    """
+    Split text into search terms: alphanumeric words as-is, and runs of
+    Japanese characters as overlapping bigrams (MySQL's ngram parser does the same).
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(unicodedata.normalize("NFKC", text or "").lower()):
+        word = match.group()
+        if word.isascii() or len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+@dataclass
+class SearchResult:
+    total: int
+    hits: list = field(default_factory=list)  # [(product_id, score), ...]
+
+
+class SearchBackend:
+    def search(self, query, page=1, page_size=20):
+        raise NotImplementedError
+
+    def index(self, product):
+        pass
+
+    def remove(self, product_id):
+        pass
+
+
+class MySQLFullTextBackend(SearchBackend):
+    """
+    Ranks with MATCH ... AGAINST over the FULLTEXT (ngram) index on title and description.
+    """
+
+    match_sql = "MATCH (title, description) AGAINST (%s IN NATURAL LANGUAGE MODE)"
+
+    def search(self, query, page=1, page_size=20):
+        if not tokenize(query):
+            return SearchResult(total=0)
+        matches = (
+            Product.objects.filter(is_deleted=False)
+            .annotate(score=RawSQL(self.match_sql, (query,)))
+            .filter(score__gt=0)
+        )
+        start = (page - 1) * page_size
+        hits = matches.order_by("-score", "id").values_list("id", "score")[
+            start : start + page_size
+        ]
+        return SearchResult(total=matches.count(), hits=list(hits))
+
+
+class InvertedIndexBackend(SearchBackend):
+    """
+    In-process inverted index ranked with BM25, for SQLite and tests. It is built
+    from the Product table on first use and then kept up to date by the Product
+    save/delete signals of this process.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self.postings = defaultdict(dict)  # term -> {product_id: term frequency}
+        self.doc_terms = {}  # product_id -> Counter of terms
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        with self._lock:
+            if self._built:
+                return
+            products = Product.objects.filter(is_deleted=False).values_list(
+                "id", "title", "description"
+            )
+            self.load(
+                (product_id, f"{title} {description}")
+                for product_id, title, description in products.iterator(chunk_size=2000)
+            )
+
+    def load(self, documents):
+        """
+        Index (product_id, text) pairs and mark the index as built.
+        """
+        with self._lock:
+            for product_id, text in documents:
+                self.add_document(product_id, text)
+            self._built = True
+
+    def add_document(self, product_id, text):
+        with self._lock:
+            self._remove_document(product_id)
+            terms = Counter(tokenize(text))
+            for term, frequency in terms.items():
+                self.postings[term][product_id] = frequency
+            self.doc_terms[product_id] = terms
+            self.doc_lengths[product_id] = sum(terms.values())
+            self.total_length += self.doc_lengths[product_id]
+
+    def _remove_document(self, product_id):
+        terms = self.doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(product_id)
+
+    def index(self, product):
+        if not self._built:
+            return
+        if product.is_deleted:
+            self.remove(product.pk)
+        else:
+            self.add_document(product.pk, f"{product.title} {product.description}")
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove_document(product_id)
+
+    def reset(self):
+        with self._lock:
+            self._built = False
+            self.postings.clear()
+            self.doc_terms.clear()
+            self.doc_lengths.clear()
+            self.total_length = 0
+
+    def search(self, query, page=1, page_size=20):
+        self._ensure_built()
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self.doc_terms)
+            if not terms or not count:
+                return SearchResult(total=0)
+            # BM25: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * 文書長 / 平均文書長))
+            base = self.k1 * (1 - self.b)
+            per_length = self.k1 * self.b * count / self.total_length
+            lengths = self.doc_lengths
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                weight = idf * (self.k1 + 1)
+                for product_id, frequency in postings.items():
+                    scores[product_id] += (
+                        weight * frequency / (frequency + base + per_length * lengths[product_id])
+                    )
+        top = heapq.nlargest(page * page_size, scores.items(), key=lambda hit: (hit[1], -hit[0]))
+        return SearchResult(total=len(scores), hits=top[(page - 1) * page_size :])
+
+
+_backends = {}
+
+
+def get_search_backend():
+    path = settings.PRODUCT_SEARCH_BACKEND
+    if not path:
+        if connection.vendor == "mysql":
+            path = "clothes_shop.search.MySQLFullTextBackend"
+        else:
+            path = "clothes_shop.search.InvertedIndexBackend"
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from .images import image_url
 from .models import (
     Brand,
     CartItem,
@@ -33,6 +34,9 @@ class ClothesSerializer(serializers.ModelSerializer):
 
 # Product Serializer (for detail view)
 class ProductSerializer(serializers.ModelSerializer):
+    available_quantity = serializers.IntegerField(read_only=True)
+    images = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
         fields = (
@@ -41,13 +45,30 @@ class ProductSerializer(serializers.ModelSerializer):
             "description",
             "price",
             "stock_quantity",
+            "available_quantity",
             "release_date",
             "size",
             "target",
             "clothes_type",
             "brand",
+            "images",
         )
 
+    def get_images(self, obj):
+        # 変種のファイル名は商品の行に持っているので、URLの組み立てにクエリは要らない
+        if not obj.image_variants:
+            return None
+        return {variant: image_url(name) for variant, name in obj.image_variants.items()}
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # ユーザー指定時のみ、ビューが渡したお気に入り・ウィッシュリストの集合で判定する
+        if "favorite_ids" in self.context:
+            data["is_favorite"] = instance.pk in self.context["favorite_ids"]
+        if "wishlist_ids" in self.context:
+            data["in_wishlist"] = instance.pk in self.context["wishlist_ids"]
+        return data
+
 
 # Product List Serializer (for listing products)
 class ProductListSerializer(serializers.ListSerializer):
@@ -59,12 +80,39 @@ class ProductListSerializer(serializers.ListSerializer):
 
 # Order Serializer (for detail view)
 class OrderSerializer(serializers.ModelSerializer):
-    order_items = serializers.StringRelatedField(many=True)
+    order_items = serializers.StringRelatedField(many=True, read_only=True)
 
     class Meta:
         model = Order
         fields = ("id", "user", "order_date", "order_status", "total_price", "order_items")
 
+    def validate_order_status(self, value):
+        # 支払い・配送の行を作る遷移はtransition_ordersだけが行う
+        current = self.instance.order_status if isinstance(self.instance, Order) else None
+        if current is None and value != Order.STATUS_PENDING:
+            raise serializers.ValidationError(f"New orders must be {Order.STATUS_PENDING}.")
+        if current is not None and value != current:
+            raise serializers.ValidationError(
+                "Use /api/orders/transition/ to change the status of an order."
+            )
+        return value
+
+
+# Archived Order Serializer (for orders moved out by archive_orders)
+class ArchivedOrderSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    user = serializers.IntegerField(source="user_id")
+    order_date = serializers.DateTimeField()
+    order_status = serializers.CharField()
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    order_items = serializers.ListField(child=serializers.DictField())
+    payments = serializers.ListField(child=serializers.DictField())
+    shippings = serializers.ListField(child=serializers.DictField())
+    archived = serializers.SerializerMethodField()
+
+    def get_archived(self, obj):
+        return True
+
 
 # Order List Serializer (for listing orders)
 class OrderListSerializer(serializers.ListSerializer):
@@ -128,7 +176,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = ("order", "payment_date", "payment_option", "payment_status")
+        fields = ("order", "payment_date", "payment_option", "payment_status", "stripe_charge_id")
 
 
 # Shipping Serializer
@@ -166,3 +214,132 @@ class BrandSerializer(serializers.ModelSerializer):
     class Meta:
         model = Brand
         fields = ("id", "brand_name", "created_at", "updated_at")
+
+
+# Sales analytics Serializers (read from SalesRollup)
+class SalesQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    brand = serializers.IntegerField(required=False)
+    clothes_type = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if "start" in attrs and "end" in attrs and attrs["start"] > attrs["end"]:
+            raise serializers.ValidationError({"end": ["Must not be earlier than start."]})
+        return attrs
+
+
+class SalesSummarySerializer(serializers.Serializer):
+    # 集計軸に応じてdate・brand・clothes_typeのいずれか1つだけが出力される
+    date = serializers.DateField(required=False)
+    brand = serializers.IntegerField(required=False)
+    clothes_type = serializers.IntegerField(required=False)
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+# User Summary Serializers (output of summaries.compute_user_summary)
+class SummaryCartSerializer(serializers.Serializer):
+    quantity = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class SummaryOrderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ("id", "order_date", "order_status", "total_price")
+
+
+class SummaryShipmentSerializer(serializers.ModelSerializer):
+    order_status = serializers.CharField(source="order.order_status")
+
+    class Meta:
+        model = Shipping
+        fields = ("order", "order_status", "shipping_tracking_number", "shipping_date")
+
+
+class UserSummarySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    user_name = serializers.CharField()
+    cart = SummaryCartSerializer()
+    favorite_count = serializers.IntegerField()
+    wishlist_count = serializers.IntegerField()
+    recent_orders = SummaryOrderSerializer(many=True)
+    pending_shipments = SummaryShipmentSerializer(many=True)
+
+
+# Inventory Serializers (input of inventory.adjust_inventory)
+class InventoryEntrySerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    delta = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, attrs):
+        if ("delta" in attrs) == ("quantity" in attrs):
+            raise serializers.ValidationError("Give exactly one of delta or quantity.")
+        return attrs
+
+
+class InventoryAdjustSerializer(serializers.Serializer):
+    entries = InventoryEntrySerializer(many=True, min_length=1, max_length=20000)
+
+    def validate_entries(self, entries):
+        product_ids = [entry["product"] for entry in entries]
+        if len(set(product_ids)) != len(product_ids):
+            raise serializers.ValidationError("Each product may appear only once.")
+        return entries
+
+
+class InventoryResultSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    status = serializers.CharField()
+    stock_quantity = serializers.IntegerField(required=False)
+    available_quantity = serializers.IntegerField(required=False)
+
+
+# Order Transition Serializers (input of orders.transition_orders)
+class OrderTransitionEntrySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    shipping_tracking_number = serializers.CharField(max_length=100, required=False)
+    address_code = serializers.CharField(max_length=50, required=False)
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=sorted(Order.ALLOWED_FROM))
+    payment_option = serializers.CharField(max_length=50, required=False, default="")
+    orders = OrderTransitionEntrySerializer(many=True, min_length=1, max_length=20000)
+
+    def validate(self, attrs):
+        order_ids = [entry["id"] for entry in attrs["orders"]]
+        if len(set(order_ids)) != len(order_ids):
+            raise serializers.ValidationError({"orders": ["Each order may appear only once."]})
+        if attrs["status"] == Order.STATUS_SHIPPED and any(
+            "shipping_tracking_number" not in entry for entry in attrs["orders"]
+        ):
+            raise serializers.ValidationError(
+                {"orders": ["shipping_tracking_number is required for shipped orders."]}
+            )
+        if attrs["status"] == Order.STATUS_PAID and not attrs["payment_option"]:
+            raise serializers.ValidationError({"payment_option": ["Required for paid orders."]})
+        return attrs
+
+
+class OrderTransitionResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    result = serializers.CharField()
+    order_status = serializers.CharField(required=False)
+
+
+# Batch Serializers (sub-requests run by BatchView)
+class BatchSubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=["GET"], default="GET")
+    path = serializers.RegexField(r"^/api/", max_length=2000)
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchSubRequestSerializer(many=True, min_length=1, max_length=20)
+
+
+# Product Image Serializer (for uploading a product image)
+class ProductImageSerializer(serializers.Serializer):
+    image = serializers.FileField()
@@ -0,0 +1,115 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import revoke_user_tokens
+from .events import log_event, order_event, product_event
+from .memberships import invalidate_memberships
+from .models import Favorite, Order, Product, Shipping, User, WishList
+from .prices import record_price
+from .search import get_search_backend
+from .summaries import invalidate_user_summary
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+def invalidate_favorites(sender, instance, **kwargs):
+    invalidate_memberships("favorite", instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=WishList)
+def invalidate_wishlists(sender, instance, **kwargs):
+    invalidate_memberships("wishlist", instance.user_id)
+
+
+@receiver(pre_save, sender=User)
+def remember_token_claims(sender, instance, update_fields=None, **kwargs):
+    # トークンに含まれるroleと削除状態が変わる保存だけ、変更前の値を読んでおく
+    if instance.pk is None or (update_fields and not {"role", "is_deleted"} & set(update_fields)):
+        return
+    instance._token_claims = (
+        User.objects.filter(pk=instance.pk).values_list("role", "is_deleted").first()
+    )
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_role_change(sender, instance, **kwargs):
+    claims = getattr(instance, "_token_claims", None)
+    instance._token_claims = None
+    if claims is not None and claims != (instance.role, instance.is_deleted):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    invalidate_user_summary(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=WishList)
+@receiver(post_save, sender=Order)
+def invalidate_user_rows(sender, instance, **kwargs):
+    invalidate_user_summary(instance.user_id)
+
+
+# 注文と配送の削除はアーカイブの一括削除で起きるだけなので、サマリーはTTLでの失効に任せる
+@receiver(post_save, sender=Shipping)
+def invalidate_shipping(sender, instance, **kwargs):
+    order_id = instance.order_id
+
+    def invalidate():
+        # 注文の全列ではなくuser_idだけを読む
+        user_id = Order.objects.filter(pk=order_id).values_list("user_id", flat=True).first()
+        if user_id is not None:
+            invalidate_user_summary(user_id)
+
+    # コミット前に破棄すると、その間に読んだ古いサマリーがキャッシュに残る
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_save, sender=Product)
+def remember_price(sender, instance, update_fields=None, **kwargs):
+    # 価格を含む保存だけ、変更前の価格を読んでおく
+    if instance.pk is None or (update_fields and "price" not in update_fields):
+        return
+    instance._previous_price = (
+        Product.objects.filter(pk=instance.pk).values_list("price", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def record_price_change(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_price", None)
+    instance._previous_price = None
+    if created:
+        record_price(instance, instance.created_at)
+    elif previous is not None and previous != Decimal(str(instance.price)):
+        record_price(instance, instance.updated_at)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_search_backend().index(instance))
+
+
+@receiver(post_save, sender=Product)
+def publish_product_change(sender, instance, **kwargs):
+    # 変更と同じトランザクションで記録するので、コミットされた変更だけが各プロセスから配信される
+    log_event(*product_event(instance))
+
+
+@receiver(post_save, sender=Order)
+def publish_order_change(sender, instance, **kwargs):
+    log_event(*order_event(instance))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove(product_id))
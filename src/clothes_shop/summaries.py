@@ -0,0 +1,105 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import Http404
+
+from .cart_store import cart_store, is_cache_backend
+from .models import CartItem, Favorite, Order, Product, Shipping, User, WishList
+
+SUMMARY_KEY = "summary:{user_id}"
+RECENT_ORDERS = 5
+
+
+def _per_user(queryset, value):
+    """
+    Correlated subquery computing one aggregate over queryset's rows for the outer user.
+    """
+    rows = queryset.filter(user=OuterRef("pk")).order_by().values("user").annotate(value=value)
+    return Subquery(rows.values("value"))
+
+
+def _cart_totals(user_id, user):
+    if not is_cache_backend():
+        return user.cart_quantity, user.cart_total
+    # キャッシュ上のカートはテーブルに未反映の場合があるので、数量はカートから取り価格だけ引く
+    items = {item["product"]: item["quantity"] for item in cart_store.items(user_id)}
+    if not items:
+        return 0, Decimal("0")
+    prices = Product.objects.filter(pk__in=items).values_list("pk", "price")
+    return sum(items.values()), sum((price * items[pk] for pk, price in prices), Decimal("0"))
+
+
+def compute_user_summary(user_id):
+    """
+    Build the account summary with a fixed number of queries: the user row with
+    every count and the cart total as subqueries, the recent orders, and the
+    shipments of orders not yet completed.
+    """
+    user = (
+        User.objects.filter(pk=user_id)
+        .annotate(
+            cart_quantity=Coalesce(
+                _per_user(CartItem.objects, Sum("quantity")), 0, output_field=IntegerField()
+            ),
+            cart_total=Coalesce(
+                _per_user(CartItem.objects, Sum(F("quantity") * F("product__price"))),
+                Decimal("0"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            favorite_count=Coalesce(_per_user(Favorite.objects, Count("pk")), 0),
+            wishlist_count=Coalesce(_per_user(WishList.objects, Count("pk")), 0),
+        )
+        .first()
+    )
+    if user is None:
+        raise Http404
+    cart_quantity, cart_total = _cart_totals(user_id, user)
+    recent_orders = Order.objects.filter(user_id=user_id).order_by("-order_date", "-id")[
+        :RECENT_ORDERS
+    ]
+    pending_shipments = (
+        Shipping.objects.filter(order__user_id=user_id)
+        .exclude(order__order_status=Order.STATUS_COMPLETED)
+        .select_related("order")
+        .order_by("-shipping_date", "-id")
+    )
+    return {
+        "id": user.pk,
+        "user_name": user.user_name,
+        "cart": {"quantity": cart_quantity, "total": cart_total},
+        "favorite_count": user.favorite_count,
+        "wishlist_count": user.wishlist_count,
+        "recent_orders": list(recent_orders),
+        "pending_shipments": list(pending_shipments),
+    }
+
+
+def get_user_summary(user_id, serialize):
+    """
+    Return serialize(compute_user_summary(user_id)), cached for USER_SUMMARY_TTL
+    seconds. Writes to the rows it covers call invalidate_user_summary.
+    """
+    key = SUMMARY_KEY.format(user_id=user_id)
+    data = cache.get(key)
+    if data is None:
+        data = serialize(compute_user_summary(user_id))
+        cache.set(key, data, settings.USER_SUMMARY_TTL)
+    return data
+
+
+def invalidate_user_summary(user_id):
+    invalidate_user_summaries([user_id])
+
+
+def invalidate_user_summaries(user_ids):
+    """
+    Drop the users' cached summaries when the current transaction commits
+    (immediately outside one).
+    """
+    keys = [SUMMARY_KEY.format(user_id=user_id) for user_id in user_ids]
+    # コミット前に破棄すると、コミットまでに読まれた古いサマリーがキャッシュに残る
+    transaction.on_commit(lambda: cache.delete_many(keys))
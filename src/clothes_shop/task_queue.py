@@ -0,0 +1,178 @@
+import functools
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Task
+
+_registry = {}
+
+
+class TaskFunction:
+    """
+    A function registered with @task. Calling it runs it inline; enqueue()
+    stores the call in the Task table for run_workers to pick up.
+    """
+
+    def __init__(self, func, name, max_attempts):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, run_at=None, delay=None, **kwargs):
+        """
+        Queue a call with a single INSERT. Arguments must be JSON-serializable.
+        run_at (a datetime) or delay (seconds) schedules it for later.
+        """
+        if run_at is None:
+            run_at = timezone.now() + timedelta(seconds=delay or 0)
+        return Task.objects.create(
+            name=self.name,
+            args=list(args),
+            kwargs=kwargs,
+            run_at=run_at,
+            max_attempts=self.max_attempts,
+        )
+
+
+def task(func=None, *, name=None, max_attempts=None):
+    """
+    Register a function as a background task, as @task or @task(max_attempts=3).
+    """
+
+    def decorator(func):
+        task_function = TaskFunction(
+            func,
+            name or f"{func.__module__}.{func.__name__}",
+            max_attempts or settings.TASK_MAX_ATTEMPTS,
+        )
+        _registry[task_function.name] = task_function
+        return task_function
+
+    return decorator(func) if func is not None else decorator
+
+
+def retry_delay(attempts):
+    # 指数バックオフ。同時に失敗したタスクが一斉に再実行されないよう揺らぎを入れる
+    delay = min(settings.TASK_RETRY_BACKOFF * 2 ** (attempts - 1), settings.TASK_RETRY_MAX_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def claim_tasks(worker_id, batch_size=1, now=None):
+    """
+    Lock up to batch_size due tasks for worker_id. Rows locked by another
+    worker's claim are skipped rather than waited on.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=Task.STATUS_QUEUED, run_at__lte=now)
+            .order_by("run_at", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        Task.objects.filter(id__in=ids).update(
+            status=Task.STATUS_RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+            updated_at=now,
+        )
+    return list(Task.objects.filter(id__in=ids).order_by("run_at", "id"))
+
+
+def run_task(task):
+    """
+    Run a claimed task. It is deleted on success, and on failure re-queued
+    with backoff until max_attempts, then kept with status "failed".
+    Returns True on success.
+    """
+    # ロックが期限切れで他のワーカーに渡った場合は結果を書き込まない
+    claimed = Task.objects.filter(pk=task.pk, status=Task.STATUS_RUNNING, locked_by=task.locked_by)
+    try:
+        task_function = _registry.get(task.name)
+        if task_function is None:
+            raise LookupError(f"Unknown task: {task.name}")
+        task_function(*task.args, **task.kwargs)
+    except Exception:
+        now = timezone.now()
+        if task.attempts >= task.max_attempts:
+            changes = {"status": Task.STATUS_FAILED}
+        else:
+            changes = {"status": Task.STATUS_QUEUED, "run_at": now + retry_delay(task.attempts)}
+        claimed.update(
+            locked_by="",
+            locked_at=None,
+            last_error=traceback.format_exc(),
+            updated_at=now,
+            **changes,
+        )
+        return False
+    claimed.delete()
+    return True
+
+
+def requeue_stale_tasks(now=None):
+    """
+    Release tasks whose worker has held them longer than TASK_LOCK_TIMEOUT,
+    e.g. because it was killed. Returns the number of released tasks.
+    """
+    now = now or timezone.now()
+    stale = Task.objects.filter(
+        status=Task.STATUS_RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.TASK_LOCK_TIMEOUT),
+    )
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Task.STATUS_FAILED, locked_by="", locked_at=None, updated_at=now
+    )
+    requeued = stale.update(
+        status=Task.STATUS_QUEUED, locked_by="", locked_at=None, run_at=now, updated_at=now
+    )
+    return failed + requeued
+
+
+class Worker:
+    """
+    Claims and runs tasks until stop() is called (or, with once=True, until no
+    task is due).
+    """
+
+    def __init__(self, worker_id=None, batch_size=1, poll_interval=1.0):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stopping = False
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self, once=False):
+        autodiscover_modules("tasks")
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            tasks = claim_tasks(self.worker_id, self.batch_size)
+            for claimed in tasks:
+                run_task(claimed)
+                processed += 1
+            if not tasks:
+                requeue_stale_tasks()
+                if once:
+                    break
+                time.sleep(self.poll_interval)
+        return processed
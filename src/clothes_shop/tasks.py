@@ -0,0 +1,53 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.mail import send_mail
+
+from .images import render_variants
+from .models import Product, User
+from .task_queue import task
+
+EMAIL_VERIFICATION_SALT = "clothes_shop.email_verification"
+
+
+def make_email_verification_token(user):
+    return signing.dumps(
+        {"user": user.pk, "email": user.email_address}, salt=EMAIL_VERIFICATION_SALT
+    )
+
+
+def load_email_verification_token(token):
+    """
+    Return the payload of a token from make_email_verification_token.
+    Raises signing.BadSignature (or SignatureExpired) for invalid tokens.
+    """
+    return signing.loads(
+        token, salt=EMAIL_VERIFICATION_SALT, max_age=settings.EMAIL_VERIFICATION_MAX_AGE
+    )
+
+
+@task
+def send_verification_email(user_id):
+    user = User.objects.filter(
+        pk=user_id, is_deleted=False, email_validated_at__isnull=True
+    ).first()
+    if user is None:
+        return
+    query = urlencode({"token": make_email_verification_token(user)})
+    url = f"{settings.EMAIL_VERIFICATION_URL}?{query}"
+    send_mail(
+        "メールアドレスの確認",
+        f"{user.user_name} 様\n\n以下のリンクからメールアドレスの確認を完了してください。\n{url}\n",
+        settings.DEFAULT_FROM_EMAIL,
+        [user.email_address],
+    )
+
+
+@task
+def generate_product_image_variants(product_id, original):
+    # 生成中に別の画像へ差し替えられていれば、その画像のタスクに任せる
+    if not Product.objects.filter(pk=product_id, image=original).exists():
+        return
+    variants = render_variants(original)
+    Product.objects.filter(pk=product_id, image=original).update(image_variants=variants)
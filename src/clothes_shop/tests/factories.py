@@ -0,0 +1,48 @@
+from unittest import mock
+
+from django.test import override_settings
+from django.utils import timezone
+
+from clothes_shop.models import Brand, ClothesType, Product, Size, Target, User
+
+
+def create_user(name="taro", role="customer"):
+    return User.objects.create(
+        user_name=name, email_address=f"{name}@example.com", role=role, address="Tokyo"
+    )
+
+
+def create_product(title="Tシャツ", stock_quantity=5, price=1500, brand=None, **kwargs):
+    return Product.objects.create(
+        size=kwargs.pop("size", None) or Size.objects.create(size_name="M"),
+        target=kwargs.pop("target", None) or Target.objects.create(target_type="メンズ"),
+        clothes_type=kwargs.pop("clothes_type", None)
+        or ClothesType.objects.create(clothes_type_name="シャツ"),
+        brand=brand or Brand.objects.create(brand_name="NIKE"),
+        title=title,
+        description=kwargs.pop("description", "コットン"),
+        category=kwargs.pop("category", "tops"),
+        price=price,
+        release_date=timezone.now(),
+        stock_quantity=stock_quantity,
+        **kwargs,
+    )
+
+
+# 書き戻し前のカートを預けるキャッシュ (CART_BACKEND = "cache" のテスト用)
+DURABLE_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "durable-carts",
+    }
+}
+
+
+def durable_cart_cache(test):
+    """
+    Run test (a test method or TestCase) on DURABLE_CACHES, accepted by the cart
+    store as a shared, persistent cache.
+    """
+    backends = {DURABLE_CACHES["default"]["BACKEND"]}
+    test = mock.patch("clothes_shop.cart_store.DURABLE_CACHE_BACKENDS", backends)(test)
+    return override_settings(CACHES=DURABLE_CACHES)(test)
@@ -0,0 +1,117 @@
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from clothes_shop.counts import estimated_row_count, fast_count
+from clothes_shop.models import Order, OrderItem, Product
+from clothes_shop.tests.factories import create_product, create_user
+
+
+class AdminTest(TestCase):
+
+    def setUp(self):
+        admin_user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin_user)
+
+    def changelist(self, model, **params):
+        opts = model._meta
+        return self.client.get(
+            reverse(f"admin:{opts.app_label}_{opts.model_name}_changelist"), params
+        )
+
+    def test_all_models_registered(self):
+        """全てのモデルの一覧画面が表示できるかテスト"""
+        create_product()
+        for model in admin.site._registry:
+            if model._meta.app_label != "clothes_shop":
+                continue
+            with self.subTest(model=model.__name__):
+                self.assertEqual(self.changelist(model).status_code, 200)
+                self.assertEqual(self.changelist(model, q="abc").status_code, 200)
+
+    def test_changelist_query_count_does_not_grow(self):
+        """行数が増えても一覧画面のクエリ数が変わらないかテスト"""
+        user = create_user()
+
+        def add_rows():
+            order = Order.objects.create(user=user, order_status="paid", total_price=1500)
+            OrderItem.objects.create(
+                order=order, product=create_product(), quantity=1, unit_price=1500
+            )
+
+        add_rows()
+        counts = {}
+        for model in (Product, Order, OrderItem):
+            with CaptureQueriesContext(connection) as queries:
+                self.changelist(model)
+            counts[model] = len(queries)
+        for _ in range(5):
+            add_rows()
+        for model in (Product, Order, OrderItem):
+            with self.subTest(model=model.__name__):
+                with self.assertNumQueries(counts[model]):
+                    self.changelist(model)
+
+    def test_order_status_is_read_only(self):
+        """注文の状態は管理画面から変更できず、追加した注文はpendingになるかテスト"""
+        user = create_user()
+        order = Order.objects.create(user=user, order_status="pending", total_price=1500)
+        url = reverse("admin:clothes_shop_order_change", args=[order.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("order_status", response.context["adminform"].form.fields)
+
+        data = {
+            "user": user.pk,
+            "order_status": "completed",
+            "total_price": "2000",
+        }
+        for prefix in ("order_items", "payment_set", "shipping_set"):
+            data.update({f"{prefix}-TOTAL_FORMS": "0", f"{prefix}-INITIAL_FORMS": "0"})
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual((order.order_status, order.total_price), ("pending", 2000))
+        response = self.client.post(reverse("admin:clothes_shop_order_add"), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.latest("id").order_status, "pending")
+
+    @override_settings(COUNT_ESTIMATE_THRESHOLD=2)
+    def test_filtered_changelist_count_is_capped(self):
+        """絞り込み・検索した一覧画面の件数は上限までしか数えないかテスト"""
+        for i in range(5):
+            create_product(title=f"シャツ{i}")
+        with mock.patch("clothes_shop.counts._refresh_in_background"):
+            for params in ({"q": "シャツ"}, {"is_deleted__exact": "0"}):
+                with self.subTest(params=params):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.changelist(Product, **params)
+                    self.assertEqual(response.status_code, 200)
+                    counts = [q["sql"] for q in queries if "COUNT(" in q["sql"]]
+                    self.assertTrue(counts)
+                    self.assertTrue(all("LIMIT 3" in sql for sql in counts), counts)
+
+
+class FastCountTest(TestCase):
+
+    def setUp(self):
+        create_product(title="シャツ")
+        create_product(title="パンツ")
+
+    def test_no_estimate_on_sqlite(self):
+        """統計情報を持たないバックエンドでは正確な件数を数えるかテスト"""
+        self.assertIsNone(estimated_row_count(Product))
+        self.assertEqual(fast_count(Product.objects.all()), 2)
+
+    @override_settings(COUNT_ESTIMATE_THRESHOLD=1000)
+    def test_estimate_only_for_large_unfiltered_tables(self):
+        """概算値は絞り込みのない大きなテーブルの件数にだけ使われるかテスト"""
+        with mock.patch("clothes_shop.counts.estimated_row_count", return_value=5000):
+            self.assertEqual(fast_count(Product.objects.all()), 5000)
+            self.assertEqual(fast_count(Product.objects.filter(title="シャツ")), 1)
+        with mock.patch("clothes_shop.counts.estimated_row_count", return_value=10):
+            self.assertEqual(fast_count(Product.objects.all()), 2)
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from clothes_shop.analytics import refresh_sales_rollups
+from clothes_shop.models import Brand, ClothesType, Order, OrderItem, SalesRollup
+from clothes_shop.orders import transition_orders
+from clothes_shop.tests.factories import create_product, create_user
+
+
+class SalesRollupTests(APITestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.nike = Brand.objects.create(brand_name="NIKE")
+        self.adidas = Brand.objects.create(brand_name="adidas")
+        self.shirts = ClothesType.objects.create(clothes_type_name="シャツ")
+        self.shirt = create_product(brand=self.nike, clothes_type=self.shirts)
+        self.shoes = create_product(title="スニーカー", brand=self.adidas)
+
+    def _order(self, day, *items, status="paid"):
+        order = Order.objects.create(user=self.user, order_status=status, total_price=0)
+        created_at = datetime(2024, 5, day, 12, tzinfo=timezone.utc)
+        Order.objects.filter(pk=order.pk).update(created_at=created_at, updated_at=created_at)
+        for product, quantity, unit_price in items:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=quantity, unit_price=unit_price
+            )
+        return order
+
+    def test_refresh_is_incremental(self):
+        """前回以降の注文だけが集計に加算されるかテスト"""
+        self._order(1, (self.shirt, 2, 1000), (self.shoes, 1, 5000))
+        self.assertEqual(refresh_sales_rollups(), 1)
+        self._order(1, (self.shirt, 1, 1000))
+        self._order(2, (self.shirt, 3, 900))
+        self.assertEqual(refresh_sales_rollups(), 2)
+        self.assertEqual(refresh_sales_rollups(), 0)
+
+        rollup = SalesRollup.objects.get(date="2024-05-01", brand=self.nike)
+        self.assertEqual((rollup.units, rollup.revenue), (3, 3000))
+        self.assertEqual(SalesRollup.objects.count(), 3)
+
+    def test_only_revenue_statuses_count(self):
+        """支払い済み以降の注文だけが売上になり、キャンセルされると差し引かれるかテスト"""
+        paid = self._order(1, (self.shirt, 2, 1000))
+        pending = self._order(1, (self.shirt, 1, 1000), status="pending")
+        self._order(1, (self.shirt, 5, 1000), status="cancelled")
+        self.assertEqual(refresh_sales_rollups(), 3)
+        rollup = SalesRollup.objects.get(brand=self.nike)
+        self.assertEqual((rollup.units, rollup.revenue), (2, 2000))
+
+        later = datetime(2024, 5, 3, tzinfo=timezone.utc)
+        transition_orders([{"id": paid.pk}], Order.STATUS_CANCELLED)
+        transition_orders([{"id": pending.pk}], Order.STATUS_PAID)
+        Order.objects.filter(pk__in=[paid.pk, pending.pk]).update(updated_at=later)
+        self.assertEqual(refresh_sales_rollups(), 2)
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.units, rollup.revenue), (1, 1000))
+
+        # 状態が変わらない更新では加算し直さない
+        Order.objects.filter(pk=pending.pk).update(updated_at=later + timedelta(days=1))
+        refresh_sales_rollups()
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.units, rollup.revenue), (1, 1000))
+
+    def test_rebuild_command(self):
+        """再構築で集計をやり直せるかテスト"""
+        self._order(1, (self.shirt, 2, 1000))
+        refresh_sales_rollups()
+        SalesRollup.objects.update(units=0)
+        call_command("refresh_sales_rollups", "--rebuild", stdout=StringIO())
+        self.assertEqual(SalesRollup.objects.get().units, 2)
+
+    def test_api_reads_rollups(self):
+        """集計APIが日別・ブランド別の売上を返すかテスト"""
+        self._order(1, (self.shirt, 2, 1000), (self.shoes, 1, 5000))
+        self._order(2, (self.shirt, 1, 1000))
+        refresh_sales_rollups()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("sales-by-date"))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            response.data,
+            [
+                {"date": "2024-05-01", "units": 3, "revenue": "7000.00"},
+                {"date": "2024-05-02", "units": 1, "revenue": "1000.00"},
+            ],
+        )
+
+        response = self.client.get(reverse("sales-by-brand"), {"start": "2024-05-02"})
+        self.assertEqual(response.data, [{"brand": self.nike.pk, "units": 1, "revenue": "1000.00"}])
+
+        response = self.client.get(
+            reverse("sales-by-clothes-type"), {"start": "2024-05-02", "end": "2024-05-01"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
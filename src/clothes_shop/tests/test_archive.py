@@ -0,0 +1,134 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from clothes_shop.archive import DESTINATION_FILE, archive_orders, get_archived_order
+from clothes_shop.models import (
+    ArchivedOrder,
+    ArchivedPayment,
+    Brand,
+    ClothesType,
+    Order,
+    OrderItem,
+    Payment,
+    Product,
+    Size,
+    Target,
+    User,
+)
+
+
+class ArchiveOrdersTests(APITestCase):
+
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        self.user = User.objects.create(
+            user_name="taro", email_address="taro@example.com", role="customer", address="Tokyo"
+        )
+        self.product = Product.objects.create(
+            size=Size.objects.create(size_name="M"),
+            target=Target.objects.create(target_type="メンズ"),
+            clothes_type=ClothesType.objects.create(clothes_type_name="シャツ"),
+            brand=Brand.objects.create(brand_name="NIKE"),
+            title="Tシャツ",
+            description="コットン",
+            category="tops",
+            price=1500,
+            release_date=timezone.now(),
+            stock_quantity=10,
+        )
+        self.old_order = self._create_order(Order.STATUS_COMPLETED, days_ago=400)
+        self.recent_order = self._create_order(Order.STATUS_COMPLETED, days_ago=10)
+        self.open_order = self._create_order("pending", days_ago=400)
+
+    def _create_order(self, order_status, days_ago):
+        order = Order.objects.create(user=self.user, order_status=order_status, total_price=3000)
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, unit_price=1500)
+        Payment.objects.create(
+            order=order,
+            payment_date=timezone.now(),
+            payment_option="card",
+            payment_status="succeeded",
+        )
+        Order.objects.filter(pk=order.pk).update(
+            created_at=timezone.now() - timedelta(days=days_ago)
+        )
+        return order
+
+    def test_archive_to_table(self):
+        """古い完了済み注文だけがアーカイブテーブルへ移動するかテスト"""
+        call_command("archive_orders", "--days", "365", "--chunk-size", "1", stdout=StringIO())
+        self.assertFalse(Order.objects.filter(pk=self.old_order.pk).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id=self.old_order.pk).exists())
+        self.assertTrue(Order.objects.filter(pk=self.recent_order.pk).exists())
+        self.assertTrue(Order.objects.filter(pk=self.open_order.pk).exists())
+        archived = ArchivedOrder.objects.get(pk=self.old_order.pk)
+        self.assertEqual(len(archived.payload["order_items"]), 1)
+        self.assertEqual(len(archived.payload["payments"]), 1)
+        payment_id = archived.payload["payments"][0]["id"]
+        self.assertEqual(ArchivedPayment.objects.get(pk=payment_id).order_id, self.old_order.pk)
+
+    def test_archive_to_file(self):
+        """ファイルへアーカイブした注文をIDで読み出せるかテスト"""
+        cutoff = timezone.now() - timedelta(days=365)
+        with self.captureOnCommitCallbacks(execute=True):
+            archived = archive_orders(
+                cutoff, destination=DESTINATION_FILE, archive_dir=self.archive_dir.name
+            )
+        self.assertEqual(archived, 1)
+        self.assertFalse(ArchivedOrder.objects.exists())
+        record = get_archived_order(self.old_order.pk, archive_dir=self.archive_dir.name)
+        self.assertEqual(record["order_status"], Order.STATUS_COMPLETED)
+        self.assertEqual(record["order_items"][0]["quantity"], 2)
+
+    def test_archive_file_is_in_place_before_commit(self):
+        """削除のコミット前にアーカイブファイルが確定しているかテスト"""
+        cutoff = timezone.now() - timedelta(days=365)
+        with self.captureOnCommitCallbacks(execute=False):
+            archive_orders(cutoff, destination=DESTINATION_FILE, archive_dir=self.archive_dir.name)
+        names = os.listdir(self.archive_dir.name)
+        self.assertEqual(len(names), 1)
+        self.assertFalse(names[0].endswith(".tmp"))
+        record = get_archived_order(self.old_order.pk, archive_dir=self.archive_dir.name)
+        self.assertEqual(record["id"], self.old_order.pk)
+
+    def test_rolled_back_archive_file(self):
+        """ロールバックで残ったファイルを読まず、再アーカイブ時に削除するかテスト"""
+        cutoff = timezone.now() - timedelta(days=365)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                archive_orders(
+                    cutoff, destination=DESTINATION_FILE, archive_dir=self.archive_dir.name
+                )
+                raise RuntimeError
+        self.assertTrue(Order.objects.filter(pk=self.old_order.pk).exists())
+        self.assertEqual(len(os.listdir(self.archive_dir.name)), 1)
+        self.assertIsNone(get_archived_order(self.old_order.pk, archive_dir=self.archive_dir.name))
+
+        archive_orders(cutoff, destination=DESTINATION_FILE, archive_dir=self.archive_dir.name)
+        self.assertEqual(len(os.listdir(self.archive_dir.name)), 1)
+        record = get_archived_order(self.old_order.pk, archive_dir=self.archive_dir.name)
+        self.assertEqual(record["id"], self.old_order.pk)
+
+    def test_order_detail_reads_archived_order(self):
+        """アーカイブ済みの注文を注文詳細APIで取得できるかテスト"""
+        archive_orders(timezone.now() - timedelta(days=365))
+        with override_settings(ORDER_ARCHIVE_DIR=self.archive_dir.name):
+            url = reverse("order-detail", kwargs={"pk": self.old_order.pk})
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.data["archived"])
+            self.assertEqual(response.data["user"], self.user.pk)
+
+            response = self.client.get(reverse("order-detail", kwargs={"pk": 9999}))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,96 @@
+from io import StringIO
+
+from django.core import signing
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from clothes_shop.authentication import issue_token, load_token, revocations, revoke_token
+from clothes_shop.tests.factories import create_user
+
+
+class WhoAmIView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({"id": request.user.id, "role": request.user.role})
+
+
+class SignedTokenAuthenticationTest(APITestCase):
+
+    def setUp(self):
+        revocations.invalidate()
+        self.user = create_user(role="staff")
+        self.view = WhoAmIView.as_view()
+        self.factory = APIRequestFactory()
+
+    def get(self, token):
+        request = self.factory.get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return self.view(request)
+
+    def test_authenticate_without_db_reads(self):
+        """トークンだけでユーザーとroleが分かり、DBを読まずに認証できるかテスト"""
+        token = issue_token(self.user)
+        self.get(token)
+        with self.assertNumQueries(0):
+            response = self.get(token)
+        self.assertEqual(response.data, {"id": self.user.pk, "role": "staff"})
+
+    def test_invalid_tokens(self):
+        """改ざん・期限切れのトークンや認証なしは401になるかテスト"""
+        token = issue_token(self.user)
+        self.assertEqual(self.get(token[:-2] + "xx").status_code, 401)
+        with override_settings(API_TOKEN_MAX_AGE=-1):
+            self.assertEqual(self.get(issue_token(self.user)).status_code, 401)
+        response = self.view(self.factory.get("/"))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["WWW-Authenticate"], "Bearer")
+
+    def test_revoke_token(self):
+        """失効させたトークンだけが使えなくなるかテスト"""
+        token, other = issue_token(self.user), issue_token(self.user)
+        self.assertEqual(self.get(token).status_code, 200)
+        revoke_token(token)
+        self.assertEqual(self.get(token).status_code, 401)
+        self.assertEqual(self.get(other).status_code, 200)
+
+    def test_role_change_and_deletion_revoke_tokens(self):
+        """roleの変更や削除でそれまでのトークンが失効するかテスト"""
+        token = issue_token(self.user)
+        self.user.address = "Osaka"
+        self.user.save()
+        self.assertEqual(self.get(token).status_code, 200)
+
+        self.user.role = "customer"
+        self.user.save()
+        self.assertEqual(self.get(token).status_code, 401)
+        token = issue_token(self.user)
+        self.assertEqual(self.get(token).data["role"], "customer")
+
+        self.user.is_deleted = True
+        self.user.save()
+        self.assertEqual(self.get(token).status_code, 401)
+
+    def test_api_routes_accept_tokens(self):
+        """既存のAPIがトークン付きでも認証なしでも使えるかテスト"""
+        url = reverse("brand-list-create")
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {issue_token(self.user)}")
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer invalid")
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_commands(self):
+        """issue_token・revoke_tokenコマンドでトークンを発行・失効できるかテスト"""
+        out = StringIO()
+        call_command("issue_token", self.user.pk, "--max-age", "60", stdout=out)
+        token = out.getvalue().strip()
+        self.assertEqual(load_token(token)["uid"], self.user.pk)
+        call_command("revoke_token", "--user", self.user.pk, stdout=StringIO())
+        self.assertEqual(self.get(token).status_code, 401)
+        with self.assertRaises(signing.BadSignature):
+            load_token("invalid")
@@ -0,0 +1,102 @@
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from clothes_shop.autocomplete import (
+    AutocompleteIndex,
+    build_snapshot,
+    make_refs,
+    rebuild_index,
+    write_snapshot,
+)
+from clothes_shop.models import Brand, Order, OrderItem
+from clothes_shop.tests.factories import create_product, create_user
+
+
+class AutocompleteSnapshotTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, "index.bin")
+
+    def _write(self, rows):
+        refs = make_refs(rows)
+        write_snapshot(self.path, *build_snapshot(refs))
+        return AutocompleteIndex(self.path)
+
+    def test_prefix_match_ordered_by_weight(self):
+        """前方一致した候補が人気順に返り、単語途中からも一致するかテスト"""
+        index = self._write(
+            [
+                (0, 1, 1, 5, "Slim Denim".encode()),
+                (0, 2, 1, 9, "Denim Jacket".encode()),
+                (0, 3, 1, 1, "デニムパンツ".encode()),
+                (1, 1, 1, 15, "NIKE".encode()),
+            ]
+        )
+        self.assertEqual([s["id"] for s in index.suggest("den")], [2, 1])
+        self.assertEqual(index.suggest("デニ")[0]["label"], "デニムパンツ")
+        self.assertEqual(index.suggest("ni")[0]["type"], "brand")
+        self.assertEqual(index.suggest("zzz"), [])
+
+    def test_wide_prefix_uses_precomputed_top(self):
+        """候補が多い接頭辞でも事前計算した上位候補を返すかテスト"""
+        rows = [(0, i, 1, i, f"shirt {i}".encode()) for i in range(1, 3000)]
+        index = self._write(rows)
+        self.assertEqual([s["id"] for s in index.suggest("s", limit=3)], [2999, 2998, 2997])
+
+
+class AutocompleteApiTests(APITestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.settings = override_settings(
+            AUTOCOMPLETE_PATH=os.path.join(self.tmp_dir.name, "index.bin")
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.brand = Brand.objects.create(brand_name="Shirtmaker")
+        self.plain = create_product(title="Shirt Plain", brand=self.brand)
+        self.striped = create_product(title="Shirt Striped", brand=self.brand)
+        self.user = create_user()
+
+    def _sell(self, product, quantity):
+        order = Order.objects.create(user=self.user, order_status="pending", total_price=0)
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=1)
+
+    def test_incremental_rebuild(self):
+        """新しい注文・商品の変更が増分更新で反映されるかテスト"""
+        self._sell(self.plain, 1)
+        rebuild_index()
+        self._sell(self.striped, 5)
+        self.plain.title = "Shirt Oxford"
+        self.plain.save()
+        rebuild_index()
+
+        response = self.client.get(reverse("autocomplete"), {"q": "shirt"})
+        self.assertEqual(
+            [(s["type"], s["label"], s["weight"]) for s in response.data],
+            [
+                ("brand", "Shirtmaker", 6),
+                ("product", "Shirt Striped", 5),
+                ("product", "Shirt Oxford", 1),
+            ],
+        )
+
+    def test_long_labels_are_not_truncated(self):
+        """255文字の日本語の商品名も切り詰めずに返すかテスト"""
+        rebuild_index()
+        title = "シャツ" + "あ" * 252
+        self.plain.title = title
+        self.plain.save()
+        # 増分更新で既存の短いラベルと合わせても切り詰めない
+        rebuild_index()
+        suggestions = AutocompleteIndex().suggest("シャツ")
+        self.assertEqual([s["label"] for s in suggestions], [title])
+        rebuild_index(full=True)
+        self.assertEqual(AutocompleteIndex().suggest("シャツ")[0]["label"], title)
@@ -0,0 +1,69 @@
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from clothes_shop.models import Rating
+from clothes_shop.tests.factories import create_product, create_user
+
+
+class MultiGetTests(APITestCase):
+
+    def setUp(self):
+        self.products = [create_product(title=f"シャツ{i}") for i in range(3)]
+
+    def test_ids_fetched_in_one_query(self):
+        """?ids=で指定した商品だけを1クエリで返すかテスト"""
+        ids = [self.products[0].pk, self.products[2].pk]
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("product-list-create"), {"ids": f"{ids[0]},{ids[1]}"}
+            )
+        self.assertEqual(sorted(item["id"] for item in response.data), ids)
+
+    def test_invalid_ids(self):
+        """?ids=に整数以外を渡すと400になるかテスト"""
+        response = self.client.get(reverse("brand-list-create"), {"ids": "1,a"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BatchTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.product = create_product()
+        self.rating = Rating.objects.create(user=self.user, product=self.product, rating=5)
+
+    def test_sub_requests_run_in_order(self):
+        """複数のサブリクエストの結果が順番どおり1回の応答で返るかテスト"""
+        product_path = reverse("product-detail", args=[self.product.pk])
+        requests = [
+            {"path": product_path},
+            {"method": "GET", "path": reverse("brand-detail", args=[self.product.brand_id])},
+            {"path": f"{reverse('rating-list-create')}?ids={self.rating.pk}"},
+            {"path": "/api/nothing/"},
+            {"path": product_path},
+        ]
+        response = self.client.post(reverse("batch"), {"requests": requests}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data
+        self.assertEqual([result["status"] for result in results], [200, 200, 200, 404, 200])
+        self.assertEqual(results[0]["body"]["title"], self.product.title)
+        self.assertEqual(results[1]["body"]["brand_name"], "NIKE")
+        self.assertEqual(results[2]["body"][0]["rating"], 5)
+        self.assertEqual(results[4], results[0])
+
+    def test_only_read_requests(self):
+        """GET以外や/api/以外のサブリクエストは受け付けないかテスト"""
+        for sub in [{"method": "POST", "path": "/api/orders/"}, {"path": "/admin/"}]:
+            response = self.client.post(reverse("batch"), {"requests": [sub]}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_not_batchable_views(self):
+        """非同期のイベント配信などDRF以外のビューは400の結果になるかテスト"""
+        requests = [{"path": reverse("events")}, {"path": reverse("product-list-create")}]
+        response = self.client.post(reverse("batch"), {"requests": requests}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result["status"] for result in response.data], [400, 200])
+        self.assertEqual(response.data[0]["body"], {"detail": "Not batchable."})
@@ -0,0 +1,204 @@
+from unittest import mock
+
+from django.core import checks
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from clothes_shop.cart_store import CART_KEY, CacheCartStore, is_cache_backend
+from clothes_shop.models import CartItem, Product, StockReservation
+from clothes_shop.reservations import InsufficientStock
+from clothes_shop.tests.factories import create_product, create_user, durable_cart_cache
+
+
+@durable_cart_cache
+class CacheCartStoreTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.store = CacheCartStore()
+        self.user = create_user()
+        self.shirt = create_product(title="シャツ", stock_quantity=10)
+        self.pants = create_product(title="パンツ", stock_quantity=10)
+
+    def test_changes_stay_in_cache_until_flush(self):
+        """フラッシュするまでCartItemテーブルに書き込まれないかテスト"""
+        self.store.add(self.user.pk, self.shirt.pk, 1)
+        self.store.add(self.user.pk, self.shirt.pk, 2)
+        self.store.add(self.user.pk, self.pants.pk, 1)
+        self.store.remove(self.user.pk, self.pants.pk)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(
+            self.store.items(self.user.pk),
+            [{"user": self.user.pk, "product": self.shirt.pk, "quantity": 3}],
+        )
+
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(
+            list(CartItem.objects.values_list("product_id", "quantity")), [(self.shirt.pk, 3)]
+        )
+        self.assertEqual(self.store.dirty_users(), [])
+
+    def test_add_writes_nothing_to_database(self):
+        """カートへの追加は在庫の確認だけで、テーブルへ書き込まないかテスト"""
+        self.store.add(self.user.pk, self.shirt.pk, 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.store.add(self.user.pk, self.shirt.pk, 2)
+            self.store.remove(self.user.pk, self.shirt.pk)
+        self.assertEqual([query["sql"].split()[0] for query in queries], ["SELECT"])
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_add_rejects_unavailable_stock(self):
+        """確保済みの分を除いた在庫を超える追加を拒否するかテスト"""
+        other = create_user(name="jiro")
+        self.store.add(other.pk, self.shirt.pk, 8)
+        self.store.flush()
+        with self.assertRaises(InsufficientStock):
+            self.store.add(self.user.pk, self.shirt.pk, 3)
+        self.store.add(self.user.pk, self.shirt.pk, 2)
+        # 自分の確保分は差し引いて数える
+        self.assertEqual(self.store.set_quantity(other.pk, self.shirt.pk, 9), 9)
+
+    def test_flush_holds_stock(self):
+        """書き戻し時にカートの数量どおり在庫を確保するかテスト"""
+        self.store.add(self.user.pk, self.shirt.pk, 3)
+        self.store.add(self.user.pk, self.pants.pk, 1)
+        self.store.flush()
+        self.shirt.refresh_from_db()
+        self.assertEqual(self.shirt.reserved_quantity, 3)
+
+        self.store.set_quantity(self.user.pk, self.shirt.pk, 1)
+        self.store.remove(self.user.pk, self.pants.pk)
+        self.store.flush()
+        self.assertEqual(
+            dict(Product.objects.values_list("pk", "reserved_quantity")),
+            {self.shirt.pk: 1, self.pants.pk: 0},
+        )
+        self.assertEqual(
+            list(StockReservation.objects.values_list("product_id", "quantity")),
+            [(self.shirt.pk, 1)],
+        )
+
+    def test_flush_skips_holds_sold_out_meanwhile(self):
+        """書き戻しまでに売り切れた分は確保せず、他のカートの書き戻しを続けるかテスト"""
+        other = create_user(name="jiro")
+        self.store.add(self.user.pk, self.shirt.pk, 6)
+        self.store.add(other.pk, self.pants.pk, 2)
+        Product.objects.filter(pk=self.shirt.pk).update(stock_quantity=5)
+        self.assertEqual(self.store.flush(), 2)
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(
+            dict(Product.objects.values_list("pk", "reserved_quantity")),
+            {self.shirt.pk: 0, self.pants.pk: 2},
+        )
+
+    def test_flush_reconciles_existing_rows(self):
+        """既存行の更新・削除を一括で反映できるかテスト"""
+        CartItem.objects.create(user=self.user, product=self.shirt, quantity=1)
+        CartItem.objects.create(user=self.user, product=self.pants, quantity=1)
+        self.store.set_quantity(self.user.pk, self.shirt.pk, 4)
+        self.store.remove(self.user.pk, self.pants.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.store._write({self.user.pk: cache.get(CART_KEY.format(user_id=self.user.pk))})
+        # SAVEPOINTを除き、CartItemのSELECT・DELETE・UPDATEの3文
+        statements = [query["sql"] for query in queries if "SAVEPOINT" not in query["sql"]]
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(
+            list(CartItem.objects.values_list("product_id", "quantity")), [(self.shirt.pk, 4)]
+        )
+
+    def test_failed_flush_keeps_changes_pending(self):
+        """書き戻しに失敗しても未反映の印が残り、次回のフラッシュで書き戻されるかテスト"""
+        self.store.add(self.user.pk, self.shirt.pk, 2)
+        self.assertEqual(self.store.dirty_users(), [self.user.pk])
+        with mock.patch.object(CacheCartStore, "_write", side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                self.store.flush()
+        self.assertEqual(self.store.dirty_users(), [self.user.pk])
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_change_during_flush_stays_pending(self):
+        """書き戻し中に変更されたカートは未反映のまま残るかテスト"""
+        self.store.add(self.user.pk, self.shirt.pk, 1)
+        write = CacheCartStore._write
+
+        def write_and_change(store, carts):
+            changed = write(store, carts)
+            self.store.add(self.user.pk, self.shirt.pk, 1)
+            return changed
+
+        with mock.patch.object(CacheCartStore, "_write", write_and_change):
+            self.store.flush()
+        self.assertEqual(self.store.dirty_users(), [self.user.pk])
+        self.store.flush()
+        self.assertEqual(self.store.dirty_users(), [])
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_reload_from_table_after_cache_loss(self):
+        """キャッシュが消えてもテーブルの内容から復元できるかテスト"""
+        self.store.add(self.user.pk, self.shirt.pk, 2)
+        self.store.flush()
+        cache.clear()
+        self.assertEqual(self.store.items(self.user.pk)[0]["quantity"], 2)
+
+
+class CartBackendCheckTest(TestCase):
+
+    @override_settings(CART_BACKEND="cache")
+    def test_requires_durable_cache(self):
+        """プロセスごとに消えるキャッシュやDBキャッシュではカートのキャッシュ保存を拒否するかテスト"""
+        for backend in ["locmem.LocMemCache", "db.DatabaseCache"]:
+            caches = {"default": {"BACKEND": f"django.core.cache.backends.{backend}"}}
+            with override_settings(CACHES=caches), self.assertRaises(ImproperlyConfigured):
+                is_cache_backend()
+        errors = checks.run_checks(tags=[checks.Tags.caches])
+        self.assertIn("clothes_shop.E001", [error.id for error in errors])
+        redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}
+        with override_settings(CACHES=redis):
+            self.assertTrue(is_cache_backend())
+            self.assertEqual(checks.run_checks(tags=[checks.Tags.caches]), [])
+
+
+@override_settings(CART_BACKEND="cache")
+@durable_cart_cache
+class CacheCartApiTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.product = create_product(stock_quantity=3)
+        self.list_url = reverse("cartitem-list-create")
+
+    def test_post_and_list_from_cache(self):
+        """キャッシュ保存時もCartItemと同じ形でカートを返すかテスト"""
+        data = {"user": self.user.pk, "product": self.product.pk, "quantity": 2}
+        response = self.client.post(self.list_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.get(self.list_url, {"user": self.user.pk})
+        self.assertEqual(response.data, [data])
+
+        response = self.client.post(self.list_url, {**data, "quantity": 1}, format="json")
+        self.assertEqual(response.data["quantity"], 3)
+
+        data["quantity"] = -3
+        self.client.post(self.list_url, data, format="json")
+        self.assertEqual(self.client.get(self.list_url, {"user": self.user.pk}).data, [])
+
+    def test_checkout_flushes_cart(self):
+        """注文作成時にカートがテーブルへ反映されるかテスト"""
+        data = {"user": self.user.pk, "product": self.product.pk, "quantity": 2}
+        self.client.post(self.list_url, data, format="json")
+        self.client.post(
+            reverse("order-list-create"),
+            {"user": self.user.pk, "order_status": "pending", "total_price": "3000"},
+            format="json",
+        )
+        self.assertEqual(CartItem.objects.get().quantity, 2)
@@ -0,0 +1,200 @@
+import asyncio
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from clothes_shop.events import Broadcaster, EventFeed, broadcaster, format_event
+from clothes_shop.models import ChangeEvent, Order
+from clothes_shop.reservations import hold_stock
+from clothes_shop.tests.factories import create_product, create_user
+
+
+class BroadcasterTest(SimpleTestCase):
+
+    async def test_publish_reaches_topic_subscribers_once(self):
+        """購読したトピックのイベントだけが、重複なく届くかテスト"""
+        events = Broadcaster()
+        both = events.subscribe(["products", "products.1"])
+        other = events.subscribe(["orders"])
+        events.publish(["products", "products.1"], "product", {"id": 1})
+        self.assertEqual((await both.get(1))["data"], {"id": 1})
+        self.assertTrue(both.queue.empty())
+        self.assertTrue(other.queue.empty())
+
+    async def test_overflow(self):
+        """キューが溢れた購読者には、溜まったイベントの代わりに終了の合図が届くかテスト"""
+        events = Broadcaster()
+        subscription = events.subscribe(["products"], maxsize=2)
+        for i in range(3):
+            events.publish(["products"], "product", {"id": i})
+        await asyncio.sleep(0)
+        self.assertTrue(subscription.overflowed)
+        self.assertIsNone(await subscription.get(1))
+
+    async def test_unsubscribe(self):
+        """購読を解除すると登録が残らないかテスト"""
+        events = Broadcaster()
+        subscriptions = [events.subscribe(["products", f"products.{i}"]) for i in range(1000)]
+        self.assertEqual(events.subscriber_count(), 1000)
+        for subscription in subscriptions:
+            events.unsubscribe(subscription)
+        self.assertEqual(events.subscriber_count(), 0)
+        self.assertFalse(events.has_subscribers(["products"]))
+
+    def test_format_event(self):
+        """イベントがSSEの形式で書き出されるかテスト"""
+        event = {"id": 3, "event": "order", "data": {"order_status": "発送済み"}}
+        self.assertEqual(
+            format_event(event),
+            'id: 3\nevent: order\ndata: {"order_status": "発送済み"}\n\n'.encode(),
+        )
+
+
+class EventStreamViewTest(TestCase):
+
+    async def test_stream(self):
+        """購読中のトピックのイベントがストリームで届くかテスト"""
+        response = await self.async_client.get(reverse("events"), {"topics": "orders.1"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        received = asyncio.Queue()
+
+        async def read():
+            async for chunk in response:
+                await received.put(chunk)
+
+        reader = asyncio.create_task(read())
+        self.assertEqual(await asyncio.wait_for(received.get(), 1), b"retry: 3000\n\n")
+        # 購読はジェネレーターの開始時に登録される
+        broadcaster.publish(["orders.2"], "order", {"id": 2})
+        broadcaster.publish(["orders", "orders.1"], "order", {"id": 1})
+        chunk = await asyncio.wait_for(received.get(), 1)
+        self.assertIn(b'data: {"id": 1}', chunk)
+
+        # クライアントが切断したときと同じくタスクをキャンセルすると購読が解除される
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+        self.assertEqual(broadcaster.subscriber_count(), 0)
+
+    async def test_invalid_topics(self):
+        """不正なトピックを指定すると400を返すかテスト"""
+        response = await self.async_client.get(reverse("events"), {"topics": "products,users"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_asgi(self):
+        """WSGIで呼ばれた場合は501を返すかテスト"""
+        response = self.client.get(reverse("events"))
+        self.assertEqual(response.status_code, 501)
+
+
+class EventPublishingTest(TestCase):
+
+    def setUp(self):
+        self.events = mock.Mock(spec=Broadcaster)
+        self.events.has_subscribers.return_value = True
+        self.feed = EventFeed(self.events)
+        self.feed.poll()
+
+    def published(self):
+        self.events.publish.reset_mock()
+        self.feed.poll()
+        return [
+            (call.args[1], call.args[2], call.kwargs["event_id"])
+            for call in self.events.publish.call_args_list
+        ]
+
+    def test_saves_are_published_from_the_log(self):
+        """商品と注文の保存が変更の記録を通じて配信され、ロールバックした変更は届かないかテスト"""
+        product = create_product(stock_quantity=5)
+        order = Order.objects.create(user=create_user(), order_status="pending", total_price=1000)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Order.objects.filter(pk=order.pk).first().save()
+            raise RuntimeError
+        published = self.published()
+        self.assertEqual([event for event, _, _ in published], ["product", "order"])
+        self.assertEqual(published[0][1]["stock_quantity"], 5)
+        self.assertEqual(published[1][1]["id"], order.pk)
+        self.assertEqual(
+            self.events.publish.call_args_list[0].args[0], ["products", f"products.{product.pk}"]
+        )
+        self.assertEqual(self.published(), [])
+
+    def test_stock_updates_are_read_only_when_watched(self):
+        """在庫の一括更新は購読者がいる場合だけ商品を読み直して配信されるかテスト"""
+        user = create_user()
+        product = create_product(stock_quantity=5)
+        self.published()
+        hold_stock(user.id, product.id, 2)
+        self.events.has_subscribers.return_value = False
+        with self.assertNumQueries(1):
+            self.assertEqual(self.published(), [])
+
+        self.events.has_subscribers.return_value = True
+        hold_stock(user.id, product.id, 3)
+        hold_stock(user.id, product.id, 4)
+        published = self.published()
+        self.assertEqual(len(published), 1)
+        self.assertEqual(published[0][1]["available_quantity"], 1)
+
+    def test_late_commit_is_not_skipped(self):
+        """後から見えるようになった小さいidのイベントも取りこぼさないかテスト"""
+        first = ChangeEvent.objects.create(topics=["orders"], event="order", data={"id": 1})
+        # id=first+1の行はまだコミットされていないことにする
+        ChangeEvent.objects.create(
+            pk=first.pk + 2, topics=["orders"], event="order", data={"id": 3}
+        )
+        self.assertEqual([data["id"] for _, data, _ in self.published()], [1, 3])
+        ChangeEvent.objects.create(
+            pk=first.pk + 1, topics=["orders"], event="order", data={"id": 2}
+        )
+        self.assertEqual(self.published(), [("order", {"id": 2}, first.pk + 1)])
+        self.assertEqual(self.feed.gaps, {})
+
+        with override_settings(EVENTS_GAP_TIMEOUT=0):
+            ChangeEvent.objects.create(pk=first.pk + 5, topics=["orders"], event="order", data={})
+            self.published()
+            self.assertEqual(len(self.feed.gaps), 2)
+            self.published()
+            self.assertEqual(self.feed.gaps, {})
+
+    def test_sweep(self):
+        """保持期間を過ぎた記録がsweep_eventsで削除されるかテスト"""
+        create_product()
+        ChangeEvent.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        create_product(title="パーカー")
+        out = StringIO()
+        call_command("sweep_events", "--batch-size", "1", stdout=out)
+        self.assertIn("Deleted 1", out.getvalue())
+        self.assertEqual(ChangeEvent.objects.count(), 1)
+
+    @mock.patch("clothes_shop.events.PROCESS_LOCAL_CACHE_BACKENDS", set())
+    def test_not_logged_without_listeners(self):
+        """共有キャッシュ使用時、購読者のいるプロセスがなければ変更を記録しないかテスト"""
+        cache.clear()
+        user = create_user()
+        product = create_product(stock_quantity=5)
+        hold_stock(user.id, product.id, 2)
+        self.assertFalse(ChangeEvent.objects.exists())
+
+        self.feed.listen()
+        hold_stock(user.id, product.id, 3)
+        self.assertEqual(ChangeEvent.objects.get().event, "stock")
+
+    def test_feed_sweeps_once_per_interval(self):
+        """購読中のプロセスが保持期間を過ぎた記録を間隔ごとに1回だけ削除するかテスト"""
+        cache.clear()
+        create_product()
+        ChangeEvent.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        self.feed.sweep()
+        self.assertFalse(ChangeEvent.objects.exists())
+        create_product(title="パーカー")
+        ChangeEvent.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        with self.assertNumQueries(0):
+            EventFeed(self.events).sweep()
@@ -0,0 +1,117 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from clothes_shop.authentication import issue_token
+from clothes_shop.models import IdempotencyKey, Order, Payment
+from clothes_shop.tests.factories import create_user
+
+
+class IdempotencyKeyTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.url = reverse("order-list-create")
+        self.data = {"user": self.user.pk, "order_status": "pending", "total_price": "3000.00"}
+
+    def post(self, data=None, key="order-1", **extra):
+        return self.client.post(
+            self.url, data or self.data, format="json", HTTP_IDEMPOTENCY_KEY=key, **extra
+        )
+
+    def test_retry_replays_stored_response(self):
+        """同じキーの再送では注文を作らず保存済みの応答を返すかテスト"""
+        first = self.post()
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(1):
+            second = self.post()
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+        self.post(key="order-2")
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_key_reused_with_different_body(self):
+        """同じキーで内容の違うリクエストは422になるかテスト"""
+        self.post()
+        response = self.post({**self.data, "total_price": "1.00"})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_keys_are_scoped_per_client(self):
+        """別のクライアントが同じキーを使っても、互いの応答を返さず422にもならないかテスト"""
+        other = create_user("jiro")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {issue_token(self.user)}")
+        first = self.post()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {issue_token(other)}")
+        second = self.post({**self.data, "user": other.pk})
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", second)
+        self.assertNotEqual(second.data["id"], first.data["id"])
+
+        self.client.credentials()
+        for address in ("192.0.2.1", "192.0.2.2"):
+            response = self.post(REMOTE_ADDR=address)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Order.objects.count(), 4)
+
+    def test_failed_request_is_not_stored(self):
+        """失敗した応答は保存されず、同じキーで再試行できるかテスト"""
+        response = self.post({"user": self.user.pk})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post({"user": self.user.pk}).status_code, 400)
+
+    def test_duplicate_waits_for_in_progress_request(self):
+        """処理中の同じキーは完了を待ってその結果を返すかテスト"""
+        first = self.post()
+        in_progress = IdempotencyKey.objects.filter(key="order-1")
+        in_progress.update(status=IdempotencyKey.STATUS_IN_PROGRESS, response_body=None)
+
+        def finish(seconds):
+            # 待機中に元のリクエストが完了したことにする
+            in_progress.update(status=IdempotencyKey.STATUS_COMPLETED, response_body=first.data)
+
+        with mock.patch("clothes_shop.idempotency.time.sleep", side_effect=finish):
+            response = self.post()
+        self.assertEqual(response.data, first.data)
+        self.assertEqual(Order.objects.count(), 1)
+
+        in_progress.update(status=IdempotencyKey.STATUS_IN_PROGRESS)
+        with override_settings(IDEMPOTENCY_WAIT=0):
+            response = self.post()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_payment_and_sweep(self):
+        """支払い作成にも適用され、期限切れのキーが一括削除されるかテスト"""
+        order = Order.objects.create(user=self.user, order_status="pending", total_price=3000)
+        data = {
+            "order": order.pk,
+            "payment_date": timezone.now().isoformat(),
+            "payment_option": "card",
+            "payment_status": "paid",
+        }
+        for _ in range(2):
+            response = self.client.post(
+                reverse("payment-list-create"), data, format="json", HTTP_IDEMPOTENCY_KEY="pay-1"
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Payment.objects.count(), 1)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command("sweep_idempotency_keys", "--batch-size", "1", stdout=out)
+        self.assertIn("Deleted 1", out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
@@ -0,0 +1,162 @@
+import io
+import os
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from clothes_shop.images import blob_path, store_original, sweep_unused_images
+from clothes_shop.models import Product, Task
+from clothes_shop.task_queue import run_task
+from clothes_shop.tests.factories import create_product
+
+
+def image_file(size=(2000, 1000), color="navy", image_format="PNG"):
+    out = io.BytesIO()
+    if color is None:
+        # 圧縮の効かない大きさのファイルにするため乱数で埋める
+        image = Image.frombytes("L", size, os.urandom(size[0] * size[1]))
+    else:
+        image = Image.new("RGB", size, color)
+    image.save(out, image_format)
+    out.seek(0)
+    out.name = f"image.{image_format.lower()}"
+    return out
+
+
+class ProductImageTest(APITestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.image_dir = Path(tmp_dir.name)
+        images = override_settings(PRODUCT_IMAGE_DIR=self.image_dir)
+        images.enable()
+        self.addCleanup(images.disable)
+        self.product = create_product()
+
+    def upload(self, product, image):
+        return self.client.post(
+            reverse("product-image", args=[product.pk]), {"image": image}, format="multipart"
+        )
+
+    def stored_files(self):
+        return sorted(path.name for path in self.image_dir.rglob("*") if path.is_file())
+
+    def test_variants_generated_by_worker(self):
+        """アップロード後、ワーカーが変種を生成し商品一覧にURLが載るかテスト"""
+        response = self.upload(self.product, image_file())
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIsNone(response.data["images"])
+        run_task(Task.objects.get())
+
+        product = Product.objects.get(pk=self.product.pk)
+        sizes = {}
+        for variant, name in product.image_variants.items():
+            with Image.open(blob_path(name)) as image:
+                sizes[variant] = (image.format, image.size)
+        self.assertEqual(
+            sizes,
+            {
+                "thumbnail": ("WEBP", (160, 80)),
+                "grid": ("WEBP", (480, 240)),
+                "detail": ("WEBP", (1200, 600)),
+            },
+        )
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("product-list-create"))
+        self.assertEqual(
+            response.data[0]["images"]["grid"], f"/media/images/{product.image_variants['grid']}"
+        )
+
+    def test_same_image_is_stored_once(self):
+        """同じ画像は1回だけ保存され、生成済みの変種が使い回されるかテスト"""
+        self.upload(self.product, image_file())
+        run_task(Task.objects.get())
+        files = self.stored_files()
+        self.assertEqual(len(files), 4)
+
+        other = create_product(title="パーカー")
+        response = self.upload(other, image_file())
+        self.assertEqual(self.stored_files(), files)
+        self.assertEqual(Task.objects.count(), 1)
+        self.assertEqual(set(response.data["images"]), {"thumbnail", "grid", "detail"})
+
+    def test_replaced_before_generation(self):
+        """変種の生成前に画像が差し替えられた場合、古い画像の変種で上書きしないかテスト"""
+        self.upload(self.product, image_file(color="navy"))
+        self.upload(self.product, image_file(color="white"))
+        first, second = Task.objects.order_by("pk")
+        run_task(first)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).image_variants, {})
+        run_task(second)
+        self.assertEqual(len(Product.objects.get(pk=self.product.pk).image_variants), 3)
+
+    def test_invalid_upload(self):
+        """画像でないファイルは400になり保存されないかテスト"""
+        text = io.BytesIO(b"not an image")
+        text.name = "image.png"
+        response = self.upload(self.product, text)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_served_with_long_cache(self):
+        """保存した画像が長期キャッシュ可能なヘッダー付きで配信されるかテスト"""
+        url = self.upload(self.product, image_file()).data["image"]
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        response.close()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get("/media/images/../settings.py").status_code, 404)
+        self.assertEqual(self.client.get(f"/media/images/{'0' * 64}.png").status_code, 404)
+
+    def test_gif_is_not_compressed(self):
+        """GIFは圧縮されず、弱いETagでの再検証でも304になるかテスト"""
+        url = self.upload(self.product, image_file((200, 200), None, "GIF")).data["image"]
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Type"], "image/gif")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        etag = response["ETag"]
+        response.close()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f"W/{etag}")
+        self.assertEqual(response.status_code, 304)
+
+    def test_sweep_unused_images(self):
+        """差し替え・削除で使われなくなった画像ファイルだけが削除されるかテスト"""
+        self.upload(self.product, image_file(color="navy"))
+        run_task(Task.objects.get())
+        other = create_product(title="パーカー")
+        self.upload(other, image_file(color="white"))
+        self.upload(self.product, image_file(color="gray"))
+        self.client.delete(reverse("product-image", args=[other.pk]))
+        self.assertEqual(sweep_unused_images(min_age=60), 0)
+
+        hours_ago = time.time() - 2 * 60 * 60
+        for path in self.image_dir.rglob("*"):
+            os.utime(path, (hours_ago, hours_ago))
+        # アップロード中(商品に設定する前)に同じ内容が保存されると更新時刻が進み、消されない
+        white = store_original(image_file(color="white"))
+        out = StringIO()
+        call_command("sweep_images", "--min-age", "60", stdout=out)
+        self.assertIn("Deleted 4", out.getvalue())
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(self.stored_files(), sorted([product.image, white]))
+
+    def test_delete(self):
+        """DELETEで商品の画像が外れるかテスト"""
+        self.upload(self.product, image_file())
+        response = self.client.delete(reverse("product-image", args=[self.product.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).image, "")
@@ -0,0 +1,101 @@
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from clothes_shop.inventory import adjust_inventory
+from clothes_shop.models import Product
+from clothes_shop.tests.factories import create_product
+
+
+class AdjustInventoryTest(APITestCase):
+
+    def setUp(self):
+        self.brand = create_product().brand
+        self.shirt = create_product(stock_quantity=5, brand=self.brand)
+        self.pants = create_product(stock_quantity=5, brand=self.brand, reserved_quantity=3)
+
+    def test_delta_and_absolute(self):
+        """差分指定と絶対値指定が反映され、在庫不足・存在しない商品は結果で分かるかテスト"""
+        results = adjust_inventory(
+            [
+                {"product": self.shirt.pk, "delta": -2},
+                {"product": self.pants.pk, "quantity": 2},
+                {"product": 0, "delta": 1},
+            ]
+        )
+        self.assertEqual(
+            results,
+            [
+                {
+                    "product": self.shirt.pk,
+                    "status": "ok",
+                    "stock_quantity": 3,
+                    "available_quantity": 3,
+                },
+                # カートで確保中の3個を下回るので更新しない
+                {
+                    "product": self.pants.pk,
+                    "status": "insufficient",
+                    "stock_quantity": 5,
+                    "available_quantity": 2,
+                },
+                {"product": 0, "status": "not_found"},
+            ],
+        )
+        self.shirt.refresh_from_db()
+        self.pants.refresh_from_db()
+        self.assertEqual((self.shirt.stock_quantity, self.pants.stock_quantity), (3, 5))
+
+    def test_no_negative_stock(self):
+        """在庫がマイナスになる調整は行わないかテスト"""
+        result = adjust_inventory([{"product": self.shirt.pk, "delta": -6}])[0]
+        self.assertEqual(result["status"], "insufficient")
+        self.assertEqual(Product.objects.get(pk=self.shirt.pk).stock_quantity, 5)
+
+    def test_round_trips_per_chunk(self):
+        """商品数によらず、チャンクごとにSELECTとUPDATEが1回ずつかテスト"""
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    size=self.shirt.size,
+                    target=self.shirt.target,
+                    clothes_type=self.shirt.clothes_type,
+                    brand=self.brand,
+                    title=f"商品{i}",
+                    description="",
+                    category="tops",
+                    price=1000,
+                    release_date=self.shirt.release_date,
+                    stock_quantity=10,
+                )
+                for i in range(250)
+            ]
+        )
+        entries = [{"product": product.pk, "delta": i % 5} for i, product in enumerate(products)]
+        # SAVEPOINTの作成・解放 + チャンク3つ × (SELECT + UPDATE) + 配信の記録のINSERT
+        with self.assertNumQueries(2 + 3 * 2 + 1):
+            results = adjust_inventory(entries, chunk_size=100)
+        self.assertTrue(all(result["status"] == "ok" for result in results))
+        stocks = dict(
+            Product.objects.filter(pk__in=[product.pk for product in products]).values_list(
+                "pk", "stock_quantity"
+            )
+        )
+        self.assertEqual(stocks, {product.pk: 10 + i % 5 for i, product in enumerate(products)})
+
+    def test_endpoint(self):
+        """APIから一括調整でき、不正な入力は400になるかテスト"""
+        url = reverse("inventory-adjust")
+        response = self.client.post(
+            url, {"entries": [{"product": self.shirt.pk, "delta": 1}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["stock_quantity"], 6)
+        for entries in (
+            [{"product": self.shirt.pk}],
+            [{"product": self.shirt.pk, "delta": 1, "quantity": 1}],
+            [{"product": self.shirt.pk, "delta": 1}, {"product": self.shirt.pk, "delta": 1}],
+            [{"product": self.shirt.pk, "quantity": -1}],
+        ):
+            with self.subTest(entries=entries):
+                response = self.client.post(url, {"entries": entries}, format="json")
+                self.assertEqual(response.status_code, 400)
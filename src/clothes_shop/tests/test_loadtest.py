@@ -0,0 +1,80 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import LiveServerTestCase, override_settings
+
+from clothes_shop.loadtest import Session
+from clothes_shop.models import Favorite, Order, Payment
+from clothes_shop.tests.factories import create_product, create_user
+
+
+class LoadTestCommandTest(LiveServerTestCase):
+
+    def setUp(self):
+        cache.clear()
+        create_user()
+        for i in range(3):
+            create_product(title=f"シャツ {i}", stock_quantity=100)
+
+    def run_loadtest(self, *args):
+        out = StringIO()
+        # テスト用サーバーはSQLiteの接続を共有するので、同時に走る流れは1つにする
+        args += ("--max-in-flight", "1", "--seed", "1")
+        call_command("loadtest", self.live_server_url, *args, stdout=out)
+        return out.getvalue()
+
+    def test_purchase_journeys(self):
+        """購入の流れが注文・支払いまで実行され、手順ごとの結果が出力されるかテスト"""
+        output = self.run_loadtest("--mix", "purchase=1", "--rate", "20", "--duration", "0.5")
+        completed = Order.objects.count()
+        self.assertGreater(completed, 0)
+        self.assertEqual(Payment.objects.count(), completed)
+        self.assertIn(f"journey purchase: completed={completed} failed=0 dropped=", output)
+        for step in ("view product", "add to cart", "place order", "pay"):
+            self.assertIn(f"\n{step} ", output)
+
+    def test_mix(self):
+        """配分の指定どおりに流れを選び、未知の流れはエラーになるかテスト"""
+        output = self.run_loadtest(
+            "--mix", "engage=1,browse=0", "--rate", "20", "--duration", "0.5"
+        )
+        self.assertTrue(Favorite.objects.exists())
+        self.assertIn("journey browse: completed=0 failed=0 dropped=0", output)
+        self.assertIn("journey engage: completed=", output)
+        self.assertNotIn("place order", output)
+        with self.assertRaises(CommandError):
+            self.run_loadtest("--mix", "checkout=1")
+
+    def test_unexpected_exception_fails_the_journey(self):
+        """想定外の例外で落ちた流れを、例外の型名付きで失敗として数えるかテスト"""
+        with mock.patch.object(Session, "browse", side_effect=KeyError("results")):
+            output = self.run_loadtest("--mix", "browse=1", "--rate", "20", "--duration", "0.3")
+        self.assertRegex(output, r"journey browse: completed=0 failed=(\d+) dropped=0")
+        failed = output.split("failed=")[1].split()[0]
+        self.assertIn(f"exceptions: KeyError={failed}", output)
+
+    def test_throttled_requests_reported_apart_from_errors(self):
+        """書き込みの流量制限による429をエラーと分けて数えるかテスト"""
+        rates = {
+            "DEFAULT_THROTTLE_CLASSES": ["clothes_shop.throttling.WriteRateThrottle"],
+            "DEFAULT_THROTTLE_RATES": {"client": "1/min"},
+        }
+        out, err = StringIO(), StringIO()
+        with override_settings(REST_FRAMEWORK=rates):
+            call_command(
+                "loadtest",
+                self.live_server_url,
+                *("--mix", "purchase=1", "--rate", "20", "--duration", "0.5"),
+                *("--max-in-flight", "1", "--seed", "1"),
+                stdout=out,
+                stderr=err,
+            )
+        output = out.getvalue()
+        self.assertRegex(
+            output, r"journey purchase: completed=0 failed=0 dropped=\d+ throttled=[1-9]"
+        )
+        self.assertRegex(output, r"errors=0 \(0\.0%\) throttled=[1-9]")
+        self.assertIn("RATE_LIMIT_ENABLED=false", err.getvalue())
@@ -0,0 +1,55 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from clothes_shop.models import Favorite, WishList
+from clothes_shop.tests.factories import create_product, create_user
+
+
+class ProductMembershipTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user("taro")
+        self.other = create_user("hanako")
+        self.shirt = create_product(title="シャツ")
+        self.pants = create_product(title="パンツ")
+        Favorite.objects.create(user=self.user, product=self.shirt)
+        WishList.objects.create(user=self.user, product=self.pants)
+        Favorite.objects.create(user=self.other, product=self.pants)
+        self.url = reverse("product-list-create")
+
+    def _flags(self, response):
+        return {p["id"]: (p["is_favorite"], p["in_wishlist"]) for p in response.data}
+
+    def test_products_annotated_for_user(self):
+        """指定ユーザーのお気に入り・ウィッシュリスト状態が付与されるかテスト"""
+        response = self.client.get(self.url, {"user": self.user.pk})
+        self.assertEqual(
+            self._flags(response),
+            {self.shirt.pk: (True, False), self.pants.pk: (False, True)},
+        )
+        response = self.client.get(self.url)
+        self.assertNotIn("is_favorite", response.data[0])
+
+    def test_membership_is_cached_and_invalidated(self):
+        """お気に入りの集合がキャッシュされ、書き込みで無効化されるかテスト"""
+        self.client.get(self.url, {"user": self.user.pk})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {"user": self.user.pk})
+        self.assertEqual(len(queries), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, product=self.pants)
+            # コミットまでは破棄しない
+            response = self.client.get(self.url, {"user": self.user.pk})
+            self.assertEqual(self._flags(response)[self.pants.pk], (False, True))
+        response = self.client.get(self.url, {"user": self.user.pk})
+        self.assertEqual(self._flags(response)[self.pants.pk], (True, True))
+
+    def test_favorites_filtered_by_user(self):
+        """お気に入り一覧をユーザーで絞り込めるかテスト"""
+        response = self.client.get(reverse("favorite-list-create"), {"user": self.other.pk})
+        self.assertEqual(response.data, [{"user": self.other.pk, "product": self.pants.pk}])
@@ -0,0 +1,117 @@
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from clothes_shop.models import ChangeEvent, Order, Payment, Shipping
+from clothes_shop.orders import transition_orders
+from clothes_shop.tests.factories import create_user
+
+
+class OrderTransitionTest(APITestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.other = create_user(name="jiro")
+
+    def create_orders(self, count, status=Order.STATUS_PENDING, user=None):
+        return Order.objects.bulk_create(
+            [
+                Order(user=user or self.user, order_status=status, total_price=1000)
+                for _ in range(count)
+            ]
+        )
+
+    def test_only_allowed_transitions(self):
+        """遷移元が許されている注文だけが移り、結果で理由が分かるかテスト"""
+        pending = self.create_orders(1)[0]
+        shipped = self.create_orders(1, Order.STATUS_SHIPPED)[0]
+        results = transition_orders(
+            [{"id": pending.pk}, {"id": shipped.pk}, {"id": 0}], Order.STATUS_CANCELLED
+        )
+        self.assertEqual(
+            results,
+            [
+                {"id": pending.pk, "result": "ok", "order_status": "cancelled"},
+                {"id": shipped.pk, "result": "invalid_transition", "order_status": "shipped"},
+                {"id": 0, "result": "not_found"},
+            ],
+        )
+        self.assertEqual(
+            dict(Order.objects.values_list("pk", "order_status")),
+            {pending.pk: "cancelled", shipped.pk: "shipped"},
+        )
+
+    def test_side_records_and_single_event(self):
+        """支払い・配送の記録が一括で作られ、変更がまとめて1件のイベントで配信されるかテスト"""
+        orders = self.create_orders(3) + self.create_orders(2, user=self.other)
+        entries = [{"id": order.pk} for order in orders]
+        transition_orders(entries, Order.STATUS_PAID, payment_option="card")
+        event = ChangeEvent.objects.latest("pk")
+        self.assertEqual(event.event, "orders")
+        self.assertIn(f"users.{self.other.pk}.orders", event.topics)
+        self.assertEqual(len(event.data["orders"]), 5)
+        self.assertEqual(Payment.objects.filter(payment_option="card").count(), 5)
+
+        shipments = [
+            {"id": order.pk, "shipping_tracking_number": f"TRK{order.pk}"} for order in orders
+        ]
+        # SAVEPOINT2回 + SELECT・UPDATE + 住所のSELECT + 配送のINSERT + 配信の記録のINSERT
+        with self.assertNumQueries(7):
+            transition_orders(shipments, Order.STATUS_SHIPPED)
+        shipping = Shipping.objects.get(order=orders[0])
+        self.assertEqual(
+            (shipping.shipping_tracking_number, shipping.shipping_address),
+            (f"TRK{orders[0].pk}", "Tokyo"),
+        )
+
+    def test_chunks(self):
+        """チャンクに分けても全ての注文が移るかテスト"""
+        orders = self.create_orders(25)
+        results = transition_orders(
+            [{"id": order.pk} for order in orders], Order.STATUS_CANCELLED, chunk_size=10
+        )
+        self.assertEqual([result["result"] for result in results], ["ok"] * 25)
+        self.assertFalse(Order.objects.exclude(order_status="cancelled").exists())
+
+    def test_endpoint(self):
+        """APIから一括で遷移でき、不足した指定は400になるかテスト"""
+        order = self.create_orders(1, Order.STATUS_PAID)[0]
+        url = reverse("order-transition")
+        response = self.client.post(
+            url, {"status": "shipped", "orders": [{"id": order.pk}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            url,
+            {
+                "status": "shipped",
+                "orders": [{"id": order.pk, "shipping_tracking_number": "TRK1"}],
+            },
+            format="json",
+        )
+        self.assertEqual(
+            response.json(), [{"id": order.pk, "result": "ok", "order_status": "shipped"}]
+        )
+        response = self.client.post(
+            url, {"status": "pending", "orders": [{"id": order.pk}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_detail_update_is_guarded(self):
+        """注文の作成・更新では遷移APIを通さずに状態を変えられないかテスト"""
+        order = self.create_orders(1, Order.STATUS_PAID)[0]
+        url = reverse("order-detail", args=[order.pk])
+        for order_status in ("pending", "shipped", "completed"):
+            response = self.client.patch(url, {"order_status": order_status}, format="json")
+            self.assertEqual(response.status_code, 400)
+        response = self.client.patch(
+            url, {"order_status": "paid", "total_price": "1200"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.exclude(order_status="paid").exists())
+
+        url = reverse("order-list-create")
+        data = {"user": self.user.pk, "order_status": "paid", "total_price": "1000"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {**data, "order_status": "pending"}, format="json")
+        self.assertEqual(response.status_code, 201)
@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from clothes_shop.counts import count_rows, refresh_count
+from clothes_shop.models import Product
+from clothes_shop.tests.factories import create_product
+
+
+@override_settings(COUNT_ESTIMATE_THRESHOLD=3)
+class CountRowsTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        brand = create_product(title="シャツ").brand
+        for i in range(4):
+            create_product(title=f"パンツ{i}", brand=brand)
+
+    def test_exact_below_threshold(self):
+        """閾値以下の件数は正確に数えるかテスト"""
+        self.assertEqual(count_rows(Product.objects.filter(title="シャツ")), (1, True))
+        self.assertEqual(count_rows(Product.objects.filter(pk__in=[])), (0, True))
+
+    def test_large_filtered_count_is_capped(self):
+        """閾値を超える絞り込みは上限までだけ数え、全件の件数は裏で数えてキャッシュするかテスト"""
+        queryset = Product.objects.filter(title__startswith="パンツ")
+        create_product(title="パンツ4")
+        with mock.patch("clothes_shop.counts._refresh_in_background") as refresh:
+            self.assertEqual(count_rows(queryset), (4, False))
+            # 数えている間の他のリクエストは全件のCOUNTを重ねて始めない
+            self.assertEqual(count_rows(queryset), (4, False))
+        self.assertEqual(refresh.call_count, 1)
+        refresh_count(*refresh.call_args.args)
+        create_product(title="パンツ5")
+        with self.assertNumQueries(0):
+            self.assertEqual(count_rows(queryset), (5, False))
+        # 条件が異なれば別の件数として数える
+        with mock.patch("clothes_shop.counts._refresh_in_background") as refresh:
+            self.assertEqual(count_rows(queryset.filter(is_deleted=False)), (4, False))
+        refresh.assert_called_once()
+
+    def test_unfiltered_uses_table_statistics(self):
+        """絞り込みのない大きなテーブルは統計情報の概算値を使うかテスト"""
+        with mock.patch("clothes_shop.counts.estimated_row_count", return_value=1000):
+            with self.assertNumQueries(0):
+                self.assertEqual(count_rows(Product.objects.all()), (1000, False))
+
+
+class PaginationViewTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.products = [create_product(title=f"商品{i}") for i in range(5)]
+
+    def test_plain_list_without_page(self):
+        """?page= がなければ従来どおり全件のリストを返すかテスト"""
+        response = self.client.get(reverse("product-list-create"))
+        self.assertEqual(len(response.json()), 5)
+
+    def test_pages(self):
+        """ページ分割の応答に件数と正確かどうかが含まれるかテスト"""
+        url = reverse("product-list-create")
+        response = self.client.get(url, {"page": 1, "page_size": 2})
+        data = response.json()
+        self.assertEqual(data["count"], 5)
+        self.assertTrue(data["count_is_exact"])
+        ids = [item["id"] for item in data["results"]]
+        self.assertEqual(ids, [product.pk for product in self.products[:2]])
+        self.assertIsNone(data["previous"])
+
+        data = self.client.get(data["next"]).json()
+        self.assertIn("page=1", data["previous"])
+
+        self.assertEqual(self.client.get(url, {"page": 4, "page_size": 2}).status_code, 404)
+
+    @override_settings(COUNT_ESTIMATE_THRESHOLD=3)
+    def test_estimated_count(self):
+        """概算の件数が実際より多くても、短いページで次のリンクが止まるかテスト"""
+        with mock.patch("clothes_shop.counts.estimated_row_count", return_value=100):
+            data = self.client.get(reverse("product-list-create"), {"page": 1}).json()
+        self.assertEqual(data["count"], 100)
+        self.assertFalse(data["count_is_exact"])
+        self.assertEqual(len(data["results"]), 5)
+        self.assertIsNone(data["next"])
+        data = self.client.get(reverse("order-list-create"), {"page": 1}).json()
+        self.assertEqual((data["count"], data["count_is_exact"]), (0, True))
+
+    @override_settings(COUNT_ESTIMATE_THRESHOLD=2)
+    def test_pages_past_capped_count(self):
+        """上限で打ち切った件数より先のページも実際の行で返すかテスト"""
+        url = reverse("product-list-create")
+        with mock.patch("clothes_shop.counts._refresh_in_background"):
+            data = self.client.get(url, {"page": 1, "page_size": 2}).json()
+            self.assertEqual((data["count"], data["count_is_exact"]), (3, False))
+            data = self.client.get(data["next"]).json()
+            self.assertEqual(len(data["results"]), 2)
+            data = self.client.get(data["next"]).json()
+        self.assertEqual([item["id"] for item in data["results"]], [self.products[4].pk])
+        self.assertIsNone(data["next"])
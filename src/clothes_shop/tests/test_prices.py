@@ -0,0 +1,91 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from clothes_shop.models import Product, ProductPrice
+from clothes_shop.prices import prices_at
+from clothes_shop.tests.factories import create_product
+
+
+class PriceHistoryRecordingTest(APITestCase):
+
+    def setUp(self):
+        self.product = create_product(price=1500)
+
+    def history(self):
+        return list(self.product.prices.order_by("pk").values_list("price", flat=True))
+
+    def test_changes_are_appended(self):
+        """作成時と価格の変更時だけ履歴が追記されるかテスト"""
+        self.assertEqual(self.history(), [Decimal("1500")])
+        self.product.title = "パーカー"
+        self.product.save()
+        response = self.client.patch(
+            reverse("product-detail", args=[self.product.pk]), {"price": "1800.00"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.history(), [Decimal("1500"), Decimal("1800")])
+        latest = self.product.prices.latest("pk")
+        self.assertEqual(latest.valid_from, Product.objects.get(pk=self.product.pk).updated_at)
+
+    def test_saves_without_price_skip_the_read(self):
+        """価格を含まない保存では変更前の価格を読まないかテスト"""
+        self.product.stock_quantity = 3
+        # UPDATE + 配信の記録のINSERT
+        with self.assertNumQueries(2):
+            self.product.save(update_fields=["stock_quantity", "updated_at"])
+
+
+class PriceAtTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.shirt, self.hoodie = create_product(), create_product(title="パーカー")
+        ProductPrice.objects.all().delete()
+        self.set_prices(self.shirt, [(-30, 1000), (-10, 1200), (-5, 900)])
+        self.set_prices(self.hoodie, [(-20, 5000)])
+
+    def set_prices(self, product, changes):
+        ProductPrice.objects.bulk_create(
+            [
+                ProductPrice(product=product, price=price, valid_from=self.days(days))
+                for days, price in changes
+            ]
+        )
+
+    def days(self, n):
+        return self.now + timedelta(days=n)
+
+    def test_price_at(self):
+        """指定時点で有効だった価格を返し、記録前はNoneになるかテスト"""
+        self.assertIsNone(self.shirt.price_at(self.days(-31)))
+        self.assertEqual(self.shirt.price_at(self.days(-30)), 1000)
+        self.assertEqual(self.shirt.price_at(self.days(-6)), 1200)
+        self.assertEqual(self.shirt.price_at(self.now), 900)
+
+    def test_prices_at_in_one_query(self):
+        """多数の商品・時点の価格を1クエリで入力の順に返すかテスト"""
+        lookups = [
+            (self.shirt.pk, self.days(-6)),
+            (self.hoodie.pk, self.days(-25)),
+            (self.shirt.pk, self.days(-40)),
+            (self.hoodie.pk, self.now),
+            (self.shirt.pk, self.days(-10)),
+            (0, self.now),
+        ]
+        with self.assertNumQueries(1):
+            prices = prices_at(lookups)
+        self.assertEqual(prices, [1200, None, None, 5000, 1200, None])
+        self.assertEqual(prices_at([]), [])
+
+    def test_later_record_wins_at_same_time(self):
+        """同時刻に記録された価格は後から記録したものが有効になるかテスト"""
+        self.set_prices(self.shirt, [(-5, 950)])
+        self.assertEqual(self.shirt.price_at(self.days(-5)), 950)
+        self.assertEqual(prices_at([(self.shirt.pk, self.days(-5))]), [950])
+        lookups = [(self.shirt.pk, self.days(-30)), (self.shirt.pk, self.now)]
+        self.assertEqual(prices_at(lookups), [1000, 950])
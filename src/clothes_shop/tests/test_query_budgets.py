@@ -0,0 +1,472 @@
+import io
+import random
+import re
+import tempfile
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, resolve, reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from clothes_shop import urls
+from clothes_shop.analytics import refresh_sales_rollups
+from clothes_shop.images import image_url
+from clothes_shop.models import (
+    Brand,
+    CartItem,
+    ClothesType,
+    Favorite,
+    Order,
+    OrderItem,
+    Payment,
+    Product,
+    Rating,
+    Shipping,
+    Size,
+    Target,
+    User,
+    WishList,
+)
+from clothes_shop.tasks import make_email_verification_token
+from clothes_shop.tests.factories import create_product, create_user
+
+SMALL, LARGE = 2, 8
+
+# テストしない名前付きルートと理由
+SKIPPED_ROUTES = {
+    "events": "ASGIのストリームで応答が終わらない",
+}
+
+
+def first(model):
+    return model.objects.order_by("pk").values_list("pk", flat=True).first()
+
+
+def seed(count):
+    """
+    Add count users, products, orders (two items, a payment and a shipping each)
+    and the rows hanging off them.
+    """
+    now = timezone.now()
+    offset = User.objects.count()
+    for i in range(offset, offset + count):
+        user = create_user(name=f"user{i}")
+        products = [create_product(title=f"シャツ{i}-{j}", stock_quantity=100) for j in range(2)]
+        order = Order.objects.create(user=user, order_status="pending", total_price=3000)
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=1500)
+        Payment.objects.create(
+            order=order, payment_date=now, payment_option="card", payment_status="succeeded"
+        )
+        Shipping.objects.create(
+            order=order,
+            shipping_tracking_number=f"TRK{i}",
+            shipping_date=now,
+            shipping_address=user.address,
+        )
+        Rating.objects.create(user=user, product=products[0], rating=4)
+        Favorite.objects.create(user=user, product=products[0])
+        WishList.objects.create(user=user, product=products[1])
+        CartItem.objects.create(user=user, product=products[1], quantity=1)
+    refresh_sales_rollups()
+
+
+def image_file():
+    # 毎回違う画像にして、生成済みの変種の使い回しではなく生成の登録まで通す
+    out = io.BytesIO()
+    Image.new("RGB", (32, 32), tuple(random.randrange(256) for _ in range(3))).save(out, "PNG")
+    out.seek(0)
+    out.name = "image.png"
+    return out
+
+
+def detail(name, model):
+    return lambda: ("get", reverse(name, args=[first(model)]), {})
+
+
+def listing(name, **params):
+    return lambda: ("get", reverse(name), params)
+
+
+def last(model):
+    return model.objects.order_by("-pk").values_list("pk", flat=True).first()
+
+
+def create(name, data):
+    # dataは毎回の計測時に呼び出し、その時点の行を参照する
+    return lambda: ("post", reverse(name), data())
+
+
+def update(name, model, **data):
+    return lambda: ("patch", reverse(name, args=[first(model)]), data)
+
+
+# ルート名 -> (メソッド, URL, パラメータ) を返す関数のリスト。メソッドの"upload"はmultipartのPOST。
+# 書き込みを受け付けるルートには、書き込みのリクエストも最低1つ含める
+ROUTE_REQUESTS = {
+    "product-list-create": [
+        listing("product-list-create"),
+        listing("product-list-create", page=1),
+        lambda: ("get", reverse("product-list-create"), {"user": first(User)}),
+        create(
+            "product-list-create",
+            lambda: {
+                "title": "新商品",
+                "description": "コットン",
+                "price": "1500",
+                "stock_quantity": 100,
+                "release_date": timezone.now().isoformat(),
+                "size": first(Size),
+                "target": first(Target),
+                "clothes_type": first(ClothesType),
+                "brand": first(Brand),
+            },
+        ),
+    ],
+    "product-search": [listing("product-search", q="シャツ")],
+    "product-detail": [
+        detail("product-detail", Product),
+        update("product-detail", Product, price="1600"),
+    ],
+    "product-recommendations": [detail("product-recommendations", Product)],
+    "product-image": [
+        lambda: (
+            "upload",
+            reverse("product-image", args=[first(Product)]),
+            {"image": image_file()},
+        )
+    ],
+    "product-image-file": [
+        lambda: (
+            "get",
+            image_url(Product.objects.exclude(image="").values_list("image", flat=True)[0]),
+            {},
+        )
+    ],
+    "batch": [
+        lambda: (
+            "post",
+            reverse("batch"),
+            {
+                "requests": [
+                    {"path": reverse("product-list-create")},
+                    {"path": reverse("order-list-create")},
+                    {"path": reverse("user-summary", args=[first(User)])},
+                ]
+            },
+        )
+    ],
+    "inventory-adjust": [
+        lambda: (
+            "post",
+            reverse("inventory-adjust"),
+            {
+                "entries": [
+                    {"product": pk, "delta": 1}
+                    for pk in Product.objects.values_list("pk", flat=True)
+                ]
+            },
+        )
+    ],
+    "autocomplete": [listing("autocomplete", q="シ")],
+    "sales-by-date": [listing("sales-by-date")],
+    "sales-by-brand": [listing("sales-by-brand")],
+    "sales-by-clothes-type": [listing("sales-by-clothes-type")],
+    "order-list-create": [
+        listing("order-list-create"),
+        listing("order-list-create", page=1),
+        create(
+            "order-list-create",
+            lambda: {"user": first(User), "order_status": "pending", "total_price": "3000"},
+        ),
+    ],
+    "order-transition": [
+        lambda: (
+            "post",
+            reverse("order-transition"),
+            {
+                "status": "paid",
+                "payment_option": "card",
+                "orders": [
+                    {"id": pk}
+                    for pk in Order.objects.filter(order_status="pending").values_list(
+                        "pk", flat=True
+                    )
+                ],
+            },
+        )
+    ],
+    "order-detail": [
+        detail("order-detail", Order),
+        update("order-detail", Order, total_price="3200"),
+    ],
+    "rating-list-create": [
+        listing("rating-list-create"),
+        create(
+            "rating-list-create",
+            lambda: {"user": first(User), "product": last(Product), "rating": 5},
+        ),
+    ],
+    "rating-detail": [detail("rating-detail", Rating), update("rating-detail", Rating, rating=3)],
+    "user-list-create": [
+        listing("user-list-create"),
+        create(
+            "user-list-create",
+            lambda: {
+                "user_name": "hanako",
+                "email_address": f"hanako{User.objects.count()}@example.com",
+                "role": "customer",
+                "address": "Osaka",
+            },
+        ),
+    ],
+    "user-verify-email": [
+        lambda: (
+            "get",
+            reverse("user-verify-email"),
+            {"token": make_email_verification_token(User.objects.order_by("pk").first())},
+        )
+    ],
+    "user-detail": [detail("user-detail", User), update("user-detail", User, address="Osaka")],
+    "user-summary": [detail("user-summary", User)],
+    "favorite-list-create": [
+        listing("favorite-list-create"),
+        create("favorite-list-create", lambda: {"user": first(User), "product": last(Product)}),
+    ],
+    "favorite-detail": [
+        detail("favorite-detail", Favorite),
+        lambda: ("delete", reverse("favorite-detail", args=[first(Favorite)]), {}),
+    ],
+    "wishlist-list-create": [
+        listing("wishlist-list-create"),
+        create(
+            "wishlist-list-create",
+            lambda: {"user": first(User), "product": last(Product), "is_public": True},
+        ),
+    ],
+    "wishlist-detail": [
+        detail("wishlist-detail", WishList),
+        update("wishlist-detail", WishList, is_public=True),
+    ],
+    "cartitem-list-create": [
+        listing("cartitem-list-create"),
+        create(
+            "cartitem-list-create",
+            lambda: {"user": first(User), "product": last(Product), "quantity": 1},
+        ),
+    ],
+    "cartitem-detail": [
+        detail("cartitem-detail", CartItem),
+        update("cartitem-detail", CartItem, quantity=2),
+    ],
+    "orderitem-list-create": [
+        listing("orderitem-list-create"),
+        create(
+            "orderitem-list-create",
+            lambda: {
+                "order": first(Order),
+                "product": last(Product),
+                "quantity": 1,
+                "unit_price": "1500",
+            },
+        ),
+    ],
+    "orderitem-detail": [
+        detail("orderitem-detail", OrderItem),
+        update("orderitem-detail", OrderItem, quantity=2),
+    ],
+    "payment-list-create": [
+        listing("payment-list-create"),
+        create(
+            "payment-list-create",
+            lambda: {
+                "order": first(Order),
+                "payment_date": timezone.now().isoformat(),
+                "payment_option": "card",
+                "payment_status": "succeeded",
+            },
+        ),
+    ],
+    "payment-detail": [
+        detail("payment-detail", Payment),
+        update("payment-detail", Payment, payment_status="refunded"),
+    ],
+    "shipping-list-create": [
+        listing("shipping-list-create"),
+        create(
+            "shipping-list-create",
+            lambda: {
+                "order": first(Order),
+                "shipping_tracking_number": "TRK-NEW",
+                "shipping_date": timezone.now().isoformat(),
+                "shipping_address": "Tokyo",
+                "address_code": "100-0001",
+            },
+        ),
+    ],
+    "shipping-detail": [
+        detail("shipping-detail", Shipping),
+        update("shipping-detail", Shipping, address_code="100-0001"),
+    ],
+    "size-list-create": [
+        listing("size-list-create"),
+        create("size-list-create", lambda: {"size_name": "L"}),
+    ],
+    "size-detail": [detail("size-detail", Size), update("size-detail", Size, size_name="S")],
+    "target-list-create": [
+        listing("target-list-create"),
+        create("target-list-create", lambda: {"target_type": "キッズ"}),
+    ],
+    "target-detail": [
+        detail("target-detail", Target),
+        update("target-detail", Target, target_type="レディース"),
+    ],
+    "clothestype-list-create": [
+        listing("clothestype-list-create"),
+        create("clothestype-list-create", lambda: {"clothes_type_name": "パンツ"}),
+    ],
+    "clothestype-detail": [
+        detail("clothestype-detail", ClothesType),
+        update("clothestype-detail", ClothesType, clothes_type_name="ジャケット"),
+    ],
+    "brand-list-create": [
+        listing("brand-list-create"),
+        create("brand-list-create", lambda: {"brand_name": "adidas"}),
+    ],
+    "brand-detail": [
+        detail("brand-detail", Brand),
+        update("brand-detail", Brand, brand_name="PUMA"),
+    ],
+}
+
+
+def sql_shape(sql):
+    """
+    The SQL with literals and IN lists collapsed, so the same query against
+    different rows has the same shape.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r'"s\d+_x\d+"', '"s?"', sql)  # SAVEPOINT名
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    return re.sub(r"\(\?(?:, \?)*\)", "(...)", sql)
+
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+def view_class(path):
+    view = resolve(path).func
+    return getattr(view, "view_class", view)
+
+
+def write_methods(view):
+    if not hasattr(view, "http_method_names"):
+        return set()
+    return {method.upper() for method in view.http_method_names if hasattr(view, method)} & (
+        WRITE_METHODS
+    )
+
+
+def query_budget(path, data, method="get"):
+    view = view_class(path)
+    budget = getattr(view, "query_budget", None)
+    if method != "get":
+        # 読み書きの両方を受けるビューは書き込みの予算を別に持つ
+        budget = getattr(view, "write_query_budget", budget)
+    if budget is not None and "requests" in data:
+        # バッチはサブリクエストのビューの予算を足す
+        budget += sum(query_budget(sub["path"], {}) for sub in data["requests"])
+    return budget
+
+
+class QueryBudgetTest(APITestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        images = override_settings(PRODUCT_IMAGE_DIR=tmp_dir.name)
+        images.enable()
+        self.addCleanup(images.disable)
+
+    def measure(self):
+        """
+        Run every request in ROUTE_REQUESTS and return
+        {(route, index): (method, path, data, status_code, Counter of SQL shapes)}.
+        """
+        measured = {}
+        for name, requests in ROUTE_REQUESTS.items():
+            for index, make_request in enumerate(requests):
+                method, path, data = make_request()
+                # キャッシュが温まっていない状態のクエリ数を測る
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    if method == "get":
+                        response = self.client.get(path, data)
+                    elif method == "upload":
+                        response = self.client.post(path, data, format="multipart")
+                    else:
+                        response = getattr(self.client, method)(path, data, format="json")
+                shapes = Counter(sql_shape(query["sql"]) for query in queries.captured_queries)
+                measured[(name, index)] = (method, path, data, response.status_code, shapes)
+        return measured
+
+    def test_every_route_is_measured(self):
+        """名前付きルートが全て計測対象か、理由付きで除外されているかテスト"""
+        names = {
+            pattern.name
+            for pattern in urls.urlpatterns
+            if isinstance(pattern, URLPattern) and pattern.name
+        }
+        self.assertEqual(names - set(SKIPPED_ROUTES), set(ROUTE_REQUESTS))
+
+    def test_every_write_is_measured(self):
+        """書き込みを受けるルートは書き込みも計測し、読み書き両方のビューは別の予算を持つかテスト"""
+        seed(SMALL)
+        for pattern in urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or pattern.name not in ROUTE_REQUESTS:
+                continue
+            view = getattr(pattern.callback, "view_class", pattern.callback)
+            if not write_methods(view):
+                continue
+            with self.subTest(route=pattern.name):
+                methods = {make_request()[0] for make_request in ROUTE_REQUESTS[pattern.name]}
+                self.assertTrue(methods - {"get"}, "no write request")
+                if hasattr(view, "get"):
+                    self.assertTrue(hasattr(view, "write_query_budget"))
+
+    def test_queries_do_not_grow_and_stay_within_budget(self):
+        """データ量を増やしてもクエリ数が増えず、ビューの予算内に収まるかテスト"""
+        seed(SMALL)
+        small = self.measure()
+        seed(LARGE - SMALL)
+        large = self.measure()
+
+        for key, (method, path, data, status_code, shapes) in large.items():
+            with self.subTest(route=key[0], request=key[1]):
+                small_shapes = small[key][4]
+                self.assertLess(status_code, 400, path)
+                count, small_count = sum(shapes.values()), sum(small_shapes.values())
+                grown = "\n".join(
+                    f"  {small_shapes[shape]} -> {n}: {shape}"
+                    for shape, n in shapes.items()
+                    if n > small_shapes[shape]
+                )
+                self.assertLessEqual(
+                    count,
+                    small_count,
+                    f"{path}: {small_count} queries with {SMALL} rows, {count} with {LARGE}\n"
+                    f"{grown}",
+                )
+                budget = query_budget(path, data, method)
+                self.assertIsNotNone(budget, f"{path}: the view declares no query_budget")
+                self.assertLessEqual(
+                    count,
+                    budget,
+                    f"{path}: {count} queries over the budget of {budget}\n"
+                    + "\n".join(f"  {n}: {shape}" for shape, n in shapes.items()),
+                )
@@ -0,0 +1,93 @@
+import os
+import tempfile
+from datetime import timedelta
+
+import numpy as np
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from clothes_shop.models import Order, OrderItem, ProductCooccurrence
+from clothes_shop.recommendations import (
+    TopKTable,
+    cooccurrence_pairs,
+    update_cooccurrence,
+    write_top_k,
+)
+from clothes_shop.tests.factories import create_product, create_user
+
+
+class CooccurrencePairsTest(TestCase):
+
+    def test_pairs_counted_per_order(self):
+        """同じ注文内の商品の組み合わせが数えられるかテスト"""
+        pairs, counts = cooccurrence_pairs([1, 1, 1, 2, 2], [10, 20, 10, 10, 30])
+        result = dict(zip(map(tuple, pairs.tolist()), counts.tolist()))
+        self.assertEqual(result[(10, 10)], 2)
+        self.assertEqual(result[(10, 20)], 1)
+        self.assertEqual(result[(20, 10)], 1)
+        self.assertEqual(result[(10, 30)], 1)
+        self.assertNotIn((20, 30), result)
+
+
+class RecommendationTests(APITestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, "topk.npy")
+        self.user = create_user()
+        self.shirt = create_product(title="シャツ")
+        self.pants = create_product(title="パンツ")
+        self.hat = create_product(title="帽子")
+        self._order(self.shirt, self.pants)
+        self._order(self.shirt, self.pants)
+        self._order(self.shirt, self.hat)
+
+    def _order(self, *products):
+        order = Order.objects.create(user=self.user, order_status="pending", total_price=0)
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=1)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        return order
+
+    def test_incremental_update(self):
+        """前回以降の注文だけが集計に加算されるかテスト"""
+        update_cooccurrence()
+        self._order(self.shirt, self.pants)
+        changed = update_cooccurrence()
+        # シャツの件数が変わるので、シャツと組になる帽子の類似度も計算し直す
+        self.assertEqual(changed, {self.shirt.pk, self.pants.pk, self.hat.pk})
+        pair = ProductCooccurrence.objects.get(product_a=self.shirt, product_b=self.pants)
+        self.assertEqual(pair.count, 3)
+
+    def test_incremental_matches_full_rebuild(self):
+        """差分で更新したテーブルが全件の作り直しと一致するかテスト"""
+        write_top_k(update_cooccurrence(), path=self.path, k=5)
+        self._order(self.shirt)
+        write_top_k(update_cooccurrence(), path=self.path, k=5)
+        full_path = os.path.join(self.tmp_dir.name, "full.npy")
+        write_top_k([], path=full_path, k=5, full=True)
+        incremental, full = np.load(self.path), np.load(full_path)
+        np.testing.assert_array_equal(incremental["neighbors"], full["neighbors"])
+        np.testing.assert_allclose(incremental["scores"], full["scores"])
+
+    def test_top_k_table(self):
+        """上位k件がメモリマップされたテーブルから類似度順に返るかテスト"""
+        write_top_k(update_cooccurrence(), path=self.path, k=5)
+        table = np.load(self.path, mmap_mode="r")
+        self.assertEqual(table["product_id"].tolist(), sorted(table["product_id"].tolist()))
+        similar = TopKTable(self.path).similar(self.shirt.pk)
+        self.assertEqual([product_id for product_id, _ in similar], [self.pants.pk, self.hat.pk])
+        self.assertEqual(TopKTable(self.path).similar(9999), [])
+
+    def test_recommendations_endpoint(self):
+        """おすすめ商品APIが商品情報とスコアを返すかテスト"""
+        write_top_k(update_cooccurrence(), path=self.path, k=5)
+        with override_settings(RECOMMENDATIONS_PATH=self.path):
+            url = reverse("product-recommendations", kwargs={"pk": self.pants.pk})
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["id"] for p in response.data], [self.shirt.pk])
+        self.assertIn("score", response.data[0])
@@ -0,0 +1,161 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from clothes_shop.models import ArchivedPayment, Order, Payment, Watermark
+from clothes_shop.reconciliation import JsonlChargeSource, reconcile_payments, watermark_name
+from clothes_shop.tests.factories import create_user
+
+
+def charge(charge_id, payment_id=None, status="succeeded", refunded=False):
+    metadata = {"payment_id": str(payment_id)} if payment_id else {}
+    return {"id": charge_id, "status": status, "refunded": refunded, "metadata": metadata}
+
+
+class FailingSource:
+    """
+    Yields the first count charges of source, then fails like a dropped connection.
+    """
+
+    def __init__(self, source, count):
+        self.source = source
+        self.count = count
+
+    def charges(self, after=0):
+        for i, item in enumerate(self.source.charges(after)):
+            if i == self.count:
+                raise ConnectionError("connection lost")
+            yield item
+
+
+class ReconcilePaymentsTest(TestCase):
+
+    def setUp(self):
+        order = Order.objects.create(user=create_user(), order_status="paid", total_price=1000)
+        self.payments = [
+            Payment.objects.create(
+                order=order,
+                payment_date=timezone.now(),
+                payment_option="card",
+                payment_status="succeeded",
+                stripe_charge_id=charge_id,
+            )
+            for charge_id in ("ch_ok", "ch_refunded", "", "ch_local", "ch_gone")
+        ]
+        ok, refunded, missing_id, other_id, _ = [payment.pk for payment in self.payments]
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = Path(tmp_dir.name) / "charges.jsonl"
+        self.write_charges(
+            [
+                charge("ch_manual"),
+                charge("ch_ok", ok),
+                charge("ch_refunded", refunded, refunded=True),
+                charge("ch_new", missing_id, status="failed"),
+                charge("ch_remote", other_id),
+                charge("ch_orphan", self.payments[-1].pk + 100),
+            ]
+        )
+
+    def write_charges(self, charges):
+        self.path.write_text("".join(json.dumps(item) + "\n" for item in charges))
+
+    def reconcile(self, source=None, **kwargs):
+        mismatches = []
+        counts = reconcile_payments(
+            source or JsonlChargeSource(self.path),
+            on_mismatch=lambda kind, payment_id, _: mismatches.append((kind, payment_id)),
+            **kwargs,
+        )
+        return counts, mismatches
+
+    def test_report_mismatches(self):
+        """課金一覧と支払いを突き合わせ、不一致を種類ごとに報告するだけで変更しないかテスト"""
+        counts, mismatches = self.reconcile()
+        _, refunded, missing_id, other_id, gone = [payment.pk for payment in self.payments]
+        self.assertEqual(
+            mismatches,
+            [
+                ("unlinked_charge", None),
+                ("status_mismatch", refunded),
+                ("charge_id_missing", missing_id),
+                ("charge_id_mismatch", other_id),
+                ("missing_charge", gone),
+                ("unknown_charge", gone + 100),
+            ],
+        )
+        self.assertEqual(counts["checked"], 5)
+        self.assertEqual(Payment.objects.filter(payment_status="succeeded").count(), 5)
+
+    def test_fix(self):
+        """修正できる不一致だけがStripeの値で一括更新されるかテスト"""
+        self.reconcile(fix=True, batch_size=2)
+        self.assertEqual(
+            [
+                (payment.payment_status, payment.stripe_charge_id)
+                for payment in Payment.objects.order_by("pk")
+            ],
+            [
+                ("succeeded", "ch_ok"),
+                ("refunded", "ch_refunded"),
+                ("failed", "ch_new"),
+                ("succeeded", "ch_local"),
+                ("succeeded", "ch_gone"),
+            ],
+        )
+        self.assertFalse(Watermark.objects.exists())
+
+    def test_resume_from_checkpoint(self):
+        """中断した場合、次回は保存した位置から再開するかテスト"""
+        with self.assertRaises(ConnectionError):
+            self.reconcile(FailingSource(JsonlChargeSource(self.path), 4), fix=True, batch_size=2)
+        checkpoint = Watermark.objects.get(name=watermark_name(fix=True)).last_id
+        self.assertEqual(checkpoint, self.payments[1].pk)
+        self.assertEqual(Payment.objects.get(pk=checkpoint).payment_status, "refunded")
+
+        counts, mismatches = self.reconcile(fix=True, batch_size=2)
+        self.assertTrue(all(payment_id > checkpoint for _, payment_id in mismatches if payment_id))
+        self.assertEqual(counts["checked"], 3)
+        self.assertEqual(Payment.objects.get(pk=self.payments[2].pk).payment_status, "failed")
+
+    def test_resume_reports_unlinked_charges_once(self):
+        """再開した実行で、報告済みの課金IDのない課金を再び報告しないかテスト"""
+        with self.assertRaises(ConnectionError):
+            self.reconcile(FailingSource(JsonlChargeSource(self.path), 4), batch_size=2)
+        counts, mismatches = self.reconcile(batch_size=2)
+        self.assertNotIn(("unlinked_charge", None), mismatches)
+        self.assertEqual(counts["unlinked_charge"], 0)
+
+    def test_checkpoint_per_mode(self):
+        """報告のみの実行が--fixのチェックポイントから再開しないかテスト"""
+        with self.assertRaises(ConnectionError):
+            self.reconcile(FailingSource(JsonlChargeSource(self.path), 4), fix=True, batch_size=2)
+        counts, _ = self.reconcile(batch_size=2)
+        self.assertEqual(counts["checked"], 5)
+        self.assertTrue(Watermark.objects.filter(name=watermark_name(fix=True)).exists())
+
+    def test_archived_payment_is_not_unknown(self):
+        """アーカイブ済みの支払いの課金をunknown_chargeとして報告しないかテスト"""
+        ArchivedPayment.objects.create(id=self.payments[-1].pk + 100, order_id=1)
+        counts, mismatches = self.reconcile()
+        self.assertEqual(counts["unknown_charge"], 0)
+        self.assertNotIn("unknown_charge", [kind for kind, _ in mismatches])
+
+    def test_unsorted_source(self):
+        """payment_id順に並んでいない課金一覧はエラーになるかテスト"""
+        ok, refunded = self.payments[0].pk, self.payments[1].pk
+        self.write_charges([charge("ch_refunded", refunded), charge("ch_ok", ok)])
+        with self.assertRaises(ValueError):
+            self.reconcile()
+
+    def test_command(self):
+        """reconcile_paymentsコマンドで不一致の件数が出力されるかテスト"""
+        out = StringIO()
+        call_command("reconcile_payments", "--source", str(self.path), "--fix", stdout=out)
+        self.assertIn("Checked 5 payments: 6 mismatches, 2 fixed.", out.getvalue())
+        self.assertIn("  status_mismatch: 1", out.getvalue())
@@ -0,0 +1,84 @@
+import gzip
+
+import brotli
+import msgpack
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from clothes_shop.middleware import CompressionMiddleware, choose_encoding, compress_stream
+from clothes_shop.renderers import to_columns
+from clothes_shop.tests.factories import create_product
+
+
+class WireFormatHelperTest(SimpleTestCase):
+
+    def test_uniform_rows_become_columns(self):
+        """同じキーを持つ行の一覧が列名と配列に変換されるかテスト"""
+        rows = [{"id": 1, "title": "a"}, {"id": 2, "title": "b"}]
+        self.assertEqual(
+            to_columns(rows), {"columns": ["id", "title"], "rows": [[1, "a"], [2, "b"]]}
+        )
+        self.assertEqual(to_columns([{"id": 1}, {"name": "x"}]), [{"id": 1}, {"name": "x"}])
+        self.assertEqual(to_columns({"id": 1}), {"id": 1})
+
+    def test_choose_encoding(self):
+        """Accept-Encodingの優先度に従って圧縮形式を選ぶかテスト"""
+        self.assertEqual(choose_encoding("gzip, deflate, br"), "br")
+        self.assertEqual(choose_encoding("gzip;q=1.0, br;q=0.5"), "gzip")
+        self.assertEqual(choose_encoding("br;q=0, gzip"), "gzip")
+        self.assertIsNone(choose_encoding("identity"))
+
+    def test_stream_chunks_are_flushed(self):
+        """ストリームの各チャンクが即座に展開できる形で出力されるかテスト"""
+        decompressor = brotli.Decompressor()
+        chunks = compress_stream([b"data: 1\n\n", b"data: 2\n\n"], "br")
+        self.assertEqual(decompressor.process(next(chunks)), b"data: 1\n\n")
+        rest = b"".join(decompressor.process(chunk) for chunk in chunks)
+        self.assertEqual(rest, b"data: 2\n\n")
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class WireFormatTests(APITestCase):
+
+    def setUp(self):
+        for i in range(5):
+            create_product(title=f"シャツ{i}")
+        self.url = reverse("product-list-create")
+
+    def test_msgpack_and_columnar(self):
+        """Acceptや?format=でMessagePack・列形式JSONを返すかテスト"""
+        expected = self.client.get(self.url).json()
+        response = self.client.get(self.url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+
+        body = self.client.get(self.url, {"format": "columnar"}).json()
+        self.assertEqual(body["columns"], list(expected[0]))
+        self.assertEqual(body["rows"][0], list(expected[0].values()))
+
+    def test_compression(self):
+        """しきい値以上の応答がbr/gzipで圧縮されるかテスト"""
+        plain = self.client.get(self.url).content
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), plain)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(gzip.decompress(response.content), plain)
+
+        # しきい値未満の応答はそのまま返す
+        response = self.client.get(self.url, {"ids": "0"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_event_stream_not_compressed(self):
+        """イベントストリームは圧縮しないかテスト"""
+        middleware = CompressionMiddleware(
+            lambda request: StreamingHttpResponse(
+                iter([b"data: 1\n\n"]), content_type="text/event-stream"
+            )
+        )
+        response = middleware(RequestFactory().get("/", HTTP_ACCEPT_ENCODING="br"))
+        self.assertFalse(response.has_header("Content-Encoding"))
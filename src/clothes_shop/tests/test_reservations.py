@@ -0,0 +1,132 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from clothes_shop.models import CartItem, Order, StockReservation
+from clothes_shop.reservations import (
+    InsufficientStock,
+    consume_stock,
+    hold_stock,
+    release_expired_holds,
+)
+from clothes_shop.tests.factories import create_product, create_user
+
+
+class StockReservationTest(TestCase):
+
+    def setUp(self):
+        self.product = create_product(stock_quantity=5)
+        self.user = create_user("taro")
+        self.other = create_user("hanako")
+
+    def test_hold_stock_reserves_and_rejects_oversell(self):
+        """在庫を確保でき、在庫を超える確保は拒否されるかテスト"""
+        hold_stock(self.user.pk, self.product.pk, 3)
+        with self.assertRaises(InsufficientStock):
+            hold_stock(self.other.pk, self.product.pk, 3)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 3)
+        self.assertEqual(self.product.available_quantity, 2)
+        self.assertFalse(StockReservation.objects.filter(user=self.other).exists())
+
+    def test_hold_stock_adjusts_by_difference(self):
+        """数量変更時は差分だけ確保数が増減するかテスト"""
+        hold_stock(self.user.pk, self.product.pk, 2)
+        hold_stock(self.user.pk, self.product.pk, 5)
+        hold_stock(self.user.pk, self.product.pk, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 1)
+
+    def test_product_update_is_last(self):
+        """商品行をロックするUPDATEが確保の処理の最後の文になるかテスト"""
+        for hold in (
+            lambda: hold_stock(self.user.pk, self.product.pk, 2),
+            lambda: hold_stock(self.user.pk, self.product.pk, 0),
+            lambda: consume_stock(self.user.pk, self.product.pk, 1),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                hold()
+            statements = [query["sql"] for query in queries if "SAVEPOINT" not in query["sql"]]
+            self.assertTrue(statements[-1].startswith('UPDATE "clothes_shop_product"'))
+
+    def test_reservation_deleted_by_sweeper(self):
+        """期限切れの確保が解放処理で削除されていても、作り直して確保できるかテスト"""
+        hold_stock(self.user.pk, self.product.pk, 2, ttl=-1)
+        release_expired_holds()
+        hold_stock(self.user.pk, self.product.pk, 3)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 3)
+        self.assertEqual(StockReservation.objects.get(user=self.user).quantity, 3)
+
+    def test_release_expired_holds(self):
+        """期限切れの確保がまとめて解放されるかテスト"""
+        hold_stock(self.user.pk, self.product.pk, 2, ttl=-1)
+        hold_stock(self.other.pk, self.product.pk, 1)
+        released = release_expired_holds(batch_size=1)
+        self.assertEqual(released, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 1)
+        self.assertFalse(StockReservation.objects.filter(user=self.user).exists())
+
+    def test_consume_stock_uses_hold_first(self):
+        """購入時に確保分から在庫が引き当てられるかテスト"""
+        hold_stock(self.user.pk, self.product.pk, 2)
+        hold_stock(self.other.pk, self.product.pk, 3)
+        consume_stock(self.user.pk, self.product.pk, 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 3)
+        self.assertEqual(self.product.reserved_quantity, 3)
+        with self.assertRaises(InsufficientStock):
+            consume_stock(self.user.pk, self.product.pk, 1)
+
+
+class CartItemReservationTests(APITestCase):
+
+    def setUp(self):
+        self.product = create_product(stock_quantity=3)
+        self.user = create_user()
+        self.list_url = reverse("cartitem-list-create")
+
+    def test_add_to_cart_holds_stock(self):
+        """カート追加で在庫が確保され、商品APIの販売可能数に反映されるかテスト"""
+        data = {"user": self.user.pk, "product": self.product.pk, "quantity": 2}
+        response = self.client.post(self.list_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(reverse("product-detail", kwargs={"pk": self.product.pk}))
+        self.assertEqual(response.data["available_quantity"], 1)
+
+        data["quantity"] = 2
+        response = self.client.post(self.list_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_remove_from_cart_releases_stock(self):
+        """カート削除で確保が解放されるかテスト"""
+        data = {"user": self.user.pk, "product": self.product.pk, "quantity": 2}
+        self.client.post(self.list_url, data, format="json")
+        cart_item = CartItem.objects.get()
+        response = self.client.delete(reverse("cartitem-detail", kwargs={"pk": cart_item.pk}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 0)
+
+    def test_order_item_consumes_cart_hold(self):
+        """注文明細の作成で確保済み在庫が引き当てられるかテスト"""
+        self.client.post(
+            self.list_url,
+            {"user": self.user.pk, "product": self.product.pk, "quantity": 2},
+            format="json",
+        )
+        order = Order.objects.create(user=self.user, order_status="pending", total_price=3000)
+        response = self.client.post(
+            reverse("orderitem-list-create"),
+            {"order": order.pk, "product": self.product.pk, "quantity": 2, "unit_price": "1500"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 1)
+        self.assertEqual(self.product.reserved_quantity, 0)
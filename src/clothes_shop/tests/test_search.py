@@ -0,0 +1,71 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from clothes_shop.search import InvertedIndexBackend, get_search_backend, tokenize
+from clothes_shop.tests.factories import create_product
+
+
+class TokenizeTest(TestCase):
+
+    def test_tokenize(self):
+        """英単語はそのまま、日本語はバイグラムに分割されるかテスト"""
+        self.assertEqual(tokenize("Slim DENIM"), ["slim", "denim"])
+        self.assertEqual(tokenize("デニムパンツ"), ["デニ", "ニム", "ムパ", "パン", "ンツ"])
+        self.assertEqual(tokenize("Ｔシャツ"), ["t", "シャ", "ャツ"])
+
+
+class InvertedIndexBackendTest(TestCase):
+
+    def setUp(self):
+        self.backend = InvertedIndexBackend()
+        self.backend.load(
+            [
+                (1, "cotton shirt"),
+                (2, "cotton cotton shirt with long sleeves and a relaxed fit"),
+                (3, "denim jacket"),
+            ]
+        )
+
+    def test_bm25_ranking(self):
+        """BM25で関連度順に並ぶかテスト"""
+        result = self.backend.search("cotton")
+        self.assertEqual(result.total, 2)
+        self.assertEqual([product_id for product_id, _ in result.hits], [1, 2])
+
+    def test_incremental_update_and_paging(self):
+        """追加・削除が検索結果に反映され、ページングできるかテスト"""
+        self.backend.add_document(4, "cotton jacket")
+        self.backend.remove(1)
+        result = self.backend.search("cotton jacket", page=2, page_size=1)
+        self.assertEqual(result.total, 3)
+        self.assertEqual(len(result.hits), 1)
+        self.assertNotIn(1, [product_id for product_id, _ in self.backend.search("cotton").hits])
+
+
+# MySQLのFULLTEXTインデックスはコミット前の行を検索できないため転置インデックスで検証する
+@override_settings(PRODUCT_SEARCH_BACKEND="clothes_shop.search.InvertedIndexBackend")
+class ProductSearchApiTests(APITestCase):
+
+    def setUp(self):
+        get_search_backend().reset()
+        self.shirt = create_product(title="コットンシャツ", description="綿100%のシャツ")
+        self.jacket = create_product(title="デニムジャケット", description="デニム素材")
+
+    def test_search_endpoint(self):
+        """検索APIが関連度順の商品とスコアを返すかテスト"""
+        response = self.client.get(reverse("product-search"), {"q": "シャツ"})
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(response.data["results"][0]["id"], self.shirt.pk)
+        self.assertIn("score", response.data["results"][0])
+
+    def test_index_follows_product_changes(self):
+        """商品の保存・削除で検索インデックスが更新されるかテスト"""
+        self.client.get(reverse("product-search"), {"q": "デニム"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jacket.is_deleted = True
+            self.jacket.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product(title="デニムスカート")
+        response = self.client.get(reverse("product-search"), {"q": "デニム"})
+        self.assertEqual([p["title"] for p in response.data["results"]], ["デニムスカート"])
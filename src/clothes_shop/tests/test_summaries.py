@@ -0,0 +1,112 @@
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from clothes_shop.models import CartItem, Favorite, Order, Shipping, WishList
+from clothes_shop.tests.factories import create_product, create_user, durable_cart_cache
+
+
+class UserSummaryViewTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.other = create_user(name="jiro")
+        self.products = [create_product(price=1000 * (i + 1)) for i in range(3)]
+
+    def add_rows(self, user, orders=3):
+        for i, product in enumerate(self.products):
+            CartItem.objects.create(user=user, product=product, quantity=i + 1)
+            Favorite.objects.create(user=user, product=product)
+        WishList.objects.create(user=user, product=self.products[0])
+        for i in range(orders):
+            order = Order.objects.create(user=user, order_status="shipped", total_price=1000)
+            Shipping.objects.create(
+                order=order,
+                shipping_tracking_number=f"TRK{user.pk}-{i}",
+                shipping_date=timezone.now(),
+                shipping_address="Tokyo",
+                address_code="100-0001",
+            )
+        Order.objects.create(user=user, order_status=Order.STATUS_COMPLETED, total_price=500)
+
+    def get_summary(self, user):
+        return self.client.get(reverse("user-summary", args=[user.pk]))
+
+    def test_summary(self):
+        """ユーザー自身の行だけを集計したサマリーを返すかテスト"""
+        self.add_rows(self.user)
+        self.add_rows(self.other)
+        response = self.get_summary(self.user)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        # 1000*1 + 2000*2 + 3000*3
+        self.assertEqual(data["cart"], {"quantity": 6, "total": "14000.00"})
+        self.assertEqual(data["favorite_count"], 3)
+        self.assertEqual(data["wishlist_count"], 1)
+        self.assertEqual(len(data["recent_orders"]), 4)
+        self.assertEqual(data["recent_orders"][0]["order_status"], Order.STATUS_COMPLETED)
+        self.assertEqual(
+            [shipment["shipping_tracking_number"] for shipment in data["pending_shipments"]],
+            [f"TRK{self.user.pk}-{i}" for i in (2, 1, 0)],
+        )
+
+    def test_query_count_does_not_grow(self):
+        """行数が増えてもクエリ数が一定かテスト"""
+        self.add_rows(self.user, orders=1)
+        with self.assertNumQueries(3):
+            self.get_summary(self.user)
+        self.add_rows(self.other, orders=20)
+        with self.assertNumQueries(3):
+            self.get_summary(self.other)
+
+    def test_cached_until_write(self):
+        """サマリーがキャッシュされ、関係する行の更新で破棄されるかテスト"""
+        self.get_summary(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_summary(self.user).json()["favorite_count"], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, product=self.products[0])
+            # コミットまでは破棄しない
+            self.assertEqual(self.get_summary(self.user).json()["favorite_count"], 0)
+        self.assertEqual(self.get_summary(self.user).json()["favorite_count"], 1)
+
+    def test_shipping_invalidates_after_commit(self):
+        """配送の登録でサマリーがコミット後に破棄されるかテスト"""
+        order = Order.objects.create(user=self.user, order_status="shipped", total_price=1000)
+        self.get_summary(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Shipping.objects.create(
+                order=order,
+                shipping_tracking_number="TRK-NEW",
+                shipping_date=timezone.now(),
+                shipping_address="Tokyo",
+                address_code="100-0001",
+            )
+            self.assertEqual(self.get_summary(self.user).json()["pending_shipments"], [])
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        shipments = self.get_summary(self.user).json()["pending_shipments"]
+        self.assertEqual([s["shipping_tracking_number"] for s in shipments], ["TRK-NEW"])
+
+    @override_settings(CART_BACKEND="cache")
+    @durable_cart_cache
+    def test_cache_cart_backend(self):
+        """キャッシュ上のカートの内容がサマリーに反映されるかテスト"""
+        cache.clear()
+        self.get_summary(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("cartitem-list-create"),
+                {"user": self.user.pk, "product": self.products[1].pk, "quantity": 2},
+            )
+        self.assertEqual(response.status_code, 201)
+        cart = self.get_summary(self.user).json()["cart"]
+        self.assertEqual(cart, {"quantity": 2, "total": "4000.00"})
+
+    def test_unknown_user(self):
+        """存在しないユーザーには404を返すかテスト"""
+        self.assertEqual(self.client.get(reverse("user-summary", args=[0])).status_code, 404)
@@ -0,0 +1,102 @@
+import re
+from datetime import timedelta
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from clothes_shop.models import Task, User
+from clothes_shop.task_queue import claim_tasks, requeue_stale_tasks, run_task, task
+
+calls = []
+
+
+@task(name="tests.record")
+def record(value):
+    calls.append(value)
+
+
+@task(name="tests.explode", max_attempts=2)
+def explode():
+    raise RuntimeError("boom")
+
+
+class TaskQueueTest(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_is_single_insert(self):
+        """タスクの登録がINSERT 1回で済むかテスト"""
+        with self.assertNumQueries(1):
+            record.enqueue("a")
+        self.assertEqual(Task.objects.get().args, ["a"])
+
+    def test_worker_runs_due_tasks(self):
+        """実行時刻を過ぎたタスクだけが実行され、完了後に削除されるかテスト"""
+        record.enqueue("now")
+        record.enqueue("later", delay=60)
+        call_command("run_workers", "--processes", "1", "--once", stdout=StringIO())
+        self.assertEqual(calls, ["now"])
+        self.assertEqual(list(Task.objects.values_list("args", flat=True)), [["later"]])
+
+    def test_retry_with_backoff_then_fail(self):
+        """失敗したタスクが間隔を空けて再試行され、上限で失敗扱いになるかテスト"""
+        explode.enqueue()
+        (claimed,) = claim_tasks("w1")
+        self.assertFalse(run_task(claimed))
+        retried = Task.objects.get()
+        self.assertEqual((retried.status, retried.attempts), (Task.STATUS_QUEUED, 1))
+        self.assertGreater(retried.run_at, timezone.now())
+        self.assertIn("boom", retried.last_error)
+        self.assertEqual(claim_tasks("w1"), [])
+
+        (claimed,) = claim_tasks("w1", now=retried.run_at)
+        run_task(claimed)
+        self.assertEqual(Task.objects.get().status, Task.STATUS_FAILED)
+
+    def test_stale_task_is_requeued(self):
+        """ワーカーが落ちて実行中のままのタスクが再実行されるかテスト"""
+        record.enqueue("x")
+        (claimed,) = claim_tasks("dead")
+        Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_tasks(), 1)
+        (reclaimed,) = claim_tasks("w2")
+        self.assertTrue(run_task(reclaimed))
+        # 元のワーカーが後から結果を書き込んでも上書きしない
+        self.assertTrue(run_task(claimed))
+        self.assertEqual(calls, ["x", "x"])
+        self.assertFalse(Task.objects.exists())
+
+
+class EmailVerificationTests(APITestCase):
+
+    def test_signup_sends_verification_email(self):
+        """ユーザー登録で確認メールが送られ、リンクでメール認証が完了するかテスト"""
+        data = {
+            "user_name": "hanako",
+            "email_address": "hanako@example.com",
+            "role": "customer",
+            "address": "Osaka",
+        }
+        response = self.client.post(reverse("user-list-create"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command("run_workers", "--processes", "1", "--once", stdout=StringIO())
+        self.assertEqual(mail.outbox[0].to, ["hanako@example.com"])
+        url = re.search(r"http\S+", mail.outbox[0].body).group()
+        token = parse_qs(urlparse(url).query)["token"][0]
+
+        response = self.client.get(reverse("user-verify-email"), {"token": token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(User.objects.get().email_validated_at)
+
+        response = self.client.get(reverse("user-verify-email"), {"token": token + "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
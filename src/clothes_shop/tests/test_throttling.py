@@ -0,0 +1,91 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from clothes_shop.tests.factories import create_user
+from clothes_shop.throttling import parse_bucket, parse_rate, refill
+
+RATES = {
+    "DEFAULT_THROTTLE_CLASSES": ["clothes_shop.throttling.WriteRateThrottle"],
+    "DEFAULT_THROTTLE_RATES": {"client": "3/min", "route": "10/min", "order-list-create": "2/min"},
+}
+
+
+class TokenBucketTest(SimpleTestCase):
+
+    def test_parse_rate(self):
+        """レート指定を件数と秒数に変換できるかテスト"""
+        self.assertEqual(parse_rate("60/min"), (60, 60))
+        self.assertEqual(parse_rate("5/s"), (5, 1))
+        self.assertIsNone(parse_rate(None))
+
+    def test_parse_bucket(self):
+        """補充速度と連続上限を読み取り、上限の省略時は件数とするかテスト"""
+        self.assertEqual(parse_bucket("60/min"), (60, 1))
+        self.assertEqual(parse_bucket({"rate": "30/min", "burst": 10}), (10, 0.5))
+        self.assertEqual(parse_bucket({"rate": "2/s", "burst": None}), (2, 2))
+        self.assertIsNone(parse_bucket({"rate": None}))
+
+    def test_refill(self):
+        """経過時間に応じて補充され、容量を超えないかテスト"""
+        self.assertEqual(refill(None, 10, 0.5, 100), 10)
+        self.assertEqual(refill((2, 100), 10, 0.5, 104), 4)
+        self.assertEqual(refill((2, 100), 10, 0.5, 200), 10)
+
+
+@override_settings(REST_FRAMEWORK=RATES)
+class WriteRateThrottleTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.order = {"user": self.user.pk, "order_status": "pending", "total_price": "1000"}
+
+    def post_order(self, **extra):
+        return self.client.post(reverse("order-list-create"), self.order, format="json", **extra)
+
+    def test_route_limit_with_retry_after(self):
+        """ルートの上限を超えると429とRetry-Afterを返し、DBに触れないかテスト"""
+        for _ in range(2):
+            self.assertEqual(self.post_order().status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(0):
+            response = self.post_order()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # 2/minで補充されるので、次のトークンまで約30秒
+        self.assertTrue(29 <= int(response["Retry-After"]) <= 30)
+
+        # 参照系と別のクライアントは制限されない
+        self.assertEqual(self.client.get(reverse("order-list-create")).status_code, 200)
+        response = self.post_order(REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_client_limit_across_routes(self):
+        """クライアント単位の上限が全ルートで共有されるかテスト"""
+        self.post_order()
+        self.post_order()
+        data = {
+            "user_name": "jiro",
+            "email_address": "jiro@example.com",
+            "role": "customer",
+            "address": "Tokyo",
+        }
+        response = self.client.post(reverse("user-list-create"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse("user-list-create"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_burst_then_refill(self):
+        """連続上限まで受け付け、補充された分だけ再び受け付けるかテスト"""
+        rates = {"client": {"rate": "60/min", "burst": 2}}
+        with override_settings(REST_FRAMEWORK={**RATES, "DEFAULT_THROTTLE_RATES": rates}):
+            with mock.patch("clothes_shop.throttling.time.time", return_value=1000.0) as now:
+                statuses = [self.post_order().status_code for _ in range(3)]
+                self.assertEqual(statuses, [201, 201, 429])
+                # 1件/秒で補充される
+                now.return_value = 1001.5
+                statuses = [self.post_order().status_code for _ in range(2)]
+                self.assertEqual(statuses, [201, 429])
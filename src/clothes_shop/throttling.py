@@ -0,0 +1,143 @@
+import time
+import uuid
+
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+BUCKET_KEY = "throttle:{scope}:{ident}"
+LOCK_KEY = "throttle:lock:{scope}:{ident}"
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """
+    Parse "<requests>/<period>" (e.g. "60/min") into (requests, seconds).
+    """
+    if not rate:
+        return None
+    requests, period = rate.split("/")
+    return int(requests), PERIODS[period[0]]
+
+
+def parse_bucket(spec):
+    """
+    Parse a throttle rate, either "<requests>/<period>" or
+    {"rate": "<requests>/<period>", "burst": <capacity>}, into
+    (capacity, tokens refilled per second). The capacity defaults to the
+    rate's request count.
+    """
+    if isinstance(spec, dict):
+        rate, burst = spec.get("rate"), spec.get("burst")
+    else:
+        rate, burst = spec, None
+    parsed = parse_rate(rate)
+    if not parsed:
+        return None
+    requests, seconds = parsed
+    return burst or requests, requests / seconds
+
+
+def refill(state, capacity, rate, now):
+    """
+    Return the tokens in a bucket whose state (tokens, updated_at) was saved
+    earlier, or a full bucket when there is no state.
+    """
+    if state is None:
+        return capacity
+    tokens, updated_at = state
+    return min(capacity, tokens + max(now - updated_at, 0) * rate)
+
+
+class WriteRateThrottle(BaseThrottle):
+    """
+    Token-bucket rate limits for unsafe requests, one per client ("client"
+    rate) and one per client and route (the route name's rate, else "route"),
+    from DEFAULT_THROTTLE_RATES (see parse_bucket).
+
+    Each bucket holds up to its burst capacity and refills continuously at its
+    rate; a request takes one token from every bucket that applies, or from
+    none of them. The buckets' states live in the shared cache and are read and
+    written under a short per-bucket lock (cache.add), so worker processes
+    never lose each other's updates. Rejected requests take no tokens.
+    """
+
+    lock_timeout = 1
+    lock_wait = 0.2
+
+    def __init__(self):
+        self.rates = api_settings.DEFAULT_THROTTLE_RATES
+        self.wait_seconds = None
+
+    def get_ident(self, request):
+        # トークンで認証済みならIPではなくユーザーごとに数える
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return super().get_ident(request)
+
+    def get_limits(self, request):
+        ident = self.get_ident(request)
+        limits = []
+        client = parse_bucket(self.rates.get("client"))
+        if client:
+            limits.append(("client", ident, *client))
+        match = request.resolver_match
+        if match and match.url_name:
+            route = parse_bucket(self.rates.get(match.url_name, self.rates.get("route")))
+            if route:
+                limits.append((f"route:{match.url_name}", ident, *route))
+        return limits
+
+    def _lock(self, locks, token):
+        deadline = time.monotonic() + self.lock_wait
+        taken = []
+        # 複数のバケットを同じ順序でロックし、取り合いで互いに待たないようにする
+        for lock in sorted(locks):
+            while not cache.add(lock, token, self.lock_timeout):
+                if time.monotonic() > deadline:
+                    self._unlock(taken, token)
+                    return False
+                time.sleep(0.002)
+            taken.append(lock)
+        return True
+
+    def _unlock(self, locks, token):
+        held = cache.get_many(locks)
+        cache.delete_many([lock for lock in locks if held.get(lock) == token])
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        limits = self.get_limits(request)
+        if not limits:
+            return True
+        keys = [BUCKET_KEY.format(scope=scope, ident=ident) for scope, ident, *_ in limits]
+        locks = [LOCK_KEY.format(scope=scope, ident=ident) for scope, ident, *_ in limits]
+        token = uuid.uuid4().hex
+        if not self._lock(locks, token):
+            # 同じクライアントの更新が集中している。すぐに再試行させる
+            self.wait_seconds = 1
+            return False
+        try:
+            now = time.time()
+            states = cache.get_many(keys)
+            buckets = {}
+            wait = 0
+            for key, (_, _, capacity, rate) in zip(keys, limits):
+                tokens = refill(states.get(key), capacity, rate, now)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                buckets[key] = (tokens, capacity, rate)
+            if wait:
+                self.wait_seconds = wait
+                return False
+            for key, (tokens, capacity, rate) in buckets.items():
+                # 満杯に戻るまで保持すれば十分 (それ以降は状態がなくても満杯とみなす)
+                cache.set(key, (tokens - 1, now), int(capacity / rate) + 1)
+            return True
+        finally:
+            self._unlock(locks, token)
+
+    def wait(self):
+        return self.wait_seconds
@@ -11,16 +11,48 @@ urlpatterns = [
     # path('api/clothes/<int:pk>/', views.ClothesDetailView.as_view(), name='clothes-detail'),
     # Product API URLs
     path("api/products/", views.ProductListCreateView.as_view(), name="product-list-create"),
+    path("api/products/search/", views.ProductSearchView.as_view(), name="product-search"),
     path("api/products/<int:pk>/", views.ProductDetailView.as_view(), name="product-detail"),
+    path(
+        "api/products/<int:pk>/recommendations/",
+        views.ProductRecommendationView.as_view(),
+        name="product-recommendations",
+    ),
+    path("api/products/<int:pk>/image/", views.ProductImageView.as_view(), name="product-image"),
+    # Media URLs
+    path("media/images/<str:name>", views.product_image_file, name="product-image-file"),
+    # Events API URLs
+    path("api/events/", views.event_stream, name="events"),
+    # Batch API URLs
+    path("api/batch/", views.BatchView.as_view(), name="batch"),
+    # Inventory API URLs
+    path("api/inventory/adjust/", views.InventoryAdjustView.as_view(), name="inventory-adjust"),
+    # Autocomplete API URLs
+    path("api/autocomplete/", views.AutocompleteView.as_view(), name="autocomplete"),
+    # Analytics API URLs
+    path("api/analytics/sales/", views.SalesAnalyticsView.as_view(), name="sales-by-date"),
+    path(
+        "api/analytics/sales/brands/",
+        views.SalesAnalyticsView.as_view(group_by="brand"),
+        name="sales-by-brand",
+    ),
+    path(
+        "api/analytics/sales/clothes-types/",
+        views.SalesAnalyticsView.as_view(group_by="clothes_type"),
+        name="sales-by-clothes-type",
+    ),
     # Order API URLs
     path("api/orders/", views.OrderListCreateView.as_view(), name="order-list-create"),
+    path("api/orders/transition/", views.OrderTransitionView.as_view(), name="order-transition"),
     path("api/orders/<int:pk>/", views.OrderDetailView.as_view(), name="order-detail"),
     # Rating API URLs
     path("api/ratings/", views.RatingListCreateView.as_view(), name="rating-list-create"),
     path("api/ratings/<int:pk>/", views.RatingDetailView.as_view(), name="rating-detail"),
     # User API URLs
     path("api/users/", views.UserListCreateView.as_view(), name="user-list-create"),
+    path("api/users/verify-email/", views.VerifyEmailView.as_view(), name="user-verify-email"),
     path("api/users/<int:pk>/", views.UserDetailView.as_view(), name="user-detail"),
+    path("api/users/<int:pk>/summary/", views.UserSummaryView.as_view(), name="user-summary"),
     # Favorite API URLs
     path("api/favorites/", views.FavoriteListCreateView.as_view(), name="favorite-list-create"),
     path("api/favorites/<int:pk>/", views.FavoriteDetailView.as_view(), name="favorite-detail"),
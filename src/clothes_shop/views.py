@@ -1,8 +1,41 @@
+import copy
+import json
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponseNotModified,
+    JsonResponse,
+    QueryDict,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
-from rest_framework import generics, status
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
+from rest_framework import generics, serializers, status
 from rest_framework.decorators import api_view
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
-
+from rest_framework.views import APIView
+
+from .analytics import sales_summary
+from .archive import get_archived_order
+from .autocomplete import autocomplete_index
+from .cart_store import cart_store, is_cache_backend
+from .events import TOPIC_PATTERN, broadcaster, feed, format_event
+from .idempotency import IdempotentCreateMixin
+from .images import CONTENT_TYPES, InvalidImage, blob_path, image_url, store_original
+from .inventory import adjust_inventory
+from .memberships import favorite_product_ids, wishlist_product_ids
 from .models import (
     Brand,
     CartItem,
@@ -20,23 +53,43 @@ from .models import (
     User,
     WishList,
 )
+from .orders import transition_orders
+from .recommendations import top_k_table
+from .reservations import InsufficientStock, consume_stock, sync_cart_hold
+from .search import get_search_backend
 from .serializers import (
+    ArchivedOrderSerializer,
+    BatchSerializer,
     BrandSerializer,
     CartItemSerializer,
     ClothesSerializer,
     ClothesTypeSerializer,
     FavoriteSerializer,
+    InventoryAdjustSerializer,
+    InventoryResultSerializer,
     OrderItemSerializer,
     OrderSerializer,
+    OrderTransitionResultSerializer,
+    OrderTransitionSerializer,
     PaymentSerializer,
+    ProductImageSerializer,
     ProductSerializer,
     RatingSerializer,
+    SalesQuerySerializer,
+    SalesSummarySerializer,
     ShippingSerializer,
     SizeSerializer,
     TargetSerializer,
     UserSerializer,
+    UserSummarySerializer,
     WishListSerializer,
 )
+from .summaries import get_user_summary, invalidate_user_summary
+from .tasks import (
+    generate_product_image_variants,
+    load_email_verification_token,
+    send_verification_email,
+)
 
 
 @api_view(["GET", "POST"])
@@ -100,15 +153,79 @@ def clothes_detail(request, pk):
 #     def get_object(self):
 #         return get_object_or_404(Clothes, pk=self.kwargs.get('pk'))
 
+
+def _user_param(request):
+    user_id = request.query_params.get("user")
+    if user_id is None:
+        return None
+    try:
+        return int(user_id)
+    except ValueError:
+        raise serializers.ValidationError({"user": ["A valid integer is required."]})
+
+
+MULTI_GET_MAX_IDS = 100
+
+
+def _ids_param(request):
+    ids = request.query_params.get("ids")
+    if ids is None:
+        return None
+    try:
+        ids = [int(pk) for pk in ids.split(",") if pk]
+    except ValueError:
+        raise serializers.ValidationError({"ids": ["Enter a comma-separated list of integers."]})
+    if len(ids) > MULTI_GET_MAX_IDS:
+        raise serializers.ValidationError(
+            {"ids": [f"Ensure there are no more than {MULTI_GET_MAX_IDS} ids."]}
+        )
+    return ids
+
+
+class MultiGetMixin:
+    """
+    ?ids=1,2,3 limits a list view to those primary keys, fetched in one query.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        ids = _ids_param(self.request)
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids)
+        return queryset
+
+
+# 各ビューのquery_budgetは、キャッシュが空の状態で1リクエストが実行してよいクエリ数の上限。
+# データ量によって増えない値で、tests/test_query_budgets.pyが全ルートについて検査する。
+# 読み書きの両方を受けるビューは、書き込み(POST・PUT・PATCH・DELETE)の上限をwrite_query_budgetに持つ
+
 # Product API Views
 
 
-class ProductListCreateView(generics.ListCreateAPIView):
+class ProductListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    """
+    List products, or create a product. With ?user=<id> each product is
+    annotated with is_favorite / in_wishlist for that user.
+    """
+
+    query_budget = 3
+    write_query_budget = 7
+
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        user_id = _user_param(self.request) if self.request.method == "GET" else None
+        if user_id is not None:
+            context["favorite_ids"] = favorite_product_ids(user_id)
+            context["wishlist_ids"] = wishlist_product_ids(user_id)
+        return context
+
 
 class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 4
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
@@ -116,25 +233,258 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(Product, pk=self.kwargs.get("pk"))
 
 
-class OrderListCreateView(generics.ListCreateAPIView):
-    queryset = Order.objects.all()
+class ProductImageView(generics.GenericAPIView):
+    """
+    Upload a product's image as multipart "image" (POST), or remove it (DELETE).
+    The thumbnail, grid and detail variants are generated by a worker, unless
+    another product already has the same image; until then images is null.
+    Files no product uses any more are deleted by the sweep_images command.
+    """
+
+    query_budget = 7
+
+    serializer_class = ProductImageSerializer
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request, pk):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # 読み込み・検証・保存は商品行をロックする前に済ませ、在庫の確保などを待たせない
+        try:
+            original = store_original(serializer.validated_data["image"])
+        except InvalidImage as e:
+            raise serializers.ValidationError({"image": [str(e)]})
+        # 同じ画像の変種が生成済みなら使い回し、なければワーカーに生成させる
+        variants = (
+            Product.objects.filter(image=original)
+            .exclude(image_variants={})
+            .values_list("image_variants", flat=True)
+            .first()
+        )
+        with transaction.atomic():
+            product = get_object_or_404(Product.objects.select_for_update(), pk=pk)
+            if original != product.image:
+                product.image, product.image_variants = original, variants or {}
+                product.save(update_fields=["image", "image_variants", "updated_at"])
+                if not variants:
+                    generate_product_image_variants.enqueue(product.pk, original)
+        return Response(
+            {
+                "image": image_url(product.image),
+                "images": ProductSerializer(product).data["images"],
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    def delete(self, request, pk):
+        updated = Product.objects.filter(pk=pk).update(
+            image="", image_variants={}, updated_at=timezone.now()
+        )
+        if not updated:
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@require_GET
+def product_image_file(request, name):
+    """
+    Serve a stored product image. Names are content hashes, so a name always
+    refers to the same bytes and may be cached for good. In production the
+    web server or CDN should serve PRODUCT_IMAGE_DIR directly.
+    """
+    try:
+        path = blob_path(name)
+    except ValueError:
+        raise Http404
+    etag = f'"{name.split(".")[0]}"'
+    # 途中で圧縮されてW/付きになったETagも同じ内容とみなす (弱い比較)
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if "*" in if_none_match or etag in (tag.removeprefix("W/") for tag in if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            response = FileResponse(open(path, "rb"), content_type=CONTENT_TYPES[path.suffix[1:]])
+        except FileNotFoundError:
+            raise Http404
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+product_image_file.query_budget = 0
+
+
+def _int_param(request, name, default, maximum=None):
+    try:
+        value = int(request.query_params.get(name, default))
+    except ValueError:
+        raise serializers.ValidationError({name: ["A valid integer is required."]})
+    if value < 1:
+        raise serializers.ValidationError({name: ["Ensure this value is greater than 0."]})
+    return min(value, maximum) if maximum else value
+
+
+class ProductSearchView(generics.GenericAPIView):
+    """
+    Full-text search over product titles and descriptions, ranked by relevance.
+    ?q=<query>&page=<n>&page_size=<n>
+    """
+
+    query_budget = 2
+
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+
+    def get(self, request):
+        page = _int_param(request, "page", 1)
+        page_size = _int_param(request, "page_size", 20, maximum=100)
+        result = get_search_backend().search(
+            request.query_params.get("q", ""), page=page, page_size=page_size
+        )
+        products = self.get_queryset().in_bulk([product_id for product_id, _ in result.hits])
+        results = []
+        for product_id, score in result.hits:
+            if product_id in products:
+                item = self.get_serializer(products[product_id]).data
+                item["score"] = round(float(score), 4)
+                results.append(item)
+        return Response(
+            {"count": result.total, "page": page, "page_size": page_size, "results": results}
+        )
+
+
+class AutocompleteView(generics.GenericAPIView):
+    """
+    Suggest product titles and brand names starting with ?q=, most purchased first.
+    """
+
+    query_budget = 0
+
+    def get(self, request):
+        limit = _int_param(request, "limit", 10, maximum=20)
+        return Response(autocomplete_index.suggest(request.query_params.get("q", ""), limit))
+
+
+class ProductRecommendationView(generics.GenericAPIView):
+    """
+    List products most often bought together with a product (?limit=, default 10).
+    """
+
+    query_budget = 1
+
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+
+    def get(self, request, pk):
+        limit = _int_param(request, "limit", 10, maximum=100)
+        similar = top_k_table.similar(pk, limit=limit)
+        products = self.get_queryset().in_bulk([product_id for product_id, _ in similar])
+        data = []
+        for product_id, score in similar:
+            if product_id in products and not products[product_id].is_deleted:
+                item = self.get_serializer(products[product_id]).data
+                item["score"] = round(score, 4)
+                data.append(item)
+        return Response(data)
+
+
+class SalesAnalyticsView(generics.GenericAPIView):
+    """
+    Units and revenue grouped by day, brand or clothes type, read from SalesRollup.
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD&brand=<id>&clothes_type=<id>
+    """
+
+    query_budget = 1
+
+    serializer_class = SalesSummarySerializer
+    group_by = "date"
+
+    def get(self, request):
+        params = SalesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        rows = sales_summary(self.group_by, **params.validated_data)
+        return Response(self.get_serializer(rows, many=True).data)
+
+
+class InventoryAdjustView(generics.GenericAPIView):
+    """
+    Adjust the stock of many products at once:
+    {"entries": [{"product": id, "delta": n} or {"product": id, "quantity": n}, ...]}.
+    Returns one result per entry (see inventory.adjust_inventory).
+    """
+
+    query_budget = 5
+
+    serializer_class = InventoryAdjustSerializer
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = adjust_inventory(serializer.validated_data["entries"])
+        return Response(InventoryResultSerializer(results, many=True).data)
+
+
+class OrderListCreateView(IdempotentCreateMixin, MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 3
+    write_query_budget = 4
+    queryset = Order.objects.prefetch_related("order_items")
     serializer_class = OrderSerializer
 
+    def perform_create(self, serializer):
+        order = serializer.save()
+        if is_cache_backend():
+            # チェックアウト時点のカートをテーブルへ反映しておく
+            cart_store.flush_user(order.user_id)
+
+
+class OrderTransitionView(generics.GenericAPIView):
+    """
+    Move many orders to a status at once:
+    {"status": ..., "orders": [{"id": ...}, ...]} (see orders.transition_orders).
+    """
+
+    query_budget = 6
+
+    serializer_class = OrderTransitionSerializer
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        results = transition_orders(data["orders"], data["status"], data["payment_option"])
+        return Response(OrderTransitionResultSerializer(results, many=True).data)
+
 
 class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 2
+    write_query_budget = 4
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
 
     def get_object(self):
         return get_object_or_404(Order, pk=self.kwargs.get("pk"))
 
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # ホットテーブルにない注文はアーカイブから読み取り専用で返す
+            archived = get_archived_order(self.kwargs.get("pk"))
+            if archived is None:
+                raise
+            return Response(ArchivedOrderSerializer(archived).data)
+
 
-class RatingListCreateView(generics.ListCreateAPIView):
+class RatingListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 3
     queryset = Rating.objects.all()
     serializer_class = RatingSerializer
 
 
 class RatingDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = Rating.objects.all()
     serializer_class = RatingSerializer
 
@@ -142,12 +492,44 @@ class RatingDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(Rating, pk=self.kwargs.get("pk"))
 
 
-class UserListCreateView(generics.ListCreateAPIView):
+class UserListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 4
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
+    @transaction.atomic
+    def perform_create(self, serializer):
+        user = serializer.save()
+        # 確認メールの送信はワーカーに任せ、ここではタスクの登録だけ行う
+        send_verification_email.enqueue(user.pk)
+
+
+class VerifyEmailView(generics.GenericAPIView):
+    """
+    Confirm a user's email address with the ?token= sent by send_verification_email.
+    """
+
+    query_budget = 2
+
+    def get(self, request):
+        try:
+            payload = load_email_verification_token(request.query_params.get("token", ""))
+        except signing.BadSignature:
+            raise serializers.ValidationError({"token": ["Invalid or expired token."]})
+        # トークン発行後にメールアドレスが変更されていれば無効
+        user = get_object_or_404(
+            User, pk=payload["user"], email_address=payload["email"], is_deleted=False
+        )
+        if user.email_validated_at is None:
+            user.email_validated_at = timezone.now()
+            user.save(update_fields=["email_validated_at", "updated_at"])
+        return Response({"id": user.pk, "email_validated_at": user.email_validated_at})
+
 
 class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 3
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
@@ -155,12 +537,36 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(User, pk=self.kwargs.get("pk"))
 
 
-class FavoriteListCreateView(generics.ListCreateAPIView):
-    queryset = Favorite.objects.all()
+class UserSummaryView(generics.GenericAPIView):
+    """
+    Cart, favorite and wishlist counts, recent orders and pending shipments of a
+    user in one response (see summaries.compute_user_summary).
+    """
+
+    query_budget = 3
+
+    serializer_class = UserSummarySerializer
+
+    def get(self, request, pk):
+        return Response(get_user_summary(pk, lambda summary: self.get_serializer(summary).data))
+
+
+class FavoriteListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 3
     serializer_class = FavoriteSerializer
 
+    def get_queryset(self):
+        queryset = Favorite.objects.all()
+        user_id = _user_param(self.request)
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        return queryset
+
 
 class FavoriteDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = Favorite.objects.all()
     serializer_class = FavoriteSerializer
 
@@ -168,12 +574,22 @@ class FavoriteDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(Favorite, pk=self.kwargs.get("pk"))
 
 
-class WishListListCreateView(generics.ListCreateAPIView):
-    queryset = WishList.objects.all()
+class WishListListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 3
     serializer_class = WishListSerializer
 
+    def get_queryset(self):
+        queryset = WishList.objects.all()
+        user_id = _user_param(self.request)
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        return queryset
+
 
 class WishListDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = WishList.objects.all()
     serializer_class = WishListSerializer
 
@@ -181,25 +597,113 @@ class WishListDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(WishList, pk=self.kwargs.get("pk"))
 
 
+def _sync_cart_holds(*keys):
+    try:
+        for user_id, product_id in sorted(set(keys)):
+            sync_cart_hold(user_id, product_id)
+    except InsufficientStock as e:
+        raise serializers.ValidationError({"quantity": [str(e)]})
+    # CartItemにシグナルを付けるとflush_cartsの一括削除が1行ずつになるので、ここで破棄する
+    for user_id in {user_id for user_id, _ in keys}:
+        invalidate_user_summary(user_id)
+
+
 class CartItemListCreateView(generics.ListCreateAPIView):
-    queryset = CartItem.objects.all()
+    """
+    List cart items (optionally ?user=), or add an item to a cart.
+
+    With CART_BACKEND = "cache" the user's cart is served from the cache store
+    and POST adds quantity to the user's line for the product; a negative
+    quantity decreases it and reaching 0 removes it. The response is the
+    resulting line (quantity 0 once removed).
+    """
+
+    query_budget = 1
+    write_query_budget = 15
+
     serializer_class = CartItemSerializer
 
+    def get_queryset(self):
+        queryset = CartItem.objects.all()
+        user_id = _user_param(self.request)
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        user_id = _user_param(request)
+        if is_cache_backend() and user_id is not None:
+            return Response(cart_store.items(user_id))
+        return super().list(request, *args, **kwargs)
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        if is_cache_backend():
+            data = serializer.validated_data
+            try:
+                quantity = cart_store.add(data["user"].pk, data["product"].pk, data["quantity"])
+            except InsufficientStock as e:
+                raise serializers.ValidationError({"quantity": [str(e)]})
+            invalidate_user_summary(data["user"].pk)
+            # 応答には送られた増減ではなく、合算後のカートの行を返す
+            serializer.instance = CartItem(
+                user=data["user"], product=data["product"], quantity=quantity
+            )
+            return
+        cart_item = serializer.save()
+        _sync_cart_holds((cart_item.user_id, cart_item.product_id))
+
 
 class CartItemDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 9
     queryset = CartItem.objects.all()
     serializer_class = CartItemSerializer
 
     def get_object(self):
-        return get_object_or_404(CartItem, pk=self.kwargs.get("pk"))
-
-
-class OrderItemListCreateView(generics.ListCreateAPIView):
+        cart_item = get_object_or_404(CartItem, pk=self.kwargs.get("pk"))
+        if is_cache_backend() and self.request.method not in SAFE_METHODS:
+            # 未反映の変更をテーブルへ書き出してから行を更新する
+            cart_store.flush_user(cart_item.user_id)
+            cart_item = get_object_or_404(CartItem, pk=self.kwargs.get("pk"))
+        return cart_item
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        before = (serializer.instance.user_id, serializer.instance.product_id)
+        cart_item = serializer.save()
+        _sync_cart_holds(before, (cart_item.user_id, cart_item.product_id))
+        if is_cache_backend():
+            cart_store.invalidate(before[0])
+            cart_store.invalidate(cart_item.user_id)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        _sync_cart_holds((instance.user_id, instance.product_id))
+        if is_cache_backend():
+            cart_store.invalidate(instance.user_id)
+
+
+class OrderItemListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 11
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
 
+    @transaction.atomic
+    def perform_create(self, serializer):
+        order_item = serializer.save()
+        # カートで確保済みの在庫を優先して引き当てる
+        try:
+            consume_stock(order_item.order.user_id, order_item.product_id, order_item.quantity)
+        except InsufficientStock as e:
+            raise serializers.ValidationError({"quantity": [str(e)]})
+
 
 class OrderItemDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
 
@@ -207,12 +711,16 @@ class OrderItemDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(OrderItem, pk=self.kwargs.get("pk"))
 
 
-class PaymentListCreateView(generics.ListCreateAPIView):
+class PaymentListCreateView(IdempotentCreateMixin, MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
 
 
 class PaymentDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
 
@@ -220,12 +728,16 @@ class PaymentDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(Payment, pk=self.kwargs.get("pk"))
 
 
-class ShippingListCreateView(generics.ListCreateAPIView):
+class ShippingListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = Shipping.objects.all()
     serializer_class = ShippingSerializer
 
 
 class ShippingDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 3
     queryset = Shipping.objects.all()
     serializer_class = ShippingSerializer
 
@@ -233,12 +745,16 @@ class ShippingDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(Shipping, pk=self.kwargs.get("pk"))
 
 
-class SizeListCreateView(generics.ListCreateAPIView):
+class SizeListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 1
     queryset = Size.objects.all()
     serializer_class = SizeSerializer
 
 
 class SizeDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = Size.objects.all()
     serializer_class = SizeSerializer
 
@@ -246,12 +762,16 @@ class SizeDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(Size, pk=self.kwargs.get("pk"))
 
 
-class TargetListCreateView(generics.ListCreateAPIView):
+class TargetListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 1
     queryset = Target.objects.all()
     serializer_class = TargetSerializer
 
 
 class TargetDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = Target.objects.all()
     serializer_class = TargetSerializer
 
@@ -259,12 +779,16 @@ class TargetDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(Target, pk=self.kwargs.get("pk"))
 
 
-class ClothesTypeListCreateView(generics.ListCreateAPIView):
+class ClothesTypeListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 1
     queryset = ClothesType.objects.all()
     serializer_class = ClothesTypeSerializer
 
 
 class ClothesTypeDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = ClothesType.objects.all()
     serializer_class = ClothesTypeSerializer
 
@@ -272,14 +796,129 @@ class ClothesTypeDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(ClothesType, pk=self.kwargs.get("pk"))
 
 
-class BrandListCreateView(generics.ListCreateAPIView):
+class BrandListCreateView(MultiGetMixin, generics.ListCreateAPIView):
+    query_budget = 1
+    write_query_budget = 1
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
 
 
 class BrandDetailView(generics.RetrieveUpdateDestroyAPIView):
+    query_budget = 1
+    write_query_budget = 2
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
 
     def get_object(self):
         return get_object_or_404(Brand, pk=self.kwargs.get("pk"))
+
+
+# Batch API View
+
+
+def _run_sub_request(request, path):
+    url = urlsplit(path)
+    try:
+        match = resolve(url.path)
+    except Resolver404:
+        return {"status": status.HTTP_404_NOT_FOUND, "body": {"detail": "Not found."}}
+    if match.url_name == "batch":
+        return {"status": status.HTTP_400_BAD_REQUEST, "body": {"detail": "Batches cannot nest."}}
+    # 同期のDRFビューだけを呼ぶ (非同期のイベント配信などはコルーチンが返って応答にならない)
+    view_class = getattr(match.func, "view_class", None)
+    if (
+        iscoroutinefunction(match.func)
+        or view_class is None
+        or not issubclass(view_class, APIView)
+        or getattr(view_class, "view_is_async", False)
+    ):
+        return {"status": status.HTTP_400_BAD_REQUEST, "body": {"detail": "Not batchable."}}
+    # 元のリクエストのヘッダー・ユーザーを引き継いだGETリクエストとしてビューを呼ぶ
+    sub_request = copy.copy(request._request)
+    sub_request.method = "GET"
+    sub_request.path = sub_request.path_info = url.path
+    sub_request.META = {
+        **request.META,
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": url.path,
+        "QUERY_STRING": url.query,
+    }
+    sub_request.GET = QueryDict(url.query)
+    sub_request.resolver_match = match
+    response = match.func(sub_request, *match.args, **match.kwargs)
+    if hasattr(response, "data"):
+        body = response.data
+    elif response.get("Content-Type", "").startswith("application/json"):
+        body = json.loads(response.content)
+    else:
+        body = None
+    return {"status": response.status_code, "body": body}
+
+
+class BatchView(generics.GenericAPIView):
+    """
+    Run up to 20 read-only sub-requests against the API's DRF views in one round trip.
+    POST {"requests": [{"method": "GET", "path": "/api/products/1/"}, ...]}
+    returns [{"status": 200, "body": {...}}, ...] in the same order.
+    """
+
+    # トランザクションの分だけ。サブリクエストはそれぞれのビューの予算で数える
+    query_budget = 2
+
+    serializer_class = BatchSerializer
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        paths = [sub["path"] for sub in serializer.validated_data["requests"]]
+        results = {}
+        # 全サブリクエストを1つのトランザクションで実行し、同じ時点のデータを返す
+        with transaction.atomic():
+            for path in paths:
+                if path not in results:
+                    results[path] = _run_sub_request(request, path)
+        return Response([results[path] for path in paths])
+
+
+# Events API View
+
+
+async def _event_messages(topics):
+    subscription = broadcaster.subscribe(topics)
+    feed.start()
+    try:
+        yield f"retry: {settings.EVENTS_RETRY_MS}\n\n".encode()
+        while True:
+            try:
+                event = await subscription.get(settings.EVENTS_KEEPALIVE)
+            except TimeoutError:
+                # プロキシに接続を切られないよう定期的にコメント行を送る
+                yield b": keepalive\n\n"
+                continue
+            if event is None:
+                # 取りこぼしが出たので、クライアントには再接続して最新の状態を取り直させる
+                yield b"event: overflow\ndata: {}\n\n"
+                return
+            yield format_event(event)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+@require_GET
+async def event_stream(request):
+    """
+    Server-Sent Events for product stock and order status changes. Requires an
+    ASGI server (e.g. uvicorn djangopj.asgi:application).
+    ?topics=products,products.<id>,orders,orders.<id>,users.<id>.orders
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "Event streams require an ASGI server."}, status=501)
+    topics = [topic for topic in request.GET.get("topics", "products,orders").split(",") if topic]
+    invalid = [topic for topic in topics if not TOPIC_PATTERN.match(topic)]
+    if not topics or invalid:
+        return JsonResponse({"topics": [f"Invalid topics: {', '.join(invalid)}"]}, status=400)
+    return StreamingHttpResponse(
+        _event_messages(topics),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )